@@ -22,7 +22,7 @@ ssh -o StrictHostKeyChecking=no -i $KEY_PATH "${REMOTE_USER}@${SERVER_IP}" "cd /
 
 # Step 4: Run migrations
 Write-Host "`n[4/5] Running Django migrations..." -ForegroundColor Yellow
-ssh -o StrictHostKeyChecking=no -i $KEY_PATH "${REMOTE_USER}@${SERVER_IP}" "cd /home/ubuntu/ecommerce-app && source venv/bin/activate && python manage.py migrate"
+ssh -o StrictHostKeyChecking=no -i $KEY_PATH "${REMOTE_USER}@${SERVER_IP}" "cd /home/ubuntu/ecommerce-app && source venv/bin/activate && python manage.py migrate && python manage.py createcachetable"
 
 # Step 5: Start Django server
 Write-Host "`n[5/5] Starting Django development server..." -ForegroundColor Yellow
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')
 
 application = get_asgi_application()
+
+from store import payments, typeahead  # noqa: E402  (needs the app registry set up above)
+
+payments.get_backend()  # A missing payment configuration fails here, not at the first checkout.
+typeahead.warm()
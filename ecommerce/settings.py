@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 import dj_database_url
 
@@ -47,12 +48,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.metrics.MetricsMiddleware',  # Removes itself unless METRICS_ENABLED
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise for static files
+    'store.middleware.StaticFilesMiddleware',  # WhiteNoise, usable in an async (ASGI) chain
+    'store.routers.ReplicaPinMiddleware',  # Keeps visitors who just wrote on the primary database
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.ratelimit.RateLimitMiddleware',  # Needs request.user for per-user limits
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -69,6 +73,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'store.context_processors.wishlist',
             ],
         },
     },
@@ -133,17 +138,126 @@ LOGIN_URL = '/login/'
 
 STRIPE_PUBLISHABLE_KEY = os.environ.get("STRIPE_PUBLISHABLE_KEY")
 STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY")
+STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
+
+# Checkout gateway backend: Stripe when a secret key is configured. The
+# in-process stub takes any webhook without a signature, so without a key it
+# is only picked under DEBUG; elsewhere the app refuses to start unless
+# PAYMENT_BACKEND=store.payments.StubBackend is set explicitly.
+PAYMENT_BACKEND = os.environ.get('PAYMENT_BACKEND') or (
+    'store.payments.StripeBackend' if STRIPE_SECRET_KEY
+    else 'store.payments.StubBackend' if DEBUG
+    else None
+)
+PAYMENT_STUB_LATENCY = float(os.environ.get('PAYMENT_STUB_LATENCY', 0))
+
+# How long stock stays reserved for a checkout that hasn't been paid for.
+# Checkout sessions expire with it; Stripe needs 30 minutes to 24 hours.
+STOCK_RESERVATION_SECONDS = int(os.environ.get('STOCK_RESERVATION_SECONDS', 30 * 60))
 
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@myecommerce.com'
 
+# Cache. Cached pages, fragments, wishlists and the typeahead index are
+# invalidated by bumping version keys in the cache (store.caching), which is
+# also how one worker learns that another changed something. Every process
+# serving the site must therefore share one cache: Redis when REDIS_URL is
+# set, a file cache when CACHE_DIR is a directory all of them see, otherwise
+# the database (run `manage.py createcachetable`). Per-process local memory
+# is only used for a single DEBUG process such as runserver.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+elif os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR'),
+        }
+    }
+elif DEBUG:
+    if int(os.environ.get('WEB_CONCURRENCY', 1)) > 1:
+        raise ImproperlyConfigured(
+            "WEB_CONCURRENCY > 1 needs a cache shared between workers: set REDIS_URL or CACHE_DIR, "
+            "or DEBUG=False to use the database cache."
+        )
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
+# Where cart lines live: 'store.cart.DatabaseCartStore' or, with a shared
+# cache such as Redis, 'store.cart.CacheCartStore'.
+CART_STORE = os.environ.get('CART_STORE', 'store.cart.DatabaseCartStore')
+
+# Seconds catalog pages and fragments stay cached; edits invalidate them sooner.
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))
+
+# Token-bucket limits on POSTs to the named routes (see store.ratelimit), per
+# client IP and per signed-in user. '10/m' allows a burst of 10 and then 10
+# a minute. The database and file caches can let a few concurrent requests
+# past a limit (see store.ratelimit); use Redis where limits must hold exactly.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True') == 'True'
+RATE_LIMITS = {
+    'login': {'ip': '10/m'},
+    'register': {'ip': '5/h'},
+    'create_checkout_session': {'ip': '30/m', 'user': '10/m'},
+}
+# Reverse proxies in front of the app; the client IP is then read from
+# X-Forwarded-For instead of REMOTE_ADDR, which would be the proxy's and put
+# every client in one bucket. Deployed, there is at least one (Render's load
+# balancer, or nginx); the terraform hosts sit behind two. Set it to the
+# exact number: too high lets clients forge their address.
+RATE_LIMIT_PROXY_COUNT = int(os.environ.get('RATE_LIMIT_PROXY_COUNT', 0 if DEBUG else 1))
+
+# How often each worker checks whether another one changed the catalog
+# since its typeahead index was built, and how old the index may get before
+# it is rebuilt to pick up new review counts (see store.typeahead).
+TYPEAHEAD_REFRESH_SECONDS = int(os.environ.get('TYPEAHEAD_REFRESH_SECONDS', 5))
+TYPEAHEAD_MAX_AGE_SECONDS = int(os.environ.get('TYPEAHEAD_MAX_AGE_SECONDS', 300))
+
+# Per-view latency and SQL metrics, served at /metrics/ for Prometheus.
+# When METRICS_TOKEN is set, scrapers must send "Authorization: Bearer <token>".
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'False') == 'True'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'store': {
+            'handlers': ['console'],
+            'level': os.environ.get('STORE_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 # Database configuration for Render
 if os.environ.get('DATABASE_URL'):
     DATABASES = {
         'default': dj_database_url.config(
             default=os.environ.get('DATABASE_URL'),
-            conn_max_age=600
+            # Set DB_CONN_MAX_AGE=0 if serving over ASGI: each async request
+            # runs its queries in a fresh thread, so persistent connections
+            # would pile up instead of being reused.
+            conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 600))
         )
     }
 else:
@@ -151,7 +265,33 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Concurrent writers (checkouts, workers) queue for the write lock
+            # at BEGIN instead of failing with "database is locked" when a
+            # transaction that started by reading tries to write.
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+            # A file rather than the default in-memory database, so tests
+            # with concurrent writers wait on the lock like production does;
+            # SQLite's shared in-memory cache fails them with "table is locked".
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 
+# Read replicas for the catalog pages (see store.routers), as a
+# comma-separated list of database URLs. For a local two-file setup use e.g.
+# DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3 and refresh it from the
+# primary with `manage.py sync_sqlite_replicas`.
+DATABASE_REPLICAS = []
+for index, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(','))):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dj_database_url.parse(url.strip(), conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 600)))
+    # Tests run against the primary's test database.
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['store.routers.PrimaryReplicaRouter']
+
+# Seconds a visitor reads from the primary after writing, longer than the
+# replicas usually lag behind it.
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
 
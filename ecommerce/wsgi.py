@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')
 
 application = get_wsgi_application()
+
+from store import payments, typeahead  # noqa: E402  (needs the app registry set up above)
+
+payments.get_backend()  # A missing payment configuration fails here, not at the first checkout.
+typeahead.warm()
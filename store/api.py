@@ -0,0 +1,137 @@
+"""
+Helpers for the read-only JSON catalog API (``/api/...`` views).
+
+Responses carry a strong ``ETag`` and ``Cache-Control: public`` so clients
+and intermediaries can revalidate instead of re-downloading. Validators are
+computed before the body, from data that is cheap to read:
+
+* a product and its reviews use ``Product.updated_at``, which saves and
+  rating updates stamp, so they also get ``Last-Modified``;
+* listings use the catalog cache version (``store.caching``), bumped on any
+  product or review change, so a matching ``If-None-Match`` costs no query.
+  Listings get no ``Last-Modified``: a product dropping off a page changes
+  the page without making anything on it newer.
+
+``?fields=id,name,price`` limits the output to those fields and the columns
+read to the ones they need.
+"""
+import hashlib
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class ApiError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+    def response(self):
+        return JsonResponse({'error': str(self)}, status=self.status)
+
+
+class Field:
+    def __init__(self, columns, get):
+        self.columns = columns
+        self.get = get
+
+
+def _attr(name):
+    return Field((name,), lambda obj: getattr(obj, name))
+
+
+PRODUCT_FIELDS = {
+    'id': _attr('id'),
+    'sku': _attr('sku'),
+    'name': _attr('name'),
+    'description': _attr('description'),
+    # Decimal as a string, so clients never see float rounding.
+    'price': Field(('price',), lambda product: str(product.price)),
+    'category': _attr('category'),
+    'image': Field(('image',), lambda product: product.image.url if product.image else None),
+    'rating': _attr('rating_avg'),
+    'review_count': _attr('review_count'),
+    'created_at': _attr('created_at'),
+    'updated_at': _attr('updated_at'),
+}
+
+REVIEW_FIELDS = {
+    'id': _attr('id'),
+    'user': Field(('user__username',), lambda review: review.user.username),
+    'rating': _attr('rating'),
+    'comment': _attr('comment'),
+    'created_at': _attr('created_at'),
+}
+
+
+def requested_fields(request, available):
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(available)
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown) or raw!r}. Available: {', '.join(available)}.")
+    return list(dict.fromkeys(names))
+
+
+def columns(fields, available):
+    return [column for name in fields for column in available[name].columns]
+
+
+def serialize(obj, fields, available):
+    return {name: available[name].get(obj) for name in fields}
+
+
+def page_size(request):
+    raw = request.GET.get('limit')
+    if raw is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        size = int(raw)
+    except ValueError:
+        size = 0
+    if not 1 <= size <= MAX_PAGE_SIZE:
+        raise ApiError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+    return size
+
+
+def page_links(request, page):
+    def link(cursor):
+        if cursor is None:
+            return None
+        params = request.GET.copy()
+        params['cursor'] = cursor
+        return f'{request.path}?{params.urlencode()}'
+    return {'next': link(page.next_cursor), 'previous': link(page.previous_cursor)}
+
+
+def make_etag(*parts):
+    return '"' + hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()[:32] + '"'
+
+
+def max_age():
+    return getattr(settings, 'API_CACHE_MAX_AGE', 60)
+
+
+def conditional_response(request, etag, build, last_modified=None):
+    """
+    Answer a GET with ``304 Not Modified`` when the client's validators
+    match, without calling ``build``; otherwise return ``build()`` as JSON.
+    Both carry the validators and ``Cache-Control``.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = JsonResponse(build())
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, public=True, max_age=max_age())
+    return response
@@ -0,0 +1,69 @@
+"""
+Latency summaries and run-to-run comparison for ``manage.py bench_routes``.
+
+A run is stored as JSON::
+
+    {"meta": {...}, "routes": {"product_list": {"p50_ms": ..., "p95_ms": ...,
+     "p99_ms": ..., "mean_ms": ..., "queries": ..., "status": 200, ...}}}
+
+``compare()`` flags a route as a regression when its p95 latency grows by
+more than the threshold (and by at least ``min_delta_ms``, so jitter on
+sub-millisecond routes is ignored), or when it runs more queries than
+before. Query counts are deterministic, unlike timings, so any increase is
+reported.
+"""
+import json
+import math
+import statistics
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, query_counts, statuses):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        'queries': max(query_counts, default=0),
+        'status': statistics.mode(statuses) if statuses else None,
+    }
+
+
+def load(path):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def save(run, path):
+    with open(path, 'w') as fh:
+        json.dump(run, fh, indent=2, sort_keys=True)
+
+
+def compare(baseline, current, threshold=0.2, min_delta_ms=1.0):
+    """
+    Return one row per route present in either run:
+    ``(route, old, new, p95_change, query_change, regressed)``. ``old`` or
+    ``new`` is ``None`` for routes only one run measured.
+    """
+    rows = []
+    old_routes, new_routes = baseline['routes'], current['routes']
+    for route in sorted(old_routes.keys() | new_routes.keys()):
+        old, new = old_routes.get(route), new_routes.get(route)
+        if old is None or new is None:
+            rows.append((route, old, new, None, None, False))
+            continue
+        p95_change = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0.0
+        query_change = new['queries'] - old['queries']
+        slower = p95_change > threshold and new['p95_ms'] - old['p95_ms'] >= min_delta_ms
+        regressed = slower or query_change > 0
+        rows.append((route, old, new, p95_change, query_change, regressed))
+    return rows
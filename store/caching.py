@@ -0,0 +1,158 @@
+"""
+Catalog caching helpers.
+
+Cache keys embed a version number instead of being deleted on change: the
+whole catalog has one version, and every product and every user's wishlist
+has its own. Saving or deleting a ``Product``, ``Review`` or ``Wishlist``
+bumps the relevant versions (see ``store.signals``), so every key built
+from the old version simply stops being read and ages out of the cache.
+
+``get_or_compute`` adds stampede protection: on a miss only the caller that
+wins a short-lived lock computes the value, while concurrent callers wait for
+it to appear instead of repeating the same expensive render. Values that are
+cached are computed from the primary database, never a lagging replica.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .routers import primary_reads
+
+CATALOG_VERSION_KEY = 'catalog:version'
+TYPEAHEAD_VERSION_KEY = 'typeahead:version'
+LOCK_TIMEOUT = 10  # seconds a computing caller may hold the lock
+WAIT_INTERVAL = 0.05
+
+_MISSING = object()
+
+
+def timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock rather than 1: if the version key is evicted,
+        # the new version must not collide with one that was used before.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def _product_version_key(product_id):
+    return f'product:{product_id}:version'
+
+
+def _wishlist_version_key(user_id):
+    return f'wishlist:{user_id}:version'
+
+
+def catalog_version():
+    return _version(CATALOG_VERSION_KEY)
+
+
+def product_version(product_id):
+    return _version(_product_version_key(product_id))
+
+
+def wishlist_version(user_id):
+    return _version(_wishlist_version_key(user_id))
+
+
+def invalidate_catalog():
+    _bump(CATALOG_VERSION_KEY)
+
+
+def invalidate_product(product_id):
+    invalidate_catalog()
+    _bump(_product_version_key(product_id))
+
+
+def invalidate_products(product_ids):
+    """``invalidate_product`` for many products, bumping the catalog once."""
+    invalidate_catalog()
+    for product_id in product_ids:
+        _bump(_product_version_key(product_id))
+
+
+def invalidate_wishlist(user_id):
+    _bump(_wishlist_version_key(user_id))
+
+
+def typeahead_version():
+    return _version(TYPEAHEAD_VERSION_KEY)
+
+
+def invalidate_typeahead():
+    _bump(TYPEAHEAD_VERSION_KEY)
+
+
+def make_key(*parts):
+    raw = ':'.join(str(part) for part in parts)
+    return 'store:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def get_or_compute(key, compute, cache_timeout=None, should_cache=None):
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        # Someone else is computing this value; wait for their result.
+        if time.monotonic() >= deadline:
+            return compute()
+        time.sleep(WAIT_INTERVAL)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+    try:
+        with primary_reads():
+            value = compute()
+        if should_cache is None or should_cache(value):
+            cache.set(key, value, timeout() if cache_timeout is None else cache_timeout)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+def cache_anonymous_page(version_func):
+    """
+    Cache whole ``200`` responses of a GET view for anonymous users, keyed
+    by path, query string and ``version_func()``. Only use it on pages that
+    carry no per-visitor state such as CSRF tokens or messages.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method != 'GET' or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            def render():
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.cookies:
+                    return response
+                return (response.content, response['Content-Type'])
+
+            key = make_key('page', view.__name__, version_func(), request.get_full_path())
+            result = get_or_compute(key, render, should_cache=lambda value: isinstance(value, tuple))
+            if isinstance(result, tuple):
+                content, content_type = result
+                return HttpResponse(content, content_type=content_type)
+            return result
+        return wrapped
+    return decorator
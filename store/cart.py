@@ -0,0 +1,226 @@
+"""
+Shopping carts.
+
+Cart lines live in a dedicated cart store instead of the session, so adding
+an item no longer rewrites the whole ``django_session`` row and two
+concurrent adds can't overwrite each other. Every store mutates one line at
+a time atomically:
+
+* ``DatabaseCartStore`` keeps one ``CartItem`` row per line and increments
+  it with ``UPDATE ... SET quantity = quantity + n``.
+* ``CacheCartStore`` keeps one cache key per line, changed with the cache's
+  atomic ``incr``, plus a per-user index of product ids guarded by a short
+  ``cache.add`` lock. Use it with a shared cache such as Redis.
+
+``settings.CART_STORE`` selects the store. ``Cart`` resolves a user's lines
+against the database with a single ``in_bulk`` query; the async checkout
+view builds it with ``await Cart.aload(request)``.
+"""
+import time
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from .models import CartItem, Product
+
+
+class AsyncCartStoreMixin:
+    """
+    Async twins of the store methods ``Cart.aload`` needs. Each runs its
+    sync method in one ``sync_to_async`` hop: the async ORM would hop once
+    per query anyway, and ``transaction.atomic()`` has no async form.
+    """
+
+    async def alines(self, user):
+        return await sync_to_async(self.lines)(user)
+
+    async def adelete(self, user, product_id):
+        await sync_to_async(self.delete)(user, product_id)
+
+
+class DatabaseCartStore(AsyncCartStoreMixin):
+    def lines(self, user):
+        return dict(CartItem.objects.filter(user=user).order_by('id').values_list('product_id', 'quantity'))
+
+    def incr(self, user, product_id, amount=1):
+        items = CartItem.objects.filter(user=user, product_id=product_id)
+        if items.update(quantity=F('quantity') + amount):
+            return
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(user=user, product_id=product_id, quantity=amount)
+        except IntegrityError:
+            # A concurrent request created the line first; add to it instead.
+            items.update(quantity=F('quantity') + amount)
+
+    def set(self, user, product_id, quantity):
+        if not CartItem.objects.filter(user=user, product_id=product_id).update(quantity=quantity):
+            try:
+                with transaction.atomic():
+                    CartItem.objects.create(user=user, product_id=product_id, quantity=quantity)
+            except IntegrityError:
+                CartItem.objects.filter(user=user, product_id=product_id).update(quantity=quantity)
+
+    def delete(self, user, product_id):
+        CartItem.objects.filter(user=user, product_id=product_id).delete()
+
+    def clear(self, user):
+        CartItem.objects.filter(user=user).delete()
+
+
+class CacheCartStore(AsyncCartStoreMixin):
+    LOCK_TIMEOUT = 5
+    TTL = 60 * 60 * 24 * 30
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def _line_key(self, user, product_id):
+        return f'cart:{user.pk}:line:{product_id}'
+
+    def _index_key(self, user):
+        return f'cart:{user.pk}:index'
+
+    def _update_index(self, user, change):
+        lock_key = f'{self._index_key(user)}:lock'
+        deadline = time.monotonic() + self.LOCK_TIMEOUT
+        while not self.cache.add(lock_key, 1, self.LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(0.001)
+        try:
+            index = set(self.cache.get(self._index_key(user), ()))
+            change(index)
+            self.cache.set(self._index_key(user), sorted(index), self.TTL)
+        finally:
+            self.cache.delete(lock_key)
+
+    def lines(self, user):
+        index = self.cache.get(self._index_key(user), ())
+        if not index:
+            return {}
+        keys = {self._line_key(user, product_id): product_id for product_id in index}
+        values = self.cache.get_many(keys)
+        return {keys[key]: quantity for key, quantity in values.items() if quantity > 0}
+
+    def incr(self, user, product_id, amount=1):
+        key = self._line_key(user, product_id)
+        if self.cache.add(key, 0, self.TTL):
+            self._update_index(user, lambda index: index.add(product_id))
+        try:
+            self.cache.incr(key, amount)
+        except ValueError:
+            # The line expired between add() and incr(); start it again.
+            self.cache.add(key, amount, self.TTL)
+            self._update_index(user, lambda index: index.add(product_id))
+
+    def set(self, user, product_id, quantity):
+        self.cache.set(self._line_key(user, product_id), quantity, self.TTL)
+        self._update_index(user, lambda index: index.add(product_id))
+
+    def delete(self, user, product_id):
+        self.cache.delete(self._line_key(user, product_id))
+        self._update_index(user, lambda index: index.discard(product_id))
+
+    def clear(self, user):
+        index = self.cache.get(self._index_key(user), ())
+        self.cache.delete_many([self._line_key(user, product_id) for product_id in index])
+        self.cache.delete(self._index_key(user))
+
+
+_store = None
+
+
+def get_cart_store():
+    global _store
+    if _store is None:
+        _store = import_string(getattr(settings, 'CART_STORE', 'store.cart.DatabaseCartStore'))()
+    return _store
+
+
+def reset_cart_store():
+    global _store
+    _store = None
+
+
+class CartLine:
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+        self.subtotal = product.price * quantity
+
+
+class Cart:
+    """
+    A user's cart resolved against the database.
+
+    All products in the cart are loaded with a single ``in_bulk`` query, so
+    the cost of building a cart does not grow with the number of lines.
+    Lines pointing at products that no longer exist are dropped from the
+    store instead of raising a 404.
+    """
+
+    # Carts used to live in the session under this key; they are moved into
+    # the cart store the first time they are seen.
+    LEGACY_SESSION_KEY = 'cart'
+
+    def __init__(self, request):
+        self._start(request.user)
+        self._absorb_session_cart(request.session.pop(self.LEGACY_SESSION_KEY, None))
+        raw = self.store.lines(self.user)
+        products = Product.objects.in_bulk(list(raw)) if raw else {}
+        for product_id in self._resolve(raw, products):
+            self.store.delete(self.user, product_id)
+
+    @classmethod
+    async def aload(cls, request):
+        """``Cart(request)`` for the async checkout view."""
+        cart = cls.__new__(cls)
+        cart._start(await request.auser())
+        legacy = await request.session.apop(cls.LEGACY_SESSION_KEY, None)
+        if legacy:
+            await sync_to_async(cart._absorb_session_cart)(legacy)
+        raw = await cart.store.alines(cart.user)
+        products = await Product.objects.ain_bulk(list(raw)) if raw else {}
+        for product_id in cart._resolve(raw, products):
+            await cart.store.adelete(cart.user, product_id)
+        return cart
+
+    def _start(self, user):
+        self.user = user
+        self.store = get_cart_store()
+        self.lines = []
+        self.total = Decimal('0')
+
+    def _absorb_session_cart(self, legacy):
+        for product_id, quantity in (legacy or {}).items():
+            self.store.incr(self.user, int(product_id), quantity)
+
+    def _resolve(self, raw, products):
+        """Build the lines; returns the ids of products that no longer exist."""
+        missing = []
+        for product_id, quantity in raw.items():
+            product = products.get(product_id)
+            if product is None:
+                missing.append(product_id)
+                continue
+            line = CartLine(product, quantity)
+            self.lines.append(line)
+            self.total += line.subtotal
+        return missing
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def clear(self):
+        self.store.clear(self.user)
+        self.lines = []
+        self.total = Decimal('0')
@@ -0,0 +1,324 @@
+"""
+Bulk catalog import and export.
+
+``import_catalog()`` reads CSV or JSON Lines row by row, so a file of any
+size is processed in constant memory. Rows are validated and committed in
+chunks, one transaction per chunk. Rows with a ``sku`` are upserted on it
+with ``bulk_create(update_conflicts=True)``; rows without one are always
+created. Remote ``image_url``s in a chunk are downloaded concurrently by a
+thread pool before the chunk is written. Bad rows are reported with their
+line number and skipped; they never abort the import.
+
+``export_catalog()`` yields the catalog as CSV or JSON Lines text for a
+``StreamingHttpResponse`` or a file. It reads through ``iterator()``, which
+uses a server-side cursor on PostgreSQL, so memory use does not grow with
+the catalog.
+
+Bulk writes skip model signals, so the import bumps the cache versions and
+queues image derivatives itself.
+"""
+import csv
+import io
+import ipaddress
+import json
+import os
+import posixpath
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urljoin, urlparse
+
+import requests
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.text import get_valid_filename
+from PIL import Image
+
+from . import caching
+from .images import needs_derivatives
+from .models import Product
+from .tasks import enqueue_image_derivatives_for
+
+FORMATS = ('csv', 'jsonl')
+EXPORT_FIELDS = ('sku', 'name', 'description', 'price', 'category', 'image')
+UPDATE_FIELDS = ['name', 'description', 'price', 'category']
+CATEGORIES = {value for value, _ in Product.CATEGORY_CHOICES}
+# Column limits: a value past one would fail the INSERT for its whole chunk.
+SKU_LENGTH = Product._meta.get_field('sku').max_length
+IMAGE_LENGTH = Product._meta.get_field('image').max_length
+_price_field = Product._meta.get_field('price')
+PRICE_PLACES = _price_field.decimal_places
+PRICE_LIMIT = Decimal(10) ** (_price_field.max_digits - PRICE_PLACES)  # prices must stay below this
+CHUNK_SIZE = 1000
+IMAGE_WORKERS = 8
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_IMAGE_REDIRECTS = 3
+MAX_REPORTED_ERRORS = 100
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []  # (line, message), the first MAX_REPORTED_ERRORS only
+
+    def fail(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @classmethod
+    def from_dict(cls, data):
+        result = cls()
+        for field in ('rows', 'created', 'updated', 'failed'):
+            setattr(result, field, data.get(field, 0))
+        result.errors = [tuple(error) for error in data.get('errors', [])]
+        return result
+
+    def as_dict(self):
+        return {
+            'rows': self.rows, 'created': self.created, 'updated': self.updated,
+            'failed': self.failed, 'errors': self.errors,
+        }
+
+
+def format_for(filename, default='csv'):
+    extension = os.path.splitext(filename)[1].lstrip('.').lower()
+    return {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}.get(extension, default)
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line_number, row_dict)`` from a text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, exc
+            continue
+        yield line_number, row if isinstance(row, dict) else ValueError("Expected a JSON object.")
+
+
+def _clean(row):
+    if isinstance(row, Exception):
+        raise RowError(f"Unreadable row: {row}")
+    name = (row.get('name') or '').strip()
+    if not name:
+        raise RowError("name is required.")
+    try:
+        price = Decimal(str(row.get('price', '')).strip())
+    except InvalidOperation:
+        raise RowError(f"Invalid price {row.get('price')!r}.")
+    if not price.is_finite() or price < 0 or price.as_tuple().exponent < -PRICE_PLACES:
+        raise RowError(f"Invalid price {row.get('price')!r}.")
+    if price >= PRICE_LIMIT:
+        raise RowError(f"Price {row.get('price')!r} must be below {PRICE_LIMIT}.")
+    category = (row.get('category') or 'electronics').strip()
+    if category not in CATEGORIES:
+        raise RowError(f"Unknown category {category!r}.")
+    sku = (row.get('sku') or '').strip() or None
+    if sku and len(sku) > SKU_LENGTH:
+        raise RowError(f"sku is longer than {SKU_LENGTH} characters.")
+    image = (row.get('image') or '').strip()
+    if len(image) > IMAGE_LENGTH:
+        raise RowError(f"image is longer than {IMAGE_LENGTH} characters.")
+    return {
+        'sku': sku,
+        'name': name[:255],
+        'description': row.get('description') or '',
+        'price': price,
+        'category': category,
+        'image': image,
+        'image_url': (row.get('image_url') or '').strip(),
+    }
+
+
+def _check_public(url):
+    """
+    Refuse URLs that would make the server fetch from itself or its private
+    network: anything but http(s), and hosts resolving to loopback, private,
+    link-local (cloud metadata) or otherwise non-global addresses.
+    """
+    parts = urlparse(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise RowError(f"Unsupported image URL {url!r}.")
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, ValueError):
+        raise RowError(f"Cannot resolve the host of {url!r}.")
+    for *_, sockaddr in infos:
+        address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if not address.is_global or address.is_multicast:
+            raise RowError(f"Image URL {url!r} points at a non-public address.")
+
+
+def _download(session, url):
+    """Fetch one product image into storage and return its name."""
+    # Redirects are followed by hand so every hop is checked.
+    location = url
+    for _ in range(MAX_IMAGE_REDIRECTS + 1):
+        _check_public(location)
+        response = session.get(location, timeout=(5, 30), stream=True, allow_redirects=False)
+        if not response.is_redirect:
+            break
+        response.close()
+        location = urljoin(location, response.headers['location'])
+    else:
+        raise RowError(f"Too many redirects for {url!r}.")
+    with response:
+        response.raise_for_status()
+        data = io.BytesIO()
+        for block in response.iter_content(64 * 1024):
+            data.write(block)
+            if data.tell() > MAX_IMAGE_BYTES:
+                raise RowError(f"Image at {url!r} is larger than {MAX_IMAGE_BYTES} bytes.")
+    try:
+        Image.open(io.BytesIO(data.getvalue())).verify()
+    except Exception:
+        raise RowError(f"{url!r} is not an image.")
+    filename = get_valid_filename(posixpath.basename(urlparse(url).path)) or 'image'
+    return default_storage.save(f'product_images/{filename}', ContentFile(data.getvalue()))
+
+
+def _fetch_images(pending, session, workers):
+    """
+    Download the ``image_url`` of every row in ``pending`` that has no
+    ``image`` yet, concurrently, filling in ``image``. Returns
+    ``{line: error}`` for the downloads that failed.
+    """
+    remote = [(line, data) for line, data in pending if data['image_url'] and not data['image']]
+    if not remote:
+        return {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {line: executor.submit(_download, session, data['image_url']) for line, data in remote}
+    for line, data in remote:
+        try:
+            data['image'] = futures[line].result()
+        except Exception as exc:
+            errors[line] = str(exc) if isinstance(exc, RowError) else f"Image download failed: {exc}"
+    return errors
+
+
+def _write_chunk(pending, result):
+    # Within a chunk the last row for a SKU wins, as it would row by row.
+    rows, latest = [], {}
+    for line, data in pending:
+        if not data['sku']:
+            rows.append((line, data))
+            continue
+        latest[data['sku']] = (line, data)
+    rows += latest.values()
+    existing = set(Product.objects.filter(sku__in=list(latest)).values_list('sku', flat=True)) if latest else set()
+
+    created, with_image, without_image = [], [], []
+    for line, data in rows:
+        if not data['image'] and data['sku'] not in existing:
+            result.fail(line, "image or image_url is required for new products.")
+            continue
+        product = Product(image=data['image'], **{field: data[field] for field in ['sku'] + UPDATE_FIELDS})
+        if not data['sku']:
+            created.append(product)
+        elif data['image']:
+            with_image.append(product)
+        else:
+            without_image.append(product)
+
+    with transaction.atomic():
+        Product.objects.bulk_create(created)
+        for products, fields in ((with_image, UPDATE_FIELDS + ['image']), (without_image, UPDATE_FIELDS)):
+            if products:
+                # auto_now fills updated_at on insert; a conflict only sets what is listed.
+                Product.objects.bulk_create(
+                    products, update_conflicts=True, unique_fields=['sku'], update_fields=fields + ['updated_at'],
+                )
+        upserted = with_image + without_image
+        ids = [product.pk for product in created]
+        if upserted:
+            ids += Product.objects.filter(sku__in=[p.sku for p in upserted]).values_list('pk', flat=True)
+        enqueue_image_derivatives_for(
+            product for product in Product.objects.filter(pk__in=ids).only('image', 'image_derivatives')
+            if needs_derivatives(product)
+        )
+
+    updated = sum(product.sku in existing for product in upserted)
+    result.created += len(created) + len(upserted) - updated
+    result.updated += updated
+    caching.invalidate_products(ids)
+    caching.invalidate_typeahead()
+
+
+def import_catalog(stream, fmt='csv', chunk_size=CHUNK_SIZE, image_workers=IMAGE_WORKERS,
+                   progress=None, resume=None):
+    """
+    Import products from a text ``stream`` and return an ``ImportResult``.
+    ``progress(result)`` is called after every committed chunk. Passing the
+    last reported result as ``resume`` continues an interrupted import after
+    the rows it had already committed.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {FORMATS}.")
+    result = resume or ImportResult()
+    skip_rows = result.rows
+    session = requests.Session()
+    session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=image_workers))
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=image_workers))
+
+    def flush(pending):
+        failed = _fetch_images(pending, session, image_workers)
+        for line, message in failed.items():
+            result.fail(line, message)
+        _write_chunk([(line, data) for line, data in pending if line not in failed], result)
+        if progress:
+            progress(result)
+
+    pending = []
+    for index, (line, row) in enumerate(read_rows(stream, fmt)):
+        if index < skip_rows:
+            continue
+        result.rows += 1
+        try:
+            pending.append((line, _clean(row)))
+        except RowError as exc:
+            result.fail(line, str(exc))
+        if result.rows % chunk_size == 0:
+            flush(pending)
+            pending = []
+    if pending:
+        flush(pending)
+    return result
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def export_catalog(fmt='csv', chunk_size=2000):
+    """Yield the whole catalog as CSV or JSON Lines text, a row at a time."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {FORMATS}.")
+    rows = Product.objects.order_by('id').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow(['' if value is None else value for value in row])
+        return
+    for row in rows:
+        record = dict(zip(EXPORT_FIELDS, row))
+        record['price'] = str(record['price'])
+        yield json.dumps(record) + '\n'
@@ -0,0 +1,8 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import wishlists
+
+
+def wishlist(request):
+    # Lazy: pages that never test membership never load the set.
+    return {'wishlist_ids': SimpleLazyObject(lambda: wishlists.product_ids(request))}
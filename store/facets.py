@@ -0,0 +1,92 @@
+"""
+Faceted navigation for the catalog: how many products each category and
+each price band would show for the current search and filters.
+
+All counts come from one grouped query over the search results:
+
+    SELECT category, COUNT(*), COUNT(*) FILTER (WHERE price < 100), ...
+    GROUP BY category
+
+Each row holds one category's total and its count per price band, which is
+enough to answer both facets the way shoppers expect, each ignoring its own
+selection: category counts within the selected price band, band counts
+within the selected category. Without a search the query is answered from
+the ``(category, price)`` index alone.
+
+The rows depend only on the search, so they're cached per search term and
+catalog version; every category and price combination is then derived from
+the cached rows without touching the database.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Q
+
+from .caching import catalog_version, get_or_compute, make_key
+from .models import Product
+from .search import search_products
+
+# (slug, label, low, high): low inclusive, high exclusive, None for open ends.
+PRICE_BANDS = [
+    ('under-100', 'Under ₹100', None, Decimal('100')),
+    ('100-250', '₹100 – ₹250', Decimal('100'), Decimal('250')),
+    ('250-500', '₹250 – ₹500', Decimal('250'), Decimal('500')),
+    ('500-1000', '₹500 – ₹1000', Decimal('500'), Decimal('1000')),
+    ('1000-up', '₹1000 & above', Decimal('1000'), None),
+]
+_BANDS = {slug: (low, high) for slug, _, low, high in PRICE_BANDS}
+
+
+def price_range(slug):
+    """``(low, high)`` bounds of a price band, or ``None`` for an unknown slug."""
+    return _BANDS.get(slug)
+
+
+def _band_q(low, high):
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def filter_price(products, slug):
+    bounds = price_range(slug)
+    if bounds is None:
+        return products
+    return products.filter(_band_q(*bounds))
+
+
+def _rows(query):
+    products = search_products(Product.objects.all(), query)
+    rows = products.order_by().values('category').annotate(
+        total=Count('id'),
+        **{slug: Count('id', filter=_band_q(low, high)) for slug, _, low, high in PRICE_BANDS},
+    )
+    return {row.pop('category'): row for row in rows}
+
+
+def rows(query):
+    """Per-category totals and price band counts for a search, cached."""
+    query = (query or '').strip()
+    return get_or_compute(make_key('facets', catalog_version(), query), lambda: _rows(query))
+
+
+def facets(query, category, price):
+    """
+    Facet counts for the catalog filtered by ``query``, ``category`` and the
+    ``price`` band slug. Returns ``{'categories': [...], 'prices': [...]}``,
+    lists of ``(value, label, count, selected)`` in display order.
+    """
+    by_category = rows(query)
+    price = price if price in _BANDS else None
+    categories = [
+        (value, label, by_category.get(value, {}).get(price or 'total', 0), value == category)
+        for value, label in Product.CATEGORY_CHOICES
+    ]
+    in_category = [by_category.get(category, {})] if category else by_category.values()
+    prices = [
+        (slug, label, sum(row.get(slug, 0) for row in in_category), slug == price)
+        for slug, label, _, _ in PRICE_BANDS
+    ]
+    return {'categories': categories, 'prices': prices}
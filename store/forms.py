@@ -7,7 +7,7 @@ from django.contrib.auth.models import User
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
-        fields = ['name', 'description', 'price', 'image', 'category']
+        fields = ['name', 'description', 'price', 'image', 'category', 'stock']
 
 class ReviewForm(forms.ModelForm):
     class Meta:
@@ -24,3 +24,41 @@ class OrderStatusForm(forms.ModelForm):
         model = Order
         fields = ['status']
 
+
+
+class OrderFilterForm(forms.Form):
+    status = forms.ChoiceField(choices=[('', 'All statuses')] + Order.STATUS_CHOICES, required=False)
+    user = forms.CharField(required=False)
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+
+class BulkOrderStatusForm(forms.Form):
+    status = forms.ChoiceField(choices=Order.STATUS_CHOICES)
+
+    def __init__(self, data=None, *args, **kwargs):
+        super().__init__(data, *args, **kwargs)
+        ids = data.getlist('order_ids') if data is not None else []
+        self.order_ids = sorted({int(order_id) for order_id in ids if order_id.isdigit()})
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.order_ids:
+            raise forms.ValidationError("Select at least one order.")
+        return cleaned_data
+
+
+class SalesDashboardForm(forms.Form):
+    days = forms.TypedChoiceField(
+        choices=[(7, 'Last 7 days'), (30, 'Last 30 days'), (90, 'Last 90 days'), (365, 'Last 365 days')],
+        coerce=int, required=False, empty_value=30,
+    )
+    category = forms.ChoiceField(choices=[('', 'All categories')] + Product.CATEGORY_CHOICES, required=False)
+
+
+class CatalogImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV or JSON Lines; rows are upserted on sku.")
+    format = forms.ChoiceField(
+        choices=[('', 'From file extension'), ('csv', 'CSV'), ('jsonl', 'JSON Lines')],
+        required=False,
+    )
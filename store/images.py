@@ -0,0 +1,96 @@
+"""
+Resized WebP + JPEG/PNG derivatives of ``Product.image``.
+
+Each rendition is produced at 1x and 2x width in WebP and in a fallback
+format (JPEG, or PNG when the source has transparency). Generation never
+runs on the request path: saving a product with a new image enqueues a
+``generate_image_derivatives`` job (see ``store.tasks``), and
+``manage.py backfill_image_derivatives`` processes existing images across
+all cores. The resulting URLs are stored on ``Product.image_derivatives``
+and rendered by the ``{% product_picture %}`` tag as ``<picture>`` with
+``srcset``.
+
+Derivatives live under a directory named after a digest of the source
+bytes and the encoder settings, so products whose images share a basename
+never overwrite each other's files, and regenerating an unchanged image
+reuses the files already written.
+"""
+import hashlib
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+# Display widths in CSS pixels; each is also rendered at 2x.
+RENDITIONS = {
+    'card': 240,
+    'grid': 400,
+    'detail': 800,
+}
+DENSITIES = (1, 2)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+DERIVATIVES_DIR = 'product_images/derived'
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif fmt == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def generate_derivatives(name, storage=default_storage):
+    """
+    Render every rendition of the stored image ``name``.
+
+    Returns the value for ``Product.image_derivatives``::
+
+        {'source': name, 'fallback': 'jpeg',
+         'card': {'webp': {'240': url, '480': url}, 'jpeg': {...}}, ...}
+
+    Widths never exceed the source's, so small originals are not upscaled.
+    Pure file work with no database access, so it is safe to run in a
+    worker process.
+    """
+    with storage.open(name, 'rb') as fh:
+        data = fh.read()
+    source = Image.open(io.BytesIO(data))
+    source.load()
+    digest = hashlib.sha256(data)
+    digest.update(f'{WEBP_QUALITY}:{JPEG_QUALITY}'.encode())
+    directory = f'{DERIVATIVES_DIR}/{digest.hexdigest()[:16]}'
+    fallback = 'png' if _has_alpha(source) else 'jpeg'
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert('RGBA' if fallback == 'png' else 'RGB')
+
+    stem = os.path.splitext(os.path.basename(name))[0]
+    result = {'source': name, 'fallback': fallback}
+    rendered = {}
+    for rendition, base_width in RENDITIONS.items():
+        result[rendition] = {'webp': {}, fallback: {}}
+        for density in DENSITIES:
+            width = min(base_width * density, source.width)
+            if width not in rendered:
+                height = max(1, round(source.height * width / source.width))
+                rendered[width] = source.resize((width, height), Image.LANCZOS)
+            for fmt in ('webp', fallback):
+                path = f'{directory}/{stem}-{width}w.{"jpg" if fmt == "jpeg" else fmt}'
+                if not storage.exists(path):
+                    path = storage.save(path, ContentFile(_encode(rendered[width], fmt)))
+                result[rendition][fmt][str(width)] = storage.url(path)
+    return result
+
+
+def needs_derivatives(product):
+    return bool(product.image) and product.image_derivatives.get('source') != product.image.name
@@ -0,0 +1,120 @@
+"""
+Stock levels and checkout reservations.
+
+``Product.stock`` counts the units still available to reserve; ``None``
+means the product's stock isn't tracked. Starting a checkout reserves the
+cart's units: each line is one conditional ``UPDATE ... SET stock = stock - n
+WHERE stock >= n``, so the database decides who gets the last unit and two
+buyers can never both take it, however many check out at once. There is no
+read-modify-write to race on. A line that can't be reserved rolls back the
+whole reservation and raises ``OutOfStock``.
+
+Every cart line becomes a ``StockReservation`` row under a hold id, with
+the price the buyer is charged, and the rows are later tagged with the
+payment provider's checkout session id. Lines of products whose stock isn't
+tracked are recorded too, without taking units, so the rows are the whole
+checkout: the order is built from them, not from a cart that may have
+changed since. When payment succeeds ``commit`` claims the rows, leaving
+the units sold. Otherwise ``release`` puts the units back: it runs from a
+job queued to fire when the hold expires, and the checkout session is
+created to expire before that, so a buyer can't pay for units that were
+already released. Commit and release both claim rows by deleting them, so
+each row is settled exactly once.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Product, StockReservation
+from .tasks import enqueue_stock_release
+
+# Extra time before an expired hold is released, covering clock skew with
+# the payment provider and a success page that's still loading.
+RELEASE_GRACE = timedelta(minutes=5)
+
+
+class OutOfStock(Exception):
+    def __init__(self, product, available):
+        self.product = product
+        self.available = available
+        if available:
+            message = f"Only {available} of {product.name} left in stock."
+        else:
+            message = f"{product.name} is out of stock."
+        super().__init__(message)
+
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_SECONDS', 30 * 60))
+
+
+def reserve(lines, ttl=None):
+    """
+    Reserve ``lines`` (cart lines with ``product`` and ``quantity``).
+    Returns ``(hold, expires_at)``, or raises ``OutOfStock`` having
+    reserved nothing. Products whose stock isn't tracked take no units.
+    """
+    ttl = ttl or reservation_ttl()
+    hold, expires_at = uuid.uuid4(), timezone.now() + ttl
+    reservations = []
+    with transaction.atomic():
+        # Lock rows in one order across checkouts so they can't deadlock.
+        for line in sorted(lines, key=lambda line: line.product.pk):
+            tracked = line.product.stock is not None
+            if tracked and not Product.objects.filter(pk=line.product.pk, stock__gte=line.quantity).update(
+                stock=F('stock') - line.quantity,
+            ):
+                available = Product.objects.filter(pk=line.product.pk).values_list('stock', flat=True).first()
+                if available is not None:
+                    raise OutOfStock(line.product, available)
+                tracked = False
+            reservations.append(StockReservation(
+                hold=hold, product=line.product, quantity=line.quantity, unit_price=line.product.price,
+                tracked=tracked, expires_at=expires_at,
+            ))
+        StockReservation.objects.bulk_create(reservations)
+        enqueue_stock_release(hold, delay=ttl + RELEASE_GRACE)
+    return hold, expires_at
+
+
+def attach(hold, checkout_token):
+    """Tag a hold with the checkout session it was made for."""
+    StockReservation.objects.filter(hold=hold).update(checkout_token=checkout_token)
+
+
+def commit(checkout_token):
+    """
+    The checkout was paid for: its held units are sold. Returns the claimed
+    reservations, with their products; an empty list if they were released
+    or committed first.
+    """
+    with transaction.atomic():
+        reservations = list(
+            StockReservation.objects.select_for_update(of=('self',)).select_related('product')
+            .filter(checkout_token=checkout_token).order_by('product_id')
+        )
+        # Deleting claims the rows; any a release got to first are already gone.
+        StockReservation.objects.filter(pk__in=[reservation.pk for reservation in reservations]).delete()
+    return reservations
+
+
+def release(hold):
+    """Return a hold's units to stock unless they were committed first. Returns the units released."""
+    released = 0
+    with transaction.atomic():
+        for reservation in StockReservation.objects.filter(hold=hold).order_by('product_id'):
+            if _claim(reservation) and reservation.tracked:
+                Product.objects.filter(pk=reservation.product_id).update(stock=F('stock') + reservation.quantity)
+                released += reservation.quantity
+    return released
+
+
+def _claim(reservation):
+    # Whoever deletes the row settles it.
+    deleted, _ = StockReservation.objects.filter(pk=reservation.pk).delete()
+    return bool(deleted)
+
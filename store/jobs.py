@@ -0,0 +1,158 @@
+"""
+A small database-backed job queue.
+
+Views call ``enqueue()`` and return immediately; ``manage.py runworker``
+processes claim due jobs and run them. Any number of workers can run side by
+side: a job is claimed with a conditional ``UPDATE`` that only succeeds for
+the worker whose token it writes, so no job runs twice. Failed jobs are
+retried with exponential backoff until ``max_attempts`` is reached, and jobs
+left ``running`` by a crashed worker are reclaimed once their lease expires.
+A live worker renews the lease on its batch every ``HEARTBEAT`` while it
+runs, so a batch that takes longer than ``LEASE`` isn't reclaimed and run a
+second time.
+
+Handlers are registered per job kind with ``@handler('kind')`` and receive
+all claimed jobs of that kind as one batch, so they can share expensive
+resources such as an SMTP connection. They return one error (or ``None``)
+per job.
+"""
+import logging
+import random
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+LEASE = timedelta(minutes=5)
+HEARTBEAT = LEASE / 3
+BACKOFF_BASE = 30  # seconds
+BACKOFF_MAX = 60 * 60
+
+_handlers = {}
+
+
+def handler(kind):
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload, delay=None, max_attempts=5):
+    """Queue a job. Inside a transaction it becomes visible on commit."""
+    run_after = timezone.now() + (delay or timedelta(0))
+    return Job.objects.create(kind=kind, payload=payload, run_after=run_after, max_attempts=max_attempts)
+
+
+def enqueue_many(kind, payloads, delay=None, max_attempts=5):
+    """``enqueue()`` for many payloads of one kind, in a single INSERT batch."""
+    run_after = timezone.now() + (delay or timedelta(0))
+    return Job.objects.bulk_create(
+        [Job(kind=kind, payload=payload, run_after=run_after, max_attempts=max_attempts) for payload in payloads],
+        batch_size=1000,
+    )
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim(worker_id, limit):
+    """Atomically take up to ``limit`` due jobs for ``worker_id``."""
+    now = timezone.now()
+    claimable = Q(status='queued', run_after__lte=now) | Q(status='running', locked_at__lt=now - LEASE)
+    candidates = list(
+        Job.objects.filter(claimable).order_by('run_after').values_list('id', flat=True)[:limit]
+    )
+    if not candidates:
+        return []
+    token = f'{worker_id}:{now.timestamp()}'
+    # Re-check the claimable condition in the UPDATE itself; a job another
+    # worker grabbed in the meantime no longer matches and is skipped.
+    Job.objects.filter(claimable, id__in=candidates).update(status='running', locked_by=token, locked_at=now)
+    return list(Job.objects.filter(locked_by=token, status='running').order_by('run_after'))
+
+
+def _finish(job, error):
+    job.attempts += 1
+    if error is None:
+        job.status = 'done'
+        job.last_error = ''
+    elif job.attempts < job.max_attempts:
+        job.status = 'queued'
+        job.run_after = timezone.now() + backoff(job.attempts)
+        job.last_error = repr(error)
+    else:
+        job.status = 'failed'
+        job.last_error = repr(error)
+    job.locked_by = ''
+    job.locked_at = None
+    job.save(update_fields=['attempts', 'status', 'run_after', 'last_error', 'locked_by', 'locked_at'])
+
+
+@contextmanager
+def keep_lease(jobs):
+    """Renew the lease on claimed ``jobs`` from a background thread until the block exits."""
+    ids = [job.id for job in jobs]
+    token = jobs[0].locked_by
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(HEARTBEAT.total_seconds()):
+                try:
+                    Job.objects.filter(id__in=ids, locked_by=token, status='running').update(
+                        locked_at=timezone.now(),
+                    )
+                except DatabaseError:
+                    logger.warning("Couldn't renew the lease on jobs %s", ids, exc_info=True)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name='job-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_batch(jobs):
+    """Run claimed jobs grouped by kind. Returns the number that succeeded."""
+    by_kind = {}
+    for job in jobs:
+        by_kind.setdefault(job.kind, []).append(job)
+
+    succeeded = 0
+    for kind, batch in by_kind.items():
+        func = _handlers.get(kind)
+        if func is None:
+            errors = [LookupError(f'No handler registered for job kind {kind!r}')] * len(batch)
+        else:
+            try:
+                errors = func(batch)
+            except Exception as exc:
+                errors = [exc] * len(batch)
+        with transaction.atomic():
+            for job, error in zip(batch, errors):
+                _finish(job, error)
+                succeeded += error is None
+    return succeeded
+
+
+def work(worker_id, batch_size=50):
+    """Claim and run one batch. Returns the number of jobs claimed."""
+    jobs = claim(worker_id, batch_size)
+    if jobs:
+        with keep_lease(jobs):
+            run_batch(jobs)
+    return len(jobs)
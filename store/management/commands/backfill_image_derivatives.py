@@ -0,0 +1,59 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from store import caching
+from store.images import generate_derivatives
+from store.models import Product
+
+
+def _render(product_id, name):
+    try:
+        return product_id, name, generate_derivatives(name), None
+    except Exception as exc:
+        return product_id, name, None, repr(exc)
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/fallback derivatives for existing product images, using all cores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--force', action='store_true',
+                            help="Regenerate even if derivatives for the current image exist.")
+
+    def handle(self, *args, **options):
+        pending = [
+            (product_id, name)
+            for product_id, name, derivatives in Product.objects.exclude(image='')
+            .values_list('id', 'image', 'image_derivatives').iterator()
+            if options['force'] or (derivatives or {}).get('source') != name
+        ]
+        if not pending:
+            self.stdout.write("All product images already have derivatives.")
+            return
+
+        self.stdout.write(f"Processing {len(pending)} image(s) with {options['workers']} worker(s)...")
+        # Children must not inherit the parent's open database connection.
+        connections.close_all()
+        done = failed = 0
+        updated = []
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            futures = [executor.submit(_render, product_id, name) for product_id, name in pending]
+            for future in as_completed(futures):
+                product_id, name, derivatives, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f"Product {product_id} ({name}): {error}")
+                    continue
+                # update() skips post_save, and with it the cache invalidation.
+                if Product.objects.filter(pk=product_id, image=name).update(image_derivatives=derivatives):
+                    updated.append(product_id)
+                done += 1
+                if done % 100 == 0:
+                    self.stdout.write(f"  {done}/{len(pending)}")
+        caching.invalidate_products(updated)
+        self.stdout.write(self.style.SUCCESS(f"Generated derivatives for {done} image(s); {failed} failed."))
@@ -0,0 +1,60 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import override_settings
+
+from store import payments
+from store.cart import CartLine
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure checkout-session latency and throughput through the payment "
+        "gateway using the in-process stub backend (no network access)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=500)
+        parser.add_argument('--lines', type=int, default=10, help="Cart lines per checkout.")
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--latency-ms', type=float, default=20,
+                            help="Simulated provider round-trip per API call.")
+
+    def handle(self, *args, **options):
+        products = Product.objects.bulk_create([
+            Product(name=f'Bench checkout {i}', description='bench', price=Decimal('99.00') + i,
+                    image='product_images/bench.jpg')
+            for i in range(options['lines'])
+        ])
+        try:
+            with override_settings(PAYMENT_BACKEND='store.payments.StubBackend',
+                                   PAYMENT_STUB_LATENCY=options['latency_ms'] / 1000):
+                payments.reset_backend()
+                cart = [CartLine(product, 1) for product in products]
+                self._run('cold price cache', cart, options)
+                self._run('warm price cache', cart, options)
+        finally:
+            payments.reset_backend()
+            Product.objects.filter(pk__in=[p.pk for p in products]).delete()
+
+    def _run(self, label, cart, options):
+        def checkout(_):
+            start = time.perf_counter()
+            payments.start_checkout(cart, 'http://bench/success/?session_id={CHECKOUT_SESSION_ID}', 'http://bench/cart/')
+            connections.close_all()
+            return time.perf_counter() - start
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as executor:
+            latencies = sorted(executor.map(checkout, range(options['sessions'])))
+        elapsed = time.perf_counter() - started
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f"{label:>17}: {len(latencies) / elapsed:8.1f} checkouts/s  "
+            f"p50 {statistics.median(latencies) * 1000:6.1f} ms  p95 {p95 * 1000:6.1f} ms"
+        )
@@ -0,0 +1,142 @@
+import http.client
+import secrets
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from store import benchmarks
+from store.cart import get_cart_store
+from store.models import Product
+
+ROUTES = ('catalog', 'product', 'cart', 'checkout')
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent-request throughput of a running server, e.g. "
+        "gunicorn with sync workers against gunicorn with uvicorn workers. "
+        "Each of --concurrency client threads sends requests back to back "
+        "over a keep-alive connection for --duration seconds. Logged-in "
+        "routes use the seed-user-N accounts from seed_data; their sessions "
+        "and carts are written straight to this database, so the server must "
+        "share it (and, with CacheCartStore, its cache). Start the server "
+        "with PAYMENT_STUB_LATENCY set to model the payment provider."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the server.")
+        parser.add_argument('--route', action='append', dest='routes', choices=ROUTES,
+                            help="Routes to drive (repeatable; default: all).")
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per route.")
+        parser.add_argument('--label', default='', help="Name for this run, e.g. 'wsgi' or 'asgi'.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--baseline', help="Compare throughput with an earlier JSON result.")
+
+    def handle(self, *args, **options):
+        target = urlsplit(options['url'])
+        product = Product.objects.order_by('id').first()
+        users = list(User.objects.filter(username__startswith='seed-user-').order_by('id')[:options['concurrency']])
+        if product is None or not users:
+            raise CommandError("No seeded products or users; run seed_data first.")
+
+        sessions = self._sessions(users, product)
+        paths = {
+            'catalog': ('GET', reverse('product_list'), False),
+            'product': ('GET', reverse('product_detail', args=[product.id]), False),
+            'cart': ('GET', reverse('view_cart'), True),
+            'checkout': ('POST', reverse('create_checkout_session'), True),
+        }
+        results = {}
+        for route in options['routes'] or ROUTES:
+            method, path, logged_in = paths[route]
+            results[route] = self._drive(target, method, path, sessions if logged_in else [None], options)
+            row = results[route]
+            self.stdout.write(
+                f"{route:<10} {row['throughput']:>9.1f} req/s  p50 {row['p50_ms']:>8.1f} ms  "
+                f"p95 {row['p95_ms']:>8.1f} ms  p99 {row['p99_ms']:>8.1f} ms  errors {row['errors']}"
+            )
+
+        run = {
+            'meta': {'label': options['label'], 'url': options['url'], 'concurrency': options['concurrency'],
+                     'duration': options['duration']},
+            'routes': results,
+        }
+        if options['output']:
+            benchmarks.save(run, options['output'])
+        if options['baseline']:
+            self._compare(benchmarks.load(options['baseline']), run)
+
+    def _sessions(self, users, product):
+        sessions = []
+        store = get_cart_store()
+        for user in users:
+            store.set(user, product.id, 1)
+            client = Client()
+            client.force_login(user)
+            # The CSRF cookie holds the unmasked secret; sending the same
+            # value in the header passes the check.
+            csrf = secrets.token_hex(16)
+            sessions.append({
+                'Cookie': f"sessionid={client.cookies['sessionid'].value}; csrftoken={csrf}",
+                'X-CSRFToken': csrf,
+            })
+        return sessions
+
+    def _drive(self, target, method, path, sessions, options):
+        deadline = time.perf_counter() + options['duration']
+        latencies, statuses, lock = [], [], threading.Lock()
+
+        def client(index):
+            headers = dict(sessions[index % len(sessions)] or {})
+            connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=60)
+            mine, codes = [], []
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    connection.request(method, path, body=b'' if method == 'POST' else None, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    codes.append(response.status)
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    codes.append(None)
+                mine.append(time.perf_counter() - start)
+            connection.close()
+            with lock:
+                latencies.extend(mine)
+                statuses.extend(codes)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'throughput': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(benchmarks.percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(benchmarks.percentile(latencies, 95) * 1000, 3),
+            'p99_ms': round(benchmarks.percentile(latencies, 99) * 1000, 3),
+            'errors': sum(1 for status in statuses if status is None or status >= 400),
+        }
+
+    def _compare(self, old, new):
+        old_label = old['meta'].get('label') or 'baseline'
+        new_label = new['meta'].get('label') or 'this run'
+        self.stdout.write(f"{'route':<10} {old_label + ' req/s':>16} {new_label + ' req/s':>16} {'speed-up':>9}")
+        for route, row in new['routes'].items():
+            before = old['routes'].get(route)
+            if before is None:
+                continue
+            ratio = row['throughput'] / before['throughput'] if before['throughput'] else float('inf')
+            self.stdout.write(f"{route:<10} {before['throughput']:>16.1f} {row['throughput']:>16.1f} {ratio:>8.2f}x")
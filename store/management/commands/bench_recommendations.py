@@ -0,0 +1,91 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from store import recommendations
+from store.models import Order, OrderItem, Product
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a full and an incremental build of the recommendation index "
+        "on synthetic order history. The seeded rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--products', type=int, default=5_000)
+        parser.add_argument('--max-items', type=int, default=5, help="Most lines in one order.")
+        parser.add_argument('--incremental', type=float, default=0.01,
+                            help="Share of --orders added before the incremental pass.")
+        parser.add_argument('--lookups', type=int, default=1_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        try:
+            with transaction.atomic():
+                products = self._seed_products(options['products'])
+                user = User.objects.create_user('bench-recommendations')
+                placed = timezone.now() - timedelta(days=1)
+
+                self._seed_orders(rng, user, products, options['orders'], options['max_items'], placed)
+                self._time('full build', lambda: recommendations.build(full=True))
+
+                extra = max(1, int(options['orders'] * options['incremental']))
+                self._seed_orders(rng, user, products, extra, options['max_items'], placed)
+                self._time(f'incremental (+{extra} orders)', recommendations.build)
+
+                sample = list(Product.objects.filter(pk__in=rng.sample(products, min(len(products), options['lookups']))))
+                start = time.perf_counter()
+                for product in sample:
+                    recommendations.related_products(product)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"{'lookup':>28}: {elapsed / len(sample) * 1000:8.3f} ms/product")
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _seed_products(self, count):
+        Product.objects.bulk_create([
+            Product(name=f'Bench rec {i}', description='bench', price=Decimal('10.00'),
+                    image='product_images/bench.jpg', category=Product.CATEGORY_CHOICES[i % 4][0])
+            for i in range(count)
+        ], batch_size=5000)
+        return list(Product.objects.filter(name__startswith='Bench rec ').values_list('id', flat=True))
+
+    def _seed_orders(self, rng, user, product_ids, count, max_items, placed):
+        self.stdout.write(f"Seeding {count} orders...")
+        # A skewed popularity curve so some pairs are far more common than others.
+        weights = [1 / (rank + 1) for rank in range(len(product_ids))]
+        for start in range(0, count, 10_000):
+            size = min(10_000, count - start)
+            orders = Order.objects.bulk_create([Order(user=user) for _ in range(size)])
+            Order.objects.filter(pk__in=[o.pk for o in orders]).update(ordered_at=placed)
+            items = []
+            for order in orders:
+                lines = set(rng.choices(product_ids, weights, k=rng.randint(1, max_items)))
+                items += [
+                    OrderItem(order=order, product_id=product_id, product_name='', unit_price=Decimal('10.00'), quantity=1)
+                    for product_id in lines
+                ]
+            OrderItem.objects.bulk_create(items, batch_size=5000)
+
+    def _time(self, label, run):
+        start = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{label:>28}: {elapsed:8.2f} s  "
+            f"({result.orders_processed} orders, {result.products_updated} products updated)"
+        )
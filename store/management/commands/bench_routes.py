@@ -0,0 +1,242 @@
+import json
+import logging
+import random
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from store import benchmarks, inventory, payments
+from store.cart import CartLine, get_cart_store
+from store.metrics import QueryRecorder
+from store.models import Order, OrderItem, Product
+from store.tasks import enqueue_catalog_import
+from store.urls import urlpatterns
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Scenario:
+    def __init__(self, route, method='get', as_user=None, data=None, **options):
+        self.route = route
+        self.method = method
+        self.as_user = as_user  # None (anonymous), 'customer', 'buyer' or 'staff'
+        self.data = data or {}
+        self.content_type = options.get('content_type')
+        self.label = options.get('label', route)
+        self.args = options.get('args', ())
+
+
+def scenarios(product_id, order_id, import_id, checkout_token):
+    return [
+        Scenario('product_list'),
+        Scenario('product_list', label='product_list:search', data={'q': 'wireless'}),
+        Scenario('product_list', label='product_list:rating', data={'sort': 'rating', 'category': 'books'}),
+        Scenario('product_list', label='product_list:price', data={'category': 'books', 'price': '100-250'}),
+        Scenario('product_list', label='product_list:customer', as_user='customer'),
+        Scenario('product_detail', args=(product_id,)),
+        Scenario('view_cart', as_user='customer'),
+        Scenario('add_to_cart', as_user='customer', args=(product_id,)),
+        Scenario('update_quantity', 'post', 'customer', {'quantity': 2}, args=(product_id,)),
+        Scenario('create_checkout_session', 'post', 'customer'),
+        Scenario('remove_from_cart', as_user='customer', args=(product_id,)),
+        Scenario('register'),
+        Scenario('login'),
+        Scenario('user_logout'),
+        Scenario('payment_success', as_user='buyer', data={'session_id': checkout_token}),
+        Scenario('payment_webhook', 'post', content_type='application/json',
+                 data=json.dumps({'type': 'bench.ping', 'data': {'object': {}}})),
+        Scenario('my_orders', as_user='customer'),
+        Scenario('order_detail', as_user='customer', args=(order_id,)),
+        Scenario('add_product', as_user='staff'),
+        Scenario('add_review', 'post', 'customer', {'rating': 5, 'comment': 'Benchmark review'}, args=(product_id,)),
+        Scenario('add_to_wishlist', as_user='customer', args=(product_id,)),
+        Scenario('wishlist', as_user='customer'),
+        Scenario('remove_from_wishlist', 'post', 'customer', args=(product_id,)),
+        Scenario('toggle_wishlist', 'post', 'customer', args=(product_id,)),
+        Scenario('profile', as_user='customer'),
+        Scenario('manage_orders', as_user='staff'),
+        Scenario('sales_dashboard', as_user='staff'),
+        Scenario('catalog_import', as_user='staff'),
+        Scenario('catalog_import_status', as_user='staff', args=(import_id,)),
+        Scenario('catalog_export', as_user='staff', data={'format': 'jsonl'}),
+        Scenario('api_product_list', data={'fields': 'id,name,price', 'limit': 50}),
+        Scenario('api_product_detail', args=(product_id,)),
+        Scenario('api_product_reviews', args=(product_id,)),
+        Scenario('product_suggestions', data={'q': 'wi'}),
+        Scenario('metrics'),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every route in store/urls.py through the in-process WSGI "
+        "handler and report p50/p95/p99 latency and query counts per route. "
+        "Run it against a database filled by seed_data; all writes are "
+        "rolled back. Results can be saved as JSON and compared with an "
+        "earlier run to flag regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Timed requests per route.")
+        parser.add_argument('--warmup', type=int, default=10, help="Untimed requests per route first.")
+        parser.add_argument('--route', action='append', dest='routes', help="Only run these routes (repeatable).")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--baseline', help="Compare this run with an earlier JSON result.")
+        parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                            help="Only compare two saved results; nothing is run.")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="p95 growth that counts as a regression (0.2 = 20%%).")
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help="Ignore p95 growth smaller than this, however large in percent.")
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            old, new = (benchmarks.load(path) for path in options['compare'])
+            return self._report_comparison(old, new, options)
+
+        if not Product.objects.exists():
+            raise CommandError("No products to benchmark against; run seed_data first.")
+        run = self._run(options)
+        self._report(run)
+        if options['output']:
+            benchmarks.save(run, options['output'])
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['baseline']:
+            self._report_comparison(benchmarks.load(options['baseline']), run, options)
+
+    def _run(self, options):
+        rng = random.Random(options['seed'])
+        results = {}
+        # Expected 4xx responses (e.g. /metrics while disabled) would log a
+        # warning per request.
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            with transaction.atomic(), override_settings(PAYMENT_BACKEND='store.payments.StubBackend',
+                                                        PAYMENT_STUB_LATENCY=0, RATE_LIMIT_ENABLED=False):
+                payments.reset_backend()
+                clients, *ids = self._fixtures(rng)
+                plan = scenarios(*ids)
+                self._check_coverage(plan)
+                wanted = set(options['routes'] or ())
+                for scenario in plan:
+                    if not wanted or wanted & {scenario.route, scenario.label}:
+                        results[scenario.label] = self._measure(scenario, clients, options)
+                meta = {
+                    'started_at': datetime.now(dt_timezone.utc).isoformat(),
+                    'database': connection.vendor,
+                    'requests_per_route': options['requests'],
+                    'products': Product.objects.count(),
+                    'orders': Order.objects.count(),
+                    'users': User.objects.count(),
+                }
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            payments.reset_backend()
+            request_logger.setLevel(level)
+        return {'meta': meta, 'routes': results}
+
+    def _fixtures(self, rng):
+        bounds = Product.objects.aggregate(first=Min('id'), last=Max('id'))
+        product = Product.objects.filter(id__gte=rng.randint(bounds['first'], bounds['last'])).order_by('id').first()
+
+        users = {
+            'customer': User.objects.create_user('bench-routes-customer', password='bench'),
+            'buyer': User.objects.create_user('bench-routes-buyer', password='bench'),
+            'staff': User.objects.create_user('bench-routes-staff', password='bench', is_staff=True),
+        }
+        get_cart_store().set(users['customer'], product.id, 1)
+        get_cart_store().set(users['buyer'], product.id, 1)
+        order = Order.objects.create(user=users['customer'], total=product.price)
+        OrderItem.objects.create(order=order, product=product, product_name=product.name,
+                                 category=product.category, unit_price=product.price, quantity=1)
+
+        catalog_import = enqueue_catalog_import('catalog_imports/bench.csv', 'csv')
+        # A paid checkout for the buyer: the first success page places the order, the rest replay it.
+        hold, _ = inventory.reserve([CartLine(product, 1)])
+        checkout = payments.get_backend().create_checkout_session(
+            [], 'http://bench/success/', 'http://bench/cart/', reference=str(users['buyer'].pk),
+        )
+        inventory.attach(hold, checkout.id)
+
+        clients = {None: Client()}
+        for role, user in users.items():
+            clients[role] = Client()
+            clients[role].force_login(user)
+        return clients, product.id, order.id, catalog_import.id, checkout.id
+
+    def _check_coverage(self, plan):
+        covered = {scenario.route for scenario in plan}
+        missing = [pattern.name for pattern in urlpatterns if pattern.name not in covered]
+        if missing:
+            self.stderr.write(f"No benchmark scenario for: {', '.join(missing)}")
+
+    def _measure(self, scenario, clients, options):
+        client = clients[scenario.as_user]
+        url = reverse(scenario.route, args=scenario.args)
+        send = getattr(client, scenario.method)
+        kwargs = {'content_type': scenario.content_type} if scenario.content_type else {}
+
+        def request():
+            response = send(url, scenario.data, **kwargs)
+            if response.streaming:
+                # Time the whole body, not just the first byte.
+                b''.join(response.streaming_content)
+            return response
+
+        for _ in range(options['warmup']):
+            request()
+        latencies, query_counts, statuses = [], [], []
+        for _ in range(options['requests']):
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                start = time.perf_counter()
+                response = request()
+                latencies.append(time.perf_counter() - start)
+            query_counts.append(recorder.count)
+            statuses.append(response.status_code)
+        return benchmarks.summarize(latencies, query_counts, statuses)
+
+    def _report(self, run):
+        self.stdout.write(f"{'route':<26} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+        for label, row in run['routes'].items():
+            self.stdout.write(
+                f"{label:<26} {row['status']!s:>6} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+                f"{row['p99_ms']:>9.2f} {row['queries']:>8}"
+            )
+
+    def _report_comparison(self, old, new, options):
+        regressions = []
+        self.stdout.write(f"{'route':<26} {'old p95':>9} {'new p95':>9} {'change':>8} {'queries':>9}")
+        for route, before, after, p95_change, query_change, regressed in benchmarks.compare(
+                old, new, options['threshold'], options['min_delta_ms']):
+            if before is None or after is None:
+                self.stdout.write(f"{route:<26} {'only in ' + ('new' if before is None else 'old'):>37}")
+                continue
+            flag = '  REGRESSION' if regressed else ''
+            self.stdout.write(
+                f"{route:<26} {before['p95_ms']:>9.2f} {after['p95_ms']:>9.2f} {p95_change:>+8.0%} "
+                f"{query_change:>+9d}{flag}"
+            )
+            if regressed:
+                regressions.append(route)
+        if regressions:
+            message = f"{len(regressions)} route(s) regressed: {', '.join(regressions)}"
+            if options['fail_on_regression']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("No regressions."))
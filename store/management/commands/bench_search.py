@@ -0,0 +1,81 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import Product
+from store.search import search_products, icontains_search
+
+WORDS = (
+    "wireless bluetooth cotton organic leather steel kitchen smart classic "
+    "portable premium vintage ceramic bamboo gaming travel outdoor compact "
+    "digital handmade linen wooden silver magnetic ergonomic waterproof"
+).split()
+NOUNS = (
+    "headphones shirt novel coffee speaker jacket lamp mug backpack watch "
+    "keyboard kettle blanket notebook charger sneakers rice tea camera desk"
+).split()
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare indexed full-text search with the icontains scan on a "
+        "synthetic catalog. The seeded rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = WORDS + NOUNS + [self._pseudo_word(rng) for _ in range(5000)]
+        try:
+            with transaction.atomic():
+                self._seed(rng, options['products'], vocabulary)
+                terms = [rng.choice(vocabulary) for _ in range(options['queries'])]
+                base = Product.objects.all()
+                for label, fn in (('icontains', icontains_search), ('indexed', search_products)):
+                    # Mirror product_list: count the matches, then fetch a page.
+                    elapsed = self._time(lambda q: (fn(base, q).count(), list(fn(base, q)[:6])), terms)
+                    self.stdout.write(
+                        f"{label:>10}: {elapsed / len(terms) * 1000:8.2f} ms/query "
+                        f"over {len(terms)} queries"
+                    )
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _pseudo_word(self, rng):
+        return ''.join(rng.choice('aeioubcdfghklmnprstvz') for _ in range(rng.randint(4, 9)))
+
+    def _seed(self, rng, count, vocabulary):
+        self.stdout.write(f"Seeding {count} products...")
+        batch = []
+        for i in range(count):
+            name = f"{rng.choice(WORDS).title()} {rng.choice(NOUNS).title()} {i}"
+            description = ' '.join(rng.choice(vocabulary) for _ in range(25))
+            batch.append(Product(
+                name=name,
+                description=description,
+                price=Decimal(rng.randint(100, 100_000)) / 100,
+                image='product_images/bench.jpg',
+                category=rng.choice(Product.CATEGORY_CHOICES)[0],
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+
+    def _time(self, run, terms):
+        start = time.perf_counter()
+        for term in terms:
+            run(term)
+        return time.perf_counter() - start
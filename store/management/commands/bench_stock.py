@@ -0,0 +1,101 @@
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from store import inventory
+from store.cart import CartLine
+from store.models import Job, Product, StockReservation
+from store.tasks import RELEASE_STOCK
+
+
+class Command(BaseCommand):
+    help = (
+        "Race parallel checkouts for one hot product and check that stock "
+        "reservations never oversell it. Each checkout reserves, waits for "
+        "the simulated payment provider, then pays (commits) or abandons "
+        "(releases). Runs against the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=100, help="Units of the hot product.")
+        parser.add_argument('--checkouts', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--quantity', type=int, default=1, help="Units per checkout.")
+        parser.add_argument('--abandon-rate', type=float, default=0.2,
+                            help="Share of reserved checkouts that are never paid for.")
+        parser.add_argument('--latency-ms', type=float, default=20,
+                            help="Simulated provider round-trip between reserving and paying.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        product, = Product.objects.bulk_create([Product(
+            name='Bench hot product', description='bench', price=Decimal('99.00'),
+            image='product_images/bench.jpg', stock=options['stock'],
+        )])
+        rng = random.Random(options['seed'])
+        abandons = [rng.random() < options['abandon_rate'] for _ in range(options['checkouts'])]
+        outcomes, latencies, lock = {'paid': 0, 'abandoned': 0, 'out of stock': 0, 'errors': 0}, [], threading.Lock()
+        sold, holds = [0], []
+
+        def checkout(index):
+            start = time.perf_counter()
+            try:
+                hold, _ = inventory.reserve([CartLine(product, options['quantity'])])
+            except inventory.OutOfStock:
+                outcome = 'out of stock'
+            except Exception:
+                outcome = 'errors'
+            else:
+                with lock:
+                    holds.append(str(hold))
+                time.sleep(options['latency_ms'] / 1000)
+                token = f'cs_bench_stock_{index}'
+                try:
+                    inventory.attach(hold, token)
+                    if abandons[index]:
+                        inventory.release(hold)
+                        outcome = 'abandoned'
+                    else:
+                        if inventory.commit(token):
+                            with lock:
+                                sold[0] += options['quantity']
+                        outcome = 'paid'
+                except Exception:
+                    outcome = 'errors'
+            finally:
+                connections.close_all()
+            with lock:
+                outcomes[outcome] += 1
+                latencies.append(time.perf_counter() - start)
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['threads']) as executor:
+                list(executor.map(checkout, range(options['checkouts'])))
+            elapsed = time.perf_counter() - started
+
+            remaining = Product.objects.values_list('stock', flat=True).get(pk=product.pk)
+            held = sum(StockReservation.objects.filter(product=product).values_list('quantity', flat=True))
+        finally:
+            # The expiry jobs would only find nothing left to release.
+            Job.objects.filter(kind=RELEASE_STOCK, payload__hold__in=holds).delete()
+            product.delete()
+
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f"{len(latencies) / elapsed:8.1f} checkouts/s  p50 {statistics.median(latencies) * 1000:6.1f} ms  "
+            f"p95 {p95 * 1000:6.1f} ms  ({options['threads']} threads)"
+        )
+        self.stdout.write("  ".join(f"{name}: {count}" for name, count in outcomes.items()))
+        self.stdout.write(f"stock: {options['stock']} at start, {sold[0]} sold, {held} held, {remaining} left")
+        oversold = sold[0] + held + remaining - options['stock']
+        if sold[0] > options['stock'] or oversold:
+            raise CommandError(f"Stock doesn't add up: {oversold:+d} units.")
+        self.stdout.write(self.style.SUCCESS("No overselling."))
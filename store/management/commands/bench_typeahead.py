@@ -0,0 +1,60 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.benchmarks import percentile
+from store.management.commands.bench_search import NOUNS, WORDS
+from store.typeahead import TypeaheadIndex
+
+
+class Command(BaseCommand):
+    help = (
+        "Time typeahead lookups on a synthetic in-memory catalog: building the "
+        "index, then suggestions for prefixes as they'd be typed, twice over. "
+        "Doesn't touch the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--lookups', type=int, default=20_000)
+        parser.add_argument('--limit', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = WORDS + NOUNS + [self._pseudo_word(rng) for _ in range(5000)]
+        rows = [(pk, self._name(rng, vocabulary, pk), int(rng.paretovariate(1.2)))
+                for pk in range(1, options['products'] + 1)]
+
+        started = time.perf_counter()
+        index = TypeaheadIndex(rows)
+        self.stdout.write(f"built index of {len(index)} products in {time.perf_counter() - started:.2f} s")
+
+        queries = [self._query(rng, rows) for _ in range(options['lookups'])]
+        for label in ('first pass', 'second pass'):
+            lookups = []
+            for query in queries:
+                started = time.perf_counter()
+                index.suggest(query, options['limit'])
+                lookups.append(time.perf_counter() - started)
+            self._report(f"lookups, {label}", lookups)
+
+    def _report(self, label, timings):
+        timings.sort()
+        us = [percentile(timings, pct) * 1e6 for pct in (50, 95, 99, 100)]
+        self.stdout.write(
+            f"{label:>20}: p50 {us[0]:7.1f} us  p95 {us[1]:7.1f} us  p99 {us[2]:7.1f} us  "
+            f"max {us[3]:8.1f} us  ({len(timings)})"
+        )
+
+    def _pseudo_word(self, rng):
+        return ''.join(rng.choice('aeioubcdfghklmnprstvz') for _ in range(rng.randint(4, 9)))
+
+    def _name(self, rng, vocabulary, pk):
+        return f"{rng.choice(WORDS).title()} {rng.choice(vocabulary).title()} {rng.choice(NOUNS).title()} {pk}"
+
+    def _query(self, rng, rows):
+        # What's in the box partway through typing a real product's name.
+        name = rows[rng.randrange(len(rows))][1].lower()
+        return name[:rng.randint(1, name.rindex(' '))]
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from store import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold orders placed since the last run into the \"customers also "
+        "bought\" index and refresh the affected products' recommendations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help="Discard the index and rebuild it from every order.")
+
+    def handle(self, *args, **options):
+        run = recommendations.build(full=options['full'])
+        if run is None:
+            self.stdout.write("No new orders since the last run.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {run.orders_processed} orders up to #{run.last_order_id}; "
+            f"updated {run.products_updated} products."
+        ))
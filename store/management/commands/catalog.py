@@ -0,0 +1,68 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import catalog_io
+
+
+class Command(BaseCommand):
+    help = (
+        "Import products from, or export the catalog to, CSV or JSON Lines. "
+        "Columns: sku, name, description, price, category, and image (a "
+        "storage path) or image_url (downloaded). Rows are upserted on sku."
+    )
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest='action', required=True)
+
+        importer = actions.add_parser('import', help="Upsert products from a file.")
+        importer.add_argument('path')
+        importer.add_argument('--format', choices=catalog_io.FORMATS,
+                              help="Defaults to the file extension (.csv, .jsonl or .ndjson).")
+        importer.add_argument('--chunk-size', type=int, default=catalog_io.CHUNK_SIZE)
+        importer.add_argument('--image-workers', type=int, default=catalog_io.IMAGE_WORKERS)
+
+        exporter = actions.add_parser('export', help="Write the whole catalog.")
+        exporter.add_argument('--format', choices=catalog_io.FORMATS, default='csv')
+        exporter.add_argument('--output', help="File to write; defaults to stdout.")
+
+    def handle(self, *args, **options):
+        if options['action'] == 'import':
+            self._import(options)
+        else:
+            self._export(options)
+
+    def _import(self, options):
+        fmt = options['format'] or catalog_io.format_for(options['path'])
+
+        def report(result):
+            self.stderr.write(
+                f"{result.rows} rows: {result.created} created, {result.updated} updated, "
+                f"{result.failed} failed"
+            )
+
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as fh:
+                result = catalog_io.import_catalog(
+                    fh, fmt, chunk_size=options['chunk_size'],
+                    image_workers=options['image_workers'], progress=report,
+                )
+        except OSError as exc:
+            raise CommandError(exc)
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        if result.failed > len(result.errors):
+            self.stderr.write(f"... and {result.failed - len(result.errors)} more errors.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.rows} rows: {result.created} created, {result.updated} updated, "
+            f"{result.failed} failed."
+        ))
+
+    def _export(self, options):
+        out = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for chunk in catalog_io.export_catalog(options['format']):
+                out.write(chunk)
+        finally:
+            if options['output']:
+                out.close()
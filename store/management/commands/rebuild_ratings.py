@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.caching import invalidate_catalog, invalidate_typeahead
+from store.ratings import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute review_count, rating_sum and rating_avg for every product from Review."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild()
+        # Cached listings show the aggregates; review counts rank typeahead.
+        invalidate_catalog()
+        invalidate_typeahead()
+        self.stdout.write(self.style.SUCCESS("Product ratings rebuilt."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import DailySales
+from store.sales import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily sales rollups behind the staff dashboard from "
+        "OrderItem. Run it after loading orders outside the app (e.g. "
+        "seed_data) or to repair drift; new orders and status changes keep "
+        "the rollups current on their own."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Sales rollups rebuilt for {DailySales.objects.count()} day(s)."))
@@ -0,0 +1,38 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from store import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background jobs (e.g. order confirmation emails). Start as many "
+        "workers as needed; they never claim the same job."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once no due jobs are left instead of polling.")
+        parser.add_argument('--worker-id', default=f'{socket.gethostname()}-{os.getpid()}')
+
+    def handle(self, *args, **options):
+        worker_id = options['worker_id']
+        self.stdout.write(f"Worker {worker_id} started.")
+        try:
+            while True:
+                claimed = jobs.work(worker_id, options['batch_size'])
+                if claimed:
+                    self.stdout.write(f"Processed {claimed} job(s).")
+                    continue
+                if options['burst']:
+                    break
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Worker {worker_id} stopped.")
@@ -0,0 +1,163 @@
+import itertools
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from store import caching, sales
+from store.models import Order, OrderItem, Product, Review
+from store.ratings import rebuild
+
+ADJECTIVES = (
+    "wireless bluetooth cotton organic leather steel kitchen smart classic "
+    "portable premium vintage ceramic bamboo gaming travel outdoor compact "
+    "digital handmade linen wooden silver magnetic ergonomic waterproof"
+).split()
+NOUNS = (
+    "headphones shirt novel coffee speaker jacket lamp mug backpack watch "
+    "keyboard kettle blanket notebook charger sneakers rice tea camera desk"
+).split()
+COMMENTS = (
+    "Great value.", "Arrived late but works fine.", "Exactly as described.",
+    "Would not buy again.", "Excellent quality, highly recommended.", "Okay for the price.",
+)
+# Roughly what a live store looks like: most orders end up delivered.
+STATUS_WEIGHTS = {'delivered': 60, 'shipped': 15, 'processing': 20, 'cancelled': 5}
+PASSWORD = 'seed-password'
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users, products, orders and reviews "
+        "using bulk inserts, for benchmarking (see bench_routes). Seeded users "
+        f"are named seed-user-N and share the password '{PASSWORD}'. Use a "
+        "throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--users', type=int, default=50_000)
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--reviews', type=int, default=500_000)
+        parser.add_argument('--max-items', type=int, default=5, help="Most lines in one order.")
+        parser.add_argument('--days', type=int, default=365, help="Spread orders and reviews over this many days.")
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options['days'])
+
+        with transaction.atomic():
+            user_ids = self._timed('users', self._seed_users, options['users'])
+            products = self._timed('products', self._seed_products, options['products'])
+            if user_ids and products:
+                # A skewed popularity curve: a few best sellers, a long tail.
+                product_ids = list(products)
+                weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(product_ids))))
+                self.rng.shuffle(product_ids)
+                picks = (product_ids, weights)
+                self._timed('orders', self._seed_orders, options['orders'], user_ids, products, picks,
+                            options['max_items'])
+                self._timed('reviews', self._seed_reviews, options['reviews'], user_ids, picks)
+            self._timed('rating aggregates', rebuild)
+            self._timed('sales rollups', sales.rebuild)
+        caching.invalidate_catalog()
+        caching.invalidate_typeahead()
+        self.stdout.write(self.style.SUCCESS(
+            "Done. Run build_recommendations to index the new orders."
+        ))
+
+    def _timed(self, label, seed, *args):
+        started = time.perf_counter()
+        result = seed(*args)
+        self.stdout.write(f"{label:>18}: {time.perf_counter() - started:8.2f} s")
+        return result
+
+    def _batches(self, count):
+        for start in range(0, count, self.batch_size):
+            yield start, min(self.batch_size, count - start)
+
+    def _stamp(self, model, field, objs, position, total):
+        # auto_now_add ignores explicit values, so backdate each batch with
+        # one UPDATE; ids and timestamps then grow together like real data.
+        when = self.start + (self.now - self.start) * (position / max(total, 1))
+        model.objects.filter(pk__in=[obj.pk for obj in objs]).update(**{field: when})
+
+    def _seed_users(self, count):
+        first = User.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        password = make_password(PASSWORD)
+        ids = []
+        for start, size in self._batches(count):
+            users = User.objects.bulk_create([
+                User(username=f'seed-user-{first + start + i}', email=f'seed-user-{first + start + i}@example.com',
+                     password=password)
+                for i in range(size)
+            ])
+            ids += [user.pk for user in users]
+        return ids
+
+    def _seed_products(self, count):
+        categories = [value for value, _ in Product.CATEGORY_CHOICES]
+        seeded = {}
+        for start, size in self._batches(count):
+            products = Product.objects.bulk_create([
+                Product(
+                    name=f"{self.rng.choice(ADJECTIVES).title()} {self.rng.choice(NOUNS).title()} {start + i}",
+                    description=' '.join(self.rng.choices(ADJECTIVES + NOUNS, k=25)),
+                    price=Decimal(self.rng.randint(100, 100_000)) / 100,
+                    image='product_images/seed.jpg',
+                    category=self.rng.choice(categories),
+                )
+                for i in range(size)
+            ])
+            self._stamp(Product, 'created_at', products, start, count)
+            seeded.update((product.pk, (product.name, product.price, product.category)) for product in products)
+        return seeded
+
+    def _seed_orders(self, count, user_ids, products, picks, max_items):
+        product_ids, weights = picks
+        statuses, status_weights = zip(*STATUS_WEIGHTS.items())
+        for start, size in self._batches(count):
+            baskets = [
+                set(self.rng.choices(product_ids, cum_weights=weights, k=self.rng.randint(1, max_items)))
+                for _ in range(size)
+            ]
+            quantities = [{pid: self.rng.randint(1, 3) for pid in basket} for basket in baskets]
+            orders = Order.objects.bulk_create([
+                Order(
+                    user_id=self.rng.choice(user_ids),
+                    status=self.rng.choices(statuses, status_weights)[0],
+                    total=sum(products[pid][1] * qty for pid, qty in lines.items()),
+                )
+                for lines in quantities
+            ])
+            self._stamp(Order, 'ordered_at', orders, start, count)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=pid, product_name=products[pid][0], category=products[pid][2],
+                          unit_price=products[pid][1], quantity=qty)
+                for order, lines in zip(orders, quantities)
+                for pid, qty in lines.items()
+            ], batch_size=self.batch_size)
+
+    def _seed_reviews(self, count, user_ids, picks):
+        product_ids, weights = picks
+        for start, size in self._batches(count):
+            reviews = Review.objects.bulk_create([
+                Review(
+                    product_id=pid,
+                    user_id=self.rng.choice(user_ids),
+                    rating=self.rng.choices((1, 2, 3, 4, 5), (5, 5, 15, 35, 40))[0],
+                    comment=self.rng.choice(COMMENTS),
+                )
+                for pid in self.rng.choices(product_ids, cum_weights=weights, k=size)
+            ])
+            self._stamp(Review, 'created_at', reviews, start, count)
@@ -0,0 +1,40 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database over each SQLite replica in "
+        "DATABASE_REPLICAS, to try replica routing locally with two files. "
+        "Run it again whenever the replica should catch up; until then it "
+        "lags like a real one. Real replicas are fed by the database server."
+    )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("The primary database is not SQLite.")
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured; set DATABASE_REPLICA_URLS.")
+
+        for alias in settings.DATABASE_REPLICAS:
+            replica = settings.DATABASES[alias]
+            if replica['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError(f"Replica {alias} is not SQLite.")
+            if str(replica['NAME']) == str(primary['NAME']):
+                raise CommandError(f"Replica {alias} is the primary database file.")
+            connections[alias].close()
+            # The backup API copies a consistent snapshot even while the
+            # primary is being written to.
+            source = sqlite3.connect(primary['NAME'])
+            target = sqlite3.connect(replica['NAME'])
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            self.stdout.write(f"{alias}: copied {primary['NAME']} to {replica['NAME']}")
+        self.stdout.write(self.style.SUCCESS("Replicas are up to date."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from store import payments
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = "Create or refresh the cached payment-provider Price for every product whose price changed."
+
+    def handle(self, *args, **options):
+        backend = payments.get_backend()
+        synced = 0
+        for product in Product.objects.iterator():
+            if product.stripe_price_id and product.stripe_price_amount == payments.to_minor_units(product.price):
+                continue
+            payments.price_id_for(product, backend)
+            synced += 1
+        self.stdout.write(self.style.SUCCESS(f"Synced {synced} price(s)."))
@@ -0,0 +1,262 @@
+"""
+Per-view request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` times every request, counts the SQL it ran through a
+wrapper installed on every database connection and flags requests that repeat the same
+statement ``REPEATED_QUERY_THRESHOLD`` times or more, the usual sign of an
+N+1 loop. Results are kept in process memory and served by the ``metrics``
+view at ``/metrics``.
+
+Everything is off unless ``settings.METRICS_ENABLED`` is true: the
+middleware then removes itself at startup (``MiddlewareNotUsed``) and the
+endpoint returns 404, so requests pay nothing. Counters are per process;
+with several gunicorn workers each one reports its own share.
+
+The middleware works in sync and async chains. Async views run their
+queries in worker threads, each with its own connection, so the current
+request's recorder is found through a context variable, which
+``sync_to_async`` carries into those threads, rather than by wrapping the
+calling thread's connections.
+"""
+import logging
+import threading
+import time
+from collections import Counter as _Tally
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+REPEATED_QUERY_THRESHOLD = 5
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, key)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        self._values = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-1] += value
+
+    def count(self, **labels):
+        state = self._values.get(tuple(labels[name] for name in self.labelnames))
+        return sum(state[:-1]) if state else 0
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, hits in zip((*self.buckets, '+Inf'), state[:-1]):
+                    cumulative += hits
+                    le = (('le', bound if bound == '+Inf' else _number(bound)),)
+                    lines.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+                lines.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_number(float(state[-1]))}')
+                lines.append(f'{self.name}_count{_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'store_request_duration_seconds', 'Time spent handling a request.',
+    LATENCY_BUCKETS, ('view', 'method'),
+)
+REQUESTS = Counter(
+    'store_requests_total', 'Requests handled, by response status.',
+    ('view', 'method', 'status'),
+)
+QUERY_COUNT = Histogram(
+    'store_request_queries', 'SQL queries run while handling a request.',
+    QUERY_COUNT_BUCKETS, ('view',),
+)
+QUERY_SECONDS = Counter(
+    'store_db_query_seconds_total', 'Time spent waiting on SQL queries.',
+    ('view',),
+)
+REPEATED_QUERIES = Counter(
+    'store_repeated_query_requests_total',
+    f'Requests that ran one SQL statement {REPEATED_QUERY_THRESHOLD} or more times (likely N+1).',
+    ('view',),
+)
+
+REGISTRY = [REQUEST_LATENCY, REQUESTS, QUERY_COUNT, QUERY_SECONDS, REPEATED_QUERIES]
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+def clear():
+    for metric in REGISTRY:
+        metric.clear()
+
+
+def enabled():
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # Statements are compared before parameters are bound, so a loop
+        # fetching one row per id shows up as one repeated statement.
+        self.statements = _Tally()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+
+_current_recorder = ContextVar('store_metrics_recorder', default=None)
+
+
+def _record(execute, sql, params, many, context):
+    recorder = _current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def _install(connection, **kwargs):
+    # First in the list: execute_wrapper() blocks push and pop at the end.
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record)
+
+
+def _install_all(**kwargs):
+    # Connections opened before the middleware loaded. request_started runs
+    # in the thread that will run the request's queries.
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        connection_created.connect(_install, dispatch_uid='store.metrics')
+        request_started.connect(_install_all, dispatch_uid='store.metrics')
+        _install_all()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        self._observe(request, response, recorder, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        token = _current_recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_recorder.reset(token)
+        self._observe(request, response, recorder, time.perf_counter() - start)
+        return response
+
+    def _observe(self, request, response, recorder, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '<unresolved>'
+        REQUEST_LATENCY.observe(elapsed, view=view, method=request.method)
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        QUERY_COUNT.observe(recorder.count, view=view)
+        QUERY_SECONDS.inc(recorder.seconds, view=view)
+
+        if recorder.statements:
+            sql, repeats = recorder.statements.most_common(1)[0]
+            if repeats >= REPEATED_QUERY_THRESHOLD:
+                REPEATED_QUERIES.inc(view=view)
+                logger.warning("%s ran the same query %d times (possible N+1): %s", view, repeats, sql)
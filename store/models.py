@@ -9,12 +9,42 @@ class Product(models.Model):
         ('grocery', 'Grocery'),
     ]
 
+    # Merchant's stock-keeping unit; the key catalog imports upsert on.
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='product_images/')
+    # Resized WebP/fallback URLs for `image`; filled in by store.images off the request path.
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    # Cached Stripe Price for `price` (in paise); see store.payments.
+    stripe_price_id = models.CharField(max_length=255, blank=True, editable=False)
+    stripe_price_amount = models.PositiveIntegerField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last change to anything the JSON API shows, reviews included; drives its ETag/Last-Modified.
+    updated_at = models.DateTimeField(auto_now=True)
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES, default='electronics')  # ✅ retained
+    # Denormalized from Review; maintained by store.ratings, repaired by `manage.py rebuild_ratings`.
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(default=0)
+    # Top "customers also bought" product ids, best first; built by store.recommendations.
+    recommended_ids = models.JSONField(default=list, blank=True, editable=False)
+    # Units available to reserve, held stock already taken off; None means
+    # stock isn't tracked. Only changed through store.inventory.
+    stock = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the catalog walks (created_at, id).
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+            models.Index(fields=['rating_avg', 'id'], name='product_rating_id_idx'),
+            # The same two orderings within one category.
+            models.Index(fields=['category', 'created_at', 'id'], name='product_cat_created_idx'),
+            models.Index(fields=['category', 'rating_avg', 'id'], name='product_cat_rating_idx'),
+            # Covers the facet counts (store.facets) and price band filters.
+            models.Index(fields=['category', 'price'], name='product_cat_price_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -27,6 +57,12 @@ class Review(models.Model):
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # product_detail: a product's newest reviews first.
+            models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.product.name} ({self.rating})"
 
@@ -43,10 +79,48 @@ class Wishlist(models.Model):
         return f"{self.user.username} - {self.product.name}"
 
 
-class Order(models.Model):
+class CartItem(models.Model):
+    """A cart line for store.cart.DatabaseCartStore."""
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)  # ✅ no quotes needed
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('user', 'product')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.product.name} ({self.quantity})"
+
+
+class CoPurchase(models.Model):
+    """How many orders contained both `product` and `other`; stored in both directions."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'other')
+        indexes = [
+            models.Index(fields=['product', '-count'], name='copurchase_product_count_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.other_id} ({self.count})"
+
+
+class RecommendationRun(models.Model):
+    """One `build_recommendations` pass; the latest `last_order_id` is the watermark."""
+    last_order_id = models.BigIntegerField()
+    orders_processed = models.PositiveIntegerField(default=0)
+    products_updated = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Recommendations up to order #{self.last_order_id}"
+
+
+class Order(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
     ordered_at = models.DateTimeField(auto_now_add=True)
     STATUS_CHOICES = [
         ('processing', 'Processing'),
@@ -55,6 +129,125 @@ class Order(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
+    # Stripe Checkout Session id; makes payment_success idempotent.
+    checkout_token = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Set when the provider's checkout.session.completed webhook arrives.
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Staff order console: newest first, optionally narrowed by status or user.
+            models.Index(fields=['ordered_at', 'id'], name='order_ordered_id_idx'),
+            models.Index(fields=['status', 'ordered_at', 'id'], name='order_status_ordered_idx'),
+            models.Index(fields=['user', 'ordered_at', 'id'], name='order_user_ordered_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.product.name} ({self.quantity})"
+        return f"{self.user.username} - Order #{self.id}"
+
+
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
+    # Snapshotted at purchase time so order pages never re-join Product.
+    product_name = models.CharField(max_length=255)
+    category = models.CharField(max_length=50, blank=True)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField(default=1)
+
+    @property
+    def line_total(self):
+        return self.unit_price * self.quantity
+
+    def __str__(self):
+        return f"{self.product_name} ({self.quantity})"
+
+
+class StockReservation(models.Model):
+    """One line of a checkout, with the units held for it; see store.inventory."""
+    hold = models.UUIDField(db_index=True)
+    # The payment provider's checkout session id, once it exists.
+    checkout_token = models.CharField(max_length=255, blank=True, db_index=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField()
+    # The price the buyer was charged, which the order records.
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # False when the product's stock isn't tracked: no units were taken.
+    tracked = models.BooleanField(default=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for {self.checkout_token or self.hold}"
+
+
+class SalesRollup(models.Model):
+    """One day's sales of orders that aren't cancelled; maintained by store.sales."""
+    day = models.DateField()
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailySales(SalesRollup):
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['day'], name='dailysales_day_uniq')]
+
+    def __str__(self):
+        return f"{self.day}: {self.revenue}"
+
+
+class DailyCategorySales(SalesRollup):
+    category = models.CharField(max_length=50)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['day', 'category'], name='dailycategorysales_uniq')]
+
+    def __str__(self):
+        return f"{self.day} {self.category}: {self.revenue}"
+
+
+class DailyProductSales(SalesRollup):
+    # A plain id, not a foreign key: sales history outlives deleted products.
+    product_id = models.PositiveIntegerField()
+    product_name = models.CharField(max_length=255)
+    category = models.CharField(max_length=50)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category', 'product_id'], name='dailyproductsales_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_name}: {self.revenue}"
+
+
+class Job(models.Model):
+    """A unit of background work, claimed and run by `manage.py runworker`."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
@@ -0,0 +1,95 @@
+from django.db import transaction
+
+from . import inventory, sales
+from .cart import get_cart_store
+from .models import Order, OrderItem
+from .tasks import enqueue_email
+
+
+class CheckoutTokenTaken(Exception):
+    """The checkout token already belongs to another user's order."""
+
+
+class CheckoutExpired(Exception):
+    """The checkout's lines were released, or never reserved, so there is nothing to order."""
+
+
+def place_order(user, checkout_token):
+    """
+    Turn the paid checkout ``checkout_token`` into an ``Order`` with one
+    ``OrderItem`` per line reserved for it, at the price the buyer was
+    charged (see ``store.inventory``).
+
+    The success page and the payment webhook both call this; whichever runs
+    first creates the order. The header and all items are written in one
+    transaction, items with a single ``bulk_create``. ``checkout_token`` is
+    unique, so replaying the same checkout returns the existing order
+    instead of creating a duplicate. In the same transaction a new order
+    commits the checkout's reserved stock, is added to the sales rollups,
+    queues its confirmation email and takes its products out of the buyer's
+    cart. Returns ``(order, created)``; raises ``CheckoutTokenTaken`` if the
+    token's order belongs to someone else and ``CheckoutExpired`` if there
+    is no order and nothing left to order.
+    """
+    created = False
+    with transaction.atomic():
+        order = Order.objects.filter(checkout_token=checkout_token).first()
+        if order is None:
+            lines = inventory.commit(checkout_token)
+            if lines:
+                order, created = _create(user, checkout_token, lines), True
+            else:
+                # Another request may have placed it while we waited for the lines.
+                order = Order.objects.filter(checkout_token=checkout_token).first()
+                if order is None:
+                    raise CheckoutExpired(checkout_token)
+        if order.user_id != user.pk:
+            raise CheckoutTokenTaken(checkout_token)
+    return order, created
+
+
+def _create(user, checkout_token, lines):
+    order = Order.objects.create(
+        user=user,
+        checkout_token=checkout_token,
+        total=sum(line.unit_price * line.quantity for line in lines),
+    )
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product=line.product,
+            product_name=line.product.name,
+            category=line.product.category,
+            unit_price=line.unit_price,
+            quantity=line.quantity,
+        )
+        for line in lines
+    ])
+    sales.record_orders([order.id])
+
+    message = f"Hi {user.username},\n\nYour order was successful:\n\n"
+    message += '\n'.join(
+        f"{line.product.name} x {line.quantity} - ₹{line.unit_price * line.quantity}" for line in lines
+    )
+    message += "\n\nWe'll notify you once it's shipped!\n\nTeam E-Commerce"
+    enqueue_email('Thank you for your order!', message, [user.email])
+
+    cart = get_cart_store()
+    for line in lines:
+        cart.delete(user, line.product_id)
+    return order
+
+
+def set_status(order_ids, status):
+    """
+    Move the given orders to ``status`` with one ``UPDATE`` and keep the
+    sales rollups in step. Returns how many orders changed status.
+    """
+    with transaction.atomic():
+        previous = dict(
+            Order.objects.select_for_update().filter(id__in=order_ids).exclude(status=status)
+            .values_list('id', 'status')
+        )
+        Order.objects.filter(id__in=previous).update(status=status)
+        sales.status_changed({order_id: (old, status) for order_id, old in previous.items()})
+    return len(previous)
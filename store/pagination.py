@@ -0,0 +1,141 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are addressed by an opaque cursor holding the ordering-key values of
+the row at the page boundary, so fetching any page is a single indexed
+range scan with ``LIMIT per_page + 1``. No ``COUNT(*)`` is issued and there
+is no ``OFFSET`` that grows with page depth.
+"""
+import base64
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds datetimes to milliseconds, which would make
+    # the boundary row compare unequal to itself.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, backwards=False):
+    payload = {'v': values, 'b': backwards}
+    raw = json.dumps(payload, cls=_CursorEncoder, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        return list(payload['v']), bool(payload['b'])
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(token)
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` by its ``order_by()`` fields.
+
+    The ordering must be total (end with a unique field such as ``id``),
+    e.g. ``Product.objects.order_by('-created_at', '-id')``.
+    """
+
+    def __init__(self, queryset, per_page):
+        ordering = queryset.query.order_by
+        if not ordering:
+            raise ValueError("KeysetPaginator needs an explicitly ordered queryset.")
+        self.queryset = queryset
+        self.per_page = per_page
+        self.keys = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+    def _key_values(self, obj):
+        return [getattr(obj, name) for name, _ in self.keys]
+
+    def _after(self, values, backwards):
+        # (a, b) > (x, y)  ==  a > x OR (a = x AND b > y), per key direction.
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.keys, values):
+            forward_lookup = 'lt' if descending else 'gt'
+            backward_lookup = 'gt' if descending else 'lt'
+            lookup = backward_lookup if backwards else forward_lookup
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _reversed_ordering(self):
+        return [name if descending else f'-{name}' for name, descending in self.keys]
+
+    def get_page(self, cursor=None):
+        values, backwards = None, False
+        if cursor:
+            try:
+                values, backwards = decode_cursor(cursor)
+            except InvalidCursor:
+                values = None
+            if values is not None and len(values) != len(self.keys):
+                values, backwards = None, False
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._after(values, backwards))
+        if backwards:
+            queryset = queryset.order_by(*self._reversed_ordering())
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or backwards:
+                next_cursor = encode_cursor(self._key_values(rows[-1]))
+            if (has_more and backwards) or (values is not None and not backwards):
+                previous_cursor = encode_cursor(self._key_values(rows[0]), backwards=True)
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+    def cursor_for_offset(self, offset):
+        """
+        Cursor for the page starting at ``offset``, used to redirect legacy
+        page-number URLs. Costs one OFFSET query, once.
+        """
+        if offset <= 0:
+            return None
+        boundary = list(self.queryset[offset - 1:offset])
+        if not boundary:
+            return None
+        return encode_cursor(self._key_values(boundary[0]))
@@ -0,0 +1,298 @@
+"""
+Checkout gateway.
+
+Views talk to ``start_checkout()``, ``get_checkout()`` and ``parse_webhook()``; the actual
+payment provider is a pluggable backend chosen by ``settings.PAYMENT_BACKEND``:
+
+* ``StripeBackend`` holds one ``StripeClient`` per process on top of a
+  pooled, keep-alive ``requests.Session``, so checkouts reuse warm TLS
+  connections instead of paying a handshake per API call.
+* ``StubBackend`` answers in-process without network access, with an
+  optional artificial latency, for local development, tests and benchmarks.
+
+Async views use ``astart_checkout()``. Its backend calls are awaited, so a
+slow provider round-trip no longer holds a worker: ``StripeBackend`` sends
+them through an ``httpx`` client, one per event loop, and the stub sleeps
+with ``asyncio.sleep``.
+
+A checkout session carries the id of the user who started it as its
+``client_reference_id``; ``get_checkout()`` asks the provider for a session's
+payment status and that reference, so a success URL is only honoured for
+the buyer who actually paid.
+
+Each product is synced to a Stripe Price once and the id is cached on the
+row (``stripe_price_id`` / ``stripe_price_amount``); checkout sessions then
+reference prices by id instead of rebuilding inline ``price_data``. A price
+change makes the cached id stale and a new Price is created on next use, as
+Stripe Prices are immutable.
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+import weakref
+
+import requests
+import stripe
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+CURRENCY = 'inr'
+
+
+class WebhookError(Exception):
+    pass
+
+
+class CheckoutSession:
+    def __init__(self, id, url=None, paid=False, reference=None):
+        self.id = id
+        self.url = url
+        self.paid = paid
+        self.reference = reference
+
+
+def to_minor_units(amount):
+    return int(amount * 100)  # ₹ to paise
+
+
+class StripeBackend:
+    def __init__(self):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+        session.mount('https://', adapter)
+        http_client = stripe.RequestsClient(session=session, timeout=(5, 30))
+        self.client = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY,
+            http_client=http_client,
+            max_network_retries=2,
+        )
+        # httpx's pooled connections belong to the loop that opened them.
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = stripe.StripeClient(
+                settings.STRIPE_SECRET_KEY,
+                http_client=stripe.HTTPXClient(timeout=30),
+                max_network_retries=2,
+            )
+        return client
+
+    def _price_params(self, product, unit_amount):
+        return {
+            'currency': CURRENCY,
+            'unit_amount': unit_amount,
+            'product_data': {'name': product.name},
+            'metadata': {'product_id': str(product.pk)},
+        }
+
+    def _session_params(self, line_items, success_url, cancel_url, expires_at, reference):
+        params = {
+            'payment_method_types': ['card'],
+            'line_items': line_items,
+            'mode': 'payment',
+            'success_url': success_url,
+            'cancel_url': cancel_url,
+        }
+        if reference is not None:
+            params['client_reference_id'] = reference
+        if expires_at is not None:
+            # Stripe accepts 30 minutes to 24 hours from now.
+            params['expires_at'] = int(expires_at.timestamp())
+        return params
+
+    def create_price(self, product, unit_amount):
+        return self.client.prices.create(params=self._price_params(product, unit_amount)).id
+
+    async def acreate_price(self, product, unit_amount):
+        price = await self._async_client().prices.create_async(params=self._price_params(product, unit_amount))
+        return price.id
+
+    def create_checkout_session(self, line_items, success_url, cancel_url, expires_at=None, reference=None):
+        session = self.client.checkout.sessions.create(
+            params=self._session_params(line_items, success_url, cancel_url, expires_at, reference),
+        )
+        return CheckoutSession(session.id, session.url)
+
+    async def acreate_checkout_session(self, line_items, success_url, cancel_url, expires_at=None,
+                                       reference=None):
+        session = await self._async_client().checkout.sessions.create_async(
+            params=self._session_params(line_items, success_url, cancel_url, expires_at, reference),
+        )
+        return CheckoutSession(session.id, session.url)
+
+    def _checkout(self, session):
+        return CheckoutSession(session.id, session.url, session.payment_status == 'paid', session.client_reference_id)
+
+    def get_checkout_session(self, session_id):
+        try:
+            return self._checkout(self.client.checkout.sessions.retrieve(session_id))
+        except stripe.InvalidRequestError:
+            return None
+
+    async def aget_checkout_session(self, session_id):
+        try:
+            return self._checkout(await self._async_client().checkout.sessions.retrieve_async(session_id))
+        except stripe.InvalidRequestError:
+            return None
+
+    def parse_webhook(self, payload, signature):
+        try:
+            return self.client.construct_event(payload, signature, settings.STRIPE_WEBHOOK_SECRET)
+        except (ValueError, stripe.SignatureVerificationError) as exc:
+            raise WebhookError(str(exc)) from exc
+
+
+class StubBackend:
+    """
+    In-process stand-in for Stripe. Never use it in production: it accepts
+    any webhook payload without verifying a signature. There is no payment
+    page, so sessions count as paid as soon as they exist; tests can take
+    an id out of ``paid``.
+    """
+
+    def __init__(self):
+        self.latency = getattr(settings, 'PAYMENT_STUB_LATENCY', 0)
+        self.sessions = {}  # session id -> line items
+        self.references = {}
+        self.paid = set()
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    async def _await(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def create_price(self, product, unit_amount):
+        self._wait()
+        return f'price_stub_{product.pk}_{unit_amount}'
+
+    async def acreate_price(self, product, unit_amount):
+        await self._await()
+        return f'price_stub_{product.pk}_{unit_amount}'
+
+    def _session(self, line_items, success_url, reference):
+        session_id = f'cs_stub_{uuid.uuid4().hex}'
+        with self._lock:
+            self.sessions[session_id] = line_items
+            self.references[session_id] = reference
+            self.paid.add(session_id)
+        return CheckoutSession(session_id, success_url.replace('{CHECKOUT_SESSION_ID}', session_id))
+
+    def create_checkout_session(self, line_items, success_url, cancel_url, expires_at=None, reference=None):
+        self._wait()
+        return self._session(line_items, success_url, reference)
+
+    async def acreate_checkout_session(self, line_items, success_url, cancel_url, expires_at=None,
+                                       reference=None):
+        await self._await()
+        return self._session(line_items, success_url, reference)
+
+    def _lookup(self, session_id):
+        if session_id not in self.sessions:
+            return None
+        return CheckoutSession(session_id, paid=session_id in self.paid, reference=self.references[session_id])
+
+    def get_checkout_session(self, session_id):
+        self._wait()
+        return self._lookup(session_id)
+
+    async def aget_checkout_session(self, session_id):
+        await self._await()
+        return self._lookup(session_id)
+
+    def parse_webhook(self, payload, signature):
+        try:
+            event = json.loads(payload)
+        except ValueError as exc:
+            raise WebhookError(str(exc)) from exc
+        if not isinstance(event, dict) or 'type' not in event or 'object' not in event.get('data', {}):
+            raise WebhookError("Malformed event payload.")
+        return event
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if not settings.PAYMENT_BACKEND:
+                    raise ImproperlyConfigured(
+                        "No payment backend: set STRIPE_SECRET_KEY, or PAYMENT_BACKEND to use the stub outside DEBUG."
+                    )
+                _backend = import_string(settings.PAYMENT_BACKEND)()
+    return _backend
+
+
+def reset_backend():
+    global _backend
+    _backend = None
+
+
+def price_id_for(product, backend=None):
+    """Return a Price id for ``product``'s current price, creating one if needed."""
+    amount = to_minor_units(product.price)
+    if product.stripe_price_id and product.stripe_price_amount == amount:
+        return product.stripe_price_id
+    price_id = (backend or get_backend()).create_price(product, amount)
+    Product.objects.filter(pk=product.pk).update(stripe_price_id=price_id, stripe_price_amount=amount)
+    product.stripe_price_id, product.stripe_price_amount = price_id, amount
+    return price_id
+
+
+async def aprice_id_for(product, backend=None):
+    amount = to_minor_units(product.price)
+    if product.stripe_price_id and product.stripe_price_amount == amount:
+        return product.stripe_price_id
+    price_id = await (backend or get_backend()).acreate_price(product, amount)
+    await Product.objects.filter(pk=product.pk).aupdate(stripe_price_id=price_id, stripe_price_amount=amount)
+    product.stripe_price_id, product.stripe_price_amount = price_id, amount
+    return price_id
+
+
+def start_checkout(cart, success_url, cancel_url, expires_at=None, reference=None):
+    """``reference`` identifies the buyer; pass ``str(user.pk)``."""
+    backend = get_backend()
+    line_items = [
+        {'price': price_id_for(line.product, backend), 'quantity': line.quantity}
+        for line in cart
+    ]
+    return backend.create_checkout_session(line_items, success_url, cancel_url, expires_at, reference)
+
+
+async def astart_checkout(cart, success_url, cancel_url, expires_at=None, reference=None):
+    backend = get_backend()
+    # Missing prices are created concurrently rather than one round-trip each.
+    price_ids = await asyncio.gather(*(aprice_id_for(line.product, backend) for line in cart))
+    line_items = [
+        {'price': price_id, 'quantity': line.quantity}
+        for price_id, line in zip(price_ids, cart)
+    ]
+    return await backend.acreate_checkout_session(line_items, success_url, cancel_url, expires_at, reference)
+
+
+def get_checkout(session_id):
+    """The provider's view of a checkout session, or ``None`` if it doesn't know the id."""
+    return get_backend().get_checkout_session(session_id)
+
+
+async def aget_checkout(session_id):
+    return await get_backend().aget_checkout_session(session_id)
+
+
+def parse_webhook(payload, signature):
+    return get_backend().parse_webhook(payload, signature)
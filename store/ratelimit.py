@@ -0,0 +1,140 @@
+"""
+Token-bucket rate limiting for expensive routes.
+
+``settings.RATE_LIMITS`` maps URL names from ``store/urls.py`` to limits,
+each a bucket key (``'ip'`` or ``'user'``) and a rate such as ``'10/m'``:
+a bucket of 10 tokens that refills at 10 per minute, so bursts up to the
+capacity pass and sustained traffic is held to the rate. Only unsafe
+methods are limited; rendering a login form costs nothing, checking its
+password costs a PBKDF2 hash. ``RateLimitMiddleware`` answers a request
+that finds any of its buckets empty with ``429`` and a ``Retry-After``.
+
+Buckets live in the cache and are kept as GCRA (the "generic cell rate
+algorithm"): one integer per bucket, the time at which it will be full
+again, advanced with an atomic ``incr`` per request. There is no lock and
+no read-modify-write; the one exception is a bucket that has been idle
+long enough to be full, which is reset with ``set``. A race there can let
+at most one extra request per concurrent caller through. ``incr`` is
+atomic on Redis, Memcached and local memory; the database and file caches
+emulate it with a read and a write, so concurrent requests there can slip
+past a limit.
+If the cache fails, requests are let through rather than turned away.
+"""
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .caching import make_key
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS', 'TRACE'}
+
+
+def parse_rate(rate):
+    """``'10/m'`` -> ``(10, 60)``: capacity and the seconds it takes to refill."""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period]
+
+
+def client_ip(request):
+    # Behind N trusted proxies the client is the Nth address from the right
+    # of X-Forwarded-For; anything left of it can be forged by the client.
+    # Fewer addresses mean the request came in past the outer proxies, and
+    # the leftmost one is then the client.
+    proxies = getattr(settings, 'RATE_LIMIT_PROXY_COUNT', 0)
+    forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+    if proxies and forwarded:
+        return forwarded[-min(proxies, len(forwarded))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def take(key, capacity, period):
+    """
+    Take a token from the bucket ``key``. Returns 0 if one was available,
+    otherwise the seconds until one will be.
+    """
+    interval = period * 1000 // capacity  # ms per token
+    tolerance = interval * (capacity - 1)  # how far ahead of now the bucket may run
+    timeout = period * 10
+    now = _now_ms()
+    try:
+        cache.add(key, now, timeout)
+        tat = cache.incr(key, interval)
+        if tat - interval < now:
+            # Idle long enough to be full: restart from now.
+            tat = now + interval
+            cache.set(key, tat, timeout)
+        if tat - interval > now + tolerance:
+            # Denied requests don't spend a token.
+            cache.decr(key, interval)
+            return math.ceil((tat - interval - tolerance - now) / 1000)
+    except Exception:
+        # A missing or unreachable cache must not lock everyone out.
+        logger.warning("Rate limit check for %s failed; allowing the request", key, exc_info=True)
+    return 0
+
+
+def check(request, route):
+    """Seconds the client must wait before ``route`` accepts this request; 0 if it may go ahead."""
+    limits = getattr(settings, 'RATE_LIMITS', {}).get(route)
+    if not limits or request.method in SAFE_METHODS or not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+        return 0
+    wait = 0
+    for scope, rate in limits.items():
+        if scope == 'ip':
+            identity = client_ip(request)
+        elif request.user.is_authenticated:
+            identity = request.user.pk
+        else:
+            continue
+        capacity, period = parse_rate(rate)
+        wait = max(wait, take(make_key('ratelimit', route, scope, rate, identity), capacity, period))
+    return wait
+
+
+def too_many_requests(request, wait):
+    message = f"Too many requests. Try again in {wait} seconds."
+    if 'application/json' in request.headers.get('Accept', ''):
+        response = JsonResponse({'error': message}, status=429)
+    else:
+        response = HttpResponse(message, status=429, content_type='text/plain')
+    response['Retry-After'] = str(wait)
+    return response
+
+
+class RateLimitMiddleware:
+    """Applies ``settings.RATE_LIMITS`` by URL name, once the URL is resolved."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        wait = check(request, request.resolver_match.url_name)
+        if wait:
+            return too_many_requests(request, wait)
+        return None
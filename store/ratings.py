@@ -0,0 +1,59 @@
+"""
+Denormalized rating aggregates on ``Product``.
+
+Every change is a single conditional ``UPDATE`` built from ``F()``
+expressions, so concurrent reviews never lose an increment, and listings can
+read or sort by ``rating_avg`` without touching the ``Review`` table. The
+same ``UPDATE`` stamps ``updated_at``, which ``update()`` would otherwise
+leave alone, so API validators see review changes too.
+"""
+from django.db.models import Avg, Case, Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from .models import Product, Review
+
+
+def _apply(product_id, count_delta, sum_delta):
+    new_count = F('review_count') + count_delta
+    new_sum = F('rating_sum') + sum_delta
+    Product.objects.filter(pk=product_id).update(
+        review_count=new_count,
+        rating_sum=new_sum,
+        # SET expressions see the pre-update row, so recompute from the deltas.
+        rating_avg=Case(
+            When(review_count__lte=-count_delta, then=Value(0.0)),
+            default=Cast(new_sum, FloatField()) / Cast(new_count, FloatField()),
+            output_field=FloatField(),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def review_added(product_id, rating):
+    _apply(product_id, 1, rating)
+
+
+def review_removed(product_id, rating):
+    _apply(product_id, -1, -rating)
+
+
+def review_changed(product_id, old_rating, new_rating):
+    # Applied even when the rating is unchanged: an edited comment still
+    # changes the product's reviews.
+    _apply(product_id, 0, new_rating - old_rating)
+
+
+def rebuild():
+    """Recompute every product's aggregates with one set-based UPDATE."""
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        review_count=Coalesce(Subquery(reviews.annotate(n=Count('id')).values('n')), 0),
+        rating_sum=Coalesce(
+            Subquery(reviews.annotate(s=Sum('rating')).values('s'), output_field=IntegerField()), 0,
+        ),
+        rating_avg=Coalesce(
+            Subquery(reviews.annotate(a=Avg('rating')).values('a'), output_field=FloatField()), 0.0,
+        ),
+        updated_at=timezone.now(),
+    )
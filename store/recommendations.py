@@ -0,0 +1,171 @@
+"""
+"Customers also bought" recommendations.
+
+``build()`` folds new orders into ``CoPurchase`` (one row per ordered pair
+of products that appeared in the same order, with a count) and then rewrites
+``Product.recommended_ids`` with the top ``TOP_N`` neighbours of every
+product it touched. It is incremental: each pass records a
+``RecommendationRun`` whose ``last_order_id`` is where the next pass starts,
+so a nightly ``manage.py build_recommendations`` only reads that day's
+orders. ``related_products()`` serves a product page from the precomputed
+ids with a primary-key lookup, topping up with category peers for products
+nobody has bought yet.
+
+Cancelled orders are skipped when they are first read; an order cancelled
+after it was counted stays counted until ``build(full=True)``.
+"""
+from collections import Counter
+from datetime import timedelta
+from itertools import combinations, groupby
+
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.db.models.functions import RowNumber
+from django.db.models.expressions import Window
+from django.utils import timezone
+
+from . import caching
+from .models import CoPurchase, Order, OrderItem, Product, RecommendationRun
+
+TOP_N = 10
+ORDER_CHUNK = 20_000
+FLUSH_PAIRS = 200_000
+PRODUCT_CHUNK = 500
+# Orders younger than this are left for the next pass, so an order whose
+# transaction commits after a later id was already counted is not skipped.
+SETTLE = timedelta(minutes=5)
+
+
+def _watermark():
+    run = RecommendationRun.objects.order_by('-id').first()
+    return run.last_order_id if run else 0
+
+
+def _pairs(order_ids_and_products):
+    """Count each unordered pair once per order, in both directions."""
+    counts = Counter()
+    for _, rows in groupby(order_ids_and_products, key=lambda row: row[0]):
+        products = sorted({product_id for _, product_id in rows})
+        for a, b in combinations(products, 2):
+            counts[a, b] += 1
+            counts[b, a] += 1
+    return counts
+
+
+def _flush(counts):
+    if not counts:
+        return
+    rows = [(a, b, n) for (a, b), n in counts.items()]
+    if connection.vendor in ('sqlite', 'postgresql'):
+        qn = connection.ops.quote_name
+        table = qn(CoPurchase._meta.db_table)
+        sql = (
+            f"INSERT INTO {table} ({qn('product_id')}, {qn('other_id')}, {qn('count')}) "
+            f"VALUES (%s, %s, %s) "
+            f"ON CONFLICT ({qn('product_id')}, {qn('other_id')}) "
+            f"DO UPDATE SET {qn('count')} = {table}.{qn('count')} + excluded.{qn('count')}"
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        return
+    existing = {
+        (row.product_id, row.other_id): row
+        for row in CoPurchase.objects.filter(product_id__in={a for a, _ in counts})
+        if (row.product_id, row.other_id) in counts
+    }
+    for key, row in existing.items():
+        row.count += counts[key]
+    CoPurchase.objects.bulk_update(existing.values(), ['count'], batch_size=1000)
+    CoPurchase.objects.bulk_create(
+        [CoPurchase(product_id=a, other_id=b, count=n) for a, b, n in rows if (a, b) not in existing],
+        batch_size=1000,
+    )
+
+
+def _rank(product_ids):
+    """Rewrite ``recommended_ids`` for ``product_ids`` from ``CoPurchase``."""
+    product_ids = sorted(product_ids)
+    updated = 0
+    for start in range(0, len(product_ids), PRODUCT_CHUNK):
+        chunk = product_ids[start:start + PRODUCT_CHUNK]
+        ranked = (
+            CoPurchase.objects.filter(product_id__in=chunk)
+            .annotate(position=Window(
+                RowNumber(),
+                partition_by=F('product_id'),
+                order_by=[F('count').desc(), F('other_id').asc()],
+            ))
+            .filter(position__lte=TOP_N)
+            .order_by('product_id', 'position')
+            .values_list('product_id', 'other_id')
+        )
+        neighbours = {product_id: [] for product_id in chunk}
+        for product_id, other_id in ranked:
+            neighbours[product_id].append(other_id)
+        products = [Product(pk=product_id, recommended_ids=ids) for product_id, ids in neighbours.items()]
+        updated += Product.objects.bulk_update(products, ['recommended_ids'], batch_size=PRODUCT_CHUNK)
+    return updated
+
+
+def build(full=False, now=None):
+    """
+    Fold orders placed since the last run into the index and return the
+    new ``RecommendationRun`` (or ``None`` when there was nothing to do).
+    ``full=True`` discards the index and rebuilds it from every order.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        if full:
+            CoPurchase.objects.all().delete()
+            RecommendationRun.objects.all().delete()
+            if Product.objects.exclude(recommended_ids=[]).update(recommended_ids=[]):
+                # Pages still show the old picks, even if no orders are left to index.
+                transaction.on_commit(caching.invalidate_catalog)
+        start = _watermark()
+        end = Order.objects.filter(id__gt=start, ordered_at__lt=now - SETTLE).aggregate(end=Max('id'))['end']
+        if end is None:
+            return None
+
+        touched = set()
+        counts = Counter()
+        processed = 0
+        for low in range(start, end, ORDER_CHUNK):
+            high = min(low + ORDER_CHUNK, end)
+            rows = (
+                OrderItem.objects.filter(order_id__gt=low, order_id__lte=high, product__isnull=False)
+                .exclude(order__status='cancelled')
+                .order_by('order_id')
+                .values_list('order_id', 'product_id')
+            )
+            chunk_counts = _pairs(rows.iterator(chunk_size=ORDER_CHUNK))
+            processed += Order.objects.filter(id__gt=low, id__lte=high).exclude(status='cancelled').count()
+            counts.update(chunk_counts)
+            if len(counts) >= FLUSH_PAIRS:
+                touched.update(a for a, _ in counts)
+                _flush(counts)
+                counts = Counter()
+        touched.update(a for a, _ in counts)
+        _flush(counts)
+
+        updated = _rank(touched)
+        run = RecommendationRun.objects.create(
+            last_order_id=end, orders_processed=processed, products_updated=updated,
+        )
+    if updated:
+        caching.invalidate_catalog()
+    return run
+
+
+def related_products(product, limit=3):
+    """Up to ``limit`` products bought with ``product``, topped up from its category."""
+    ids = product.recommended_ids[:limit]
+    found = Product.objects.in_bulk(ids) if ids else {}
+    related = [found[product_id] for product_id in ids if product_id in found]
+    if len(related) < limit:
+        # Cold start: nobody has bought this product alongside anything yet.
+        related += list(
+            Product.objects.filter(category=product.category)
+            .exclude(id__in=[product.id, *found])
+            .order_by('-rating_avg', '-id')[:limit - len(related)]
+        )
+    return related
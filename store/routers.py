@@ -0,0 +1,136 @@
+"""
+Primary/replica database routing.
+
+All writes go to ``default``, the primary. Reads of ``Product`` and
+``Review`` go to one of ``settings.DATABASE_REPLICAS``, but only inside
+views decorated with ``replica_reads`` (the catalog pages); everything
+else, including background jobs, keeps reading the primary.
+
+Replicas lag, so a visitor who has just written is pinned to the primary:
+the router notes any write to a ``store`` model made while handling a
+request, and ``ReplicaPinMiddleware`` answers such requests with a
+short-lived cookie (``REPLICA_PIN_SECONDS``). While the cookie is present,
+and for the rest of the request that wrote, reads stay on the primary, so
+a new review shows up on the page the visitor is redirected to. Session
+and auth writes don't pin: they never affect catalog reads.
+
+Anything computed for a shared cache (``store.caching.get_or_compute``:
+cached pages, template fragments, facet counts) reads the primary through
+``primary_reads``. A lagging replica would otherwise get its stale rows
+cached under the current catalog version, where every visitor would see
+them until the next change.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PIN_COOKIE = 'primary_pin'
+REPLICATED_MODELS = {'product', 'review'}
+
+_request_state = ContextVar('store_replica_request', default=None)
+_replica_reads = ContextVar('store_replica_reads', default=False)
+
+
+class _RequestState:
+    # Mutated rather than replaced: writes made in sync_to_async threads
+    # must be visible to the middleware.
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def replica_reads(view):
+    """Let a view's catalog reads go to a replica unless the visitor is pinned."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        token = _replica_reads.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapped
+
+
+@contextmanager
+def primary_reads():
+    """Send the reads in this block to the primary, even inside ``replica_reads``."""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'store' or model._meta.model_name not in REPLICATED_MODELS:
+            return None
+        aliases = replicas()
+        state = _request_state.get()
+        if not aliases or not _replica_reads.get() or state is None or state.pinned or state.wrote:
+            return None
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and model._meta.app_label == 'store':
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        cluster = {'default', *replicas()}
+        if obj1._state.db in cluster and obj2._state.db in cluster:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        return db not in replicas()
+
+
+class ReplicaPinMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = _RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self._pin(state, response)
+
+    async def __acall__(self, request):
+        state = _RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self._pin(state, response)
+
+    def _pin(self, state, response):
+        if state.wrote and replicas():
+            response.set_cookie(PIN_COOKIE, '1', max_age=pin_seconds(), httponly=True, samesite='Lax')
+        return response
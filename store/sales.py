@@ -0,0 +1,134 @@
+"""
+Daily sales rollups for the staff dashboard.
+
+``DailySales``, ``DailyCategorySales`` and ``DailyProductSales`` hold units,
+revenue and order counts per day, per day and category, and per day and
+product. Only orders that aren't cancelled count. The dashboard reads
+nothing else, so its cost depends on the number of days shown, not on the
+number of orders.
+
+The rollups are kept current incrementally: ``place_order`` records each
+new order, and status changes into or out of ``cancelled`` retract or
+re-record it (``store.orders.set_status`` for bulk changes, signals for
+single saves). Each change inserts any missing rows and then applies
+``F()`` increments, so concurrent orders never lose an update. Orders
+written another way (``seed_data``, raw SQL) are picked up by
+``manage.py rebuild_sales``, which recomputes everything from ``OrderItem``.
+
+Days are calendar days in ``TIME_ZONE``. Category and product name come
+from the ``OrderItem`` snapshot, so recategorizing or deleting a product
+doesn't rewrite history; items whose product is gone still count towards
+their day and category.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyCategorySales, DailyProductSales, DailySales, OrderItem
+
+NOT_COUNTED = {'cancelled'}
+
+# (model, key fields) per rollup table.
+TABLES = (
+    (DailySales, ('day',)),
+    (DailyCategorySales, ('day', 'category')),
+    (DailyProductSales, ('day', 'category', 'product_id')),
+)
+
+
+def counts(status):
+    return status not in NOT_COUNTED
+
+
+class _Totals:
+    def __init__(self):
+        self.units = 0
+        self.revenue = Decimal('0')
+        self.order_ids = set()
+        self.product_name = ''
+
+
+def _deltas(order_ids):
+    """Per-table ``{key: _Totals}`` for the given orders' items."""
+    deltas = {model: defaultdict(_Totals) for model, _ in TABLES}
+    items = OrderItem.objects.filter(order_id__in=order_ids).values_list(
+        'order_id', 'order__ordered_at', 'product_id', 'product_name', 'category', 'unit_price', 'quantity',
+    )
+    for order_id, ordered_at, product_id, product_name, category, unit_price, quantity in items:
+        day = timezone.localdate(ordered_at)
+        keys = [(DailySales, (day,)), (DailyCategorySales, (day, category))]
+        if product_id is not None:
+            keys.append((DailyProductSales, (day, category, product_id)))
+        for model, key in keys:
+            totals = deltas[model][key]
+            totals.units += quantity
+            totals.revenue += unit_price * quantity
+            totals.order_ids.add(order_id)
+            totals.product_name = product_name
+    return deltas
+
+
+def _labels(model, totals):
+    return {'product_name': totals.product_name} if model is DailyProductSales else {}
+
+
+def _apply(order_ids, sign):
+    if not order_ids:
+        return
+    deltas = _deltas(order_ids)
+    for model, fields in TABLES:
+        rows = deltas[model]
+        if not rows:
+            continue
+        # Make sure every row exists, then increment; neither step can
+        # lose a concurrent order's update.
+        model.objects.bulk_create(
+            [model(**dict(zip(fields, key)), **_labels(model, totals)) for key, totals in rows.items()],
+            ignore_conflicts=True,
+        )
+        for key, totals in rows.items():
+            model.objects.filter(**dict(zip(fields, key))).update(
+                units=F('units') + sign * totals.units,
+                revenue=F('revenue') + sign * totals.revenue,
+                orders=F('orders') + sign * len(totals.order_ids),
+            )
+
+
+def record_orders(order_ids):
+    """Add these orders, whose items must already exist, to the rollups."""
+    _apply(order_ids, 1)
+
+
+def retract_orders(order_ids):
+    _apply(order_ids, -1)
+
+
+def status_changed(changes):
+    """Apply ``{order_id: (old_status, new_status)}`` to the rollups."""
+    entering = [order_id for order_id, (old, new) in changes.items() if not counts(old) and counts(new)]
+    leaving = [order_id for order_id, (old, new) in changes.items() if counts(old) and not counts(new)]
+    record_orders(entering)
+    retract_orders(leaving)
+
+
+def rebuild():
+    """Recompute every rollup from ``OrderItem`` with one GROUP BY per table."""
+    items = OrderItem.objects.exclude(order__status__in=NOT_COUNTED).annotate(
+        day=TruncDate('order__ordered_at'),
+    ).order_by()
+    totals = {
+        'units': Sum('quantity'),
+        'revenue': Sum(F('unit_price') * F('quantity')),
+        'orders': Count('order', distinct=True),
+    }
+    for model, fields in TABLES:
+        model.objects.all().delete()
+        rows = items
+        if model is DailyProductSales:
+            rows = rows.filter(product_id__isnull=False)
+            totals['product_name'] = Max('product_name')
+        rows = rows.values(*fields).annotate(**totals)
+        model.objects.bulk_create((model(**row) for row in rows.iterator()), batch_size=1000)
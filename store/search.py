@@ -0,0 +1,131 @@
+"""
+Full-text product search.
+
+SQLite uses an external-content FTS5 table (``store_product_fts``) kept in
+sync with ``store_product`` by triggers; PostgreSQL uses a generated
+``search_vector`` tsvector column with a GIN index. Both are created by
+migration ``0006_product_search_index`` and rank matches by relevance, with
+product names weighted above descriptions. Any other backend falls back to
+the old ``icontains`` scan.
+
+Django rebuilds SQLite tables for many schema changes, which silently drops
+their triggers, so ``ensure_index`` re-creates any missing trigger after
+every ``migrate`` run.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'store_product_fts'
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+SQLITE_TRIGGERS = {
+    'store_product_fts_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS store_product_fts_ai AFTER INSERT ON store_product BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    """,
+    'store_product_fts_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS store_product_fts_ad AFTER DELETE ON store_product BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+    """,
+    'store_product_fts_au': f"""
+        CREATE TRIGGER IF NOT EXISTS store_product_fts_au AFTER UPDATE OF name, description ON store_product BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO {FTS_TABLE}(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    """,
+}
+
+
+def _terms(query):
+    return _WORD_RE.findall(query.lower())
+
+
+def _fts5_match(query):
+    # Quote every term so user input can't inject FTS5 syntax, and prefix
+    # match the last one so partially typed words still hit.
+    terms = _terms(query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _search_sqlite(queryset, query):
+    match = _fts5_match(query)
+    if match is None:
+        return queryset
+    # The FTS table is joined in with extra() so bm25() is evaluated once
+    # per matching row rather than through a correlated subquery. bm25() is
+    # "lower is better"; negate it so every backend ranks descending.
+    rank = RawSQL(f'-bm25({FTS_TABLE}, 10.0, 1.0)', [], output_field=FloatField())
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = store_product.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+    ).annotate(search_rank=rank).order_by('-search_rank', '-id')
+
+
+def _search_postgresql(queryset, query):
+    tsquery = "websearch_to_tsquery('english', %s)"
+    matches = RawSQL(f'store_product.search_vector @@ {tsquery}', [query], output_field=BooleanField())
+    rank = RawSQL(f'ts_rank(store_product.search_vector, {tsquery})', [query], output_field=FloatField())
+    return queryset.filter(matches).annotate(search_rank=rank).order_by('-search_rank', '-id')
+
+
+def icontains_search(queryset, query):
+    return queryset.filter(name__icontains=query) | queryset.filter(description__icontains=query)
+
+
+def search_products(queryset, query):
+    """
+    Restrict a ``Product`` queryset to matches for ``query``.
+
+    Ranked backends annotate ``search_rank`` and order by
+    ``('-search_rank', '-id')``, which is a total order usable for keyset
+    pagination; the fallback keeps the incoming ordering.
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(queryset, query)
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(queryset, query)
+    return icontains_search(queryset, query)
+
+
+def ensure_index(using='default', **kwargs):
+    """``post_migrate`` hook: restore SQLite sync triggers lost to table rebuilds."""
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        tables = conn.introspection.table_names(cursor)
+        if FTS_TABLE not in tables:
+            return
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in SQLITE_TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        if missing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+
+
+def rebuild_index():
+    """Repopulate the search index from ``store_product``."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+    # The PostgreSQL column is GENERATED ALWAYS, so it never goes stale.
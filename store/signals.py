@@ -0,0 +1,102 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import caching, ratings, sales, tasks, typeahead
+from .images import needs_derivatives
+from .models import Order, Product, Review, Wishlist
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = (
+            Review.objects.filter(pk=instance.pk).values_list('rating', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    if created or previous is None:
+        ratings.review_added(instance.product_id, instance.rating)
+    else:
+        ratings.review_changed(instance.product_id, previous, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    ratings.review_removed(instance.product_id, instance.rating)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    caching.invalidate_product(instance.pk)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_cache(sender, instance, **kwargs):
+    # Reviews change the product's rating, which listings show too.
+    caching.invalidate_product(instance.product_id)
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_name(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._previous_name = None
+    if instance.pk and not raw and (update_fields is None or 'name' in update_fields):
+        instance._previous_name = (
+            Product.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def update_typeahead_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Only names change what the index holds; review counts are refreshed lazily.
+    if raw or (update_fields is not None and 'name' not in update_fields):
+        return
+    if created or getattr(instance, '_previous_name', None) != instance.name:
+        typeahead.names_changed()
+
+
+@receiver(post_delete, sender=Product)
+def update_typeahead_on_delete(sender, instance, **kwargs):
+    typeahead.names_changed()
+
+
+@receiver(post_save, sender=Product)
+def queue_image_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw and needs_derivatives(instance):
+        tasks.enqueue_image_derivatives(instance)
+
+
+@receiver(post_save, sender=Wishlist)
+@receiver(post_delete, sender=Wishlist)
+def invalidate_wishlist_cache(sender, instance, **kwargs):
+    caching.invalidate_wishlist(instance.user_id)
+
+
+# Single-order saves and deletes; bulk status changes go through
+# store.orders.set_status and new orders through place_order.
+@receiver(pre_save, sender=Order)
+def remember_previous_status(sender, instance, **kwargs):
+    instance._previous_status = None
+    if instance.pk:
+        instance._previous_status = (
+            Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def update_sales_on_status_change(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_status', None)
+    if not created and previous is not None and previous != instance.status:
+        sales.status_changed({instance.pk: (previous, instance.status)})
+
+
+@receiver(pre_delete, sender=Order)
+def retract_deleted_order(sender, instance, **kwargs):
+    # Before the cascade removes the items the rollups are built from.
+    if sales.counts(instance.status):
+        sales.retract_orders([instance.pk])
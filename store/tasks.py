@@ -0,0 +1,138 @@
+"""Background job handlers. See store.jobs for the queue itself."""
+import io
+
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from . import caching
+from .images import generate_derivatives
+from .jobs import enqueue, enqueue_many, handler
+from .models import Job, Product
+
+SEND_EMAIL = 'send_email'
+GENERATE_IMAGE_DERIVATIVES = 'generate_image_derivatives'
+
+
+def enqueue_email(subject, message, recipient_list, from_email=None):
+    return enqueue(SEND_EMAIL, {
+        'subject': subject,
+        'message': message,
+        'from_email': from_email,
+        'recipient_list': list(recipient_list),
+    })
+
+
+@handler(SEND_EMAIL)
+def send_emails(jobs):
+    # One SMTP connection for the whole batch; a failure only affects the
+    # message that raised it.
+    errors = []
+    with get_connection() as connection:
+        for job in jobs:
+            payload = job.payload
+            message = EmailMessage(
+                payload['subject'],
+                payload['message'],
+                payload.get('from_email'),
+                payload['recipient_list'],
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as exc:
+                errors.append(exc)
+            else:
+                errors.append(None)
+    return errors
+
+
+def _derivatives_payload(product):
+    return {'product_id': product.pk, 'image': product.image.name}
+
+
+def enqueue_image_derivatives(product):
+    return enqueue(GENERATE_IMAGE_DERIVATIVES, _derivatives_payload(product))
+
+
+def enqueue_image_derivatives_for(products):
+    return enqueue_many(GENERATE_IMAGE_DERIVATIVES, [_derivatives_payload(product) for product in products])
+
+
+@handler(GENERATE_IMAGE_DERIVATIVES)
+def build_image_derivatives(jobs):
+    errors = []
+    for job in jobs:
+        product_id, name = job.payload['product_id'], job.payload['image']
+        try:
+            derivatives = generate_derivatives(name)
+        except Exception as exc:
+            errors.append(exc)
+            continue
+        # Only store them if the product still has this image; queryset
+        # update() skips post_save, so this doesn't enqueue another job,
+        # but it also skips the cache invalidation there.
+        if Product.objects.filter(pk=product_id, image=name).update(image_derivatives=derivatives):
+            caching.invalidate_product(product_id)
+        errors.append(None)
+    return errors
+
+
+IMPORT_CATALOG = 'import_catalog'
+
+
+def enqueue_catalog_import(path, fmt):
+    # One attempt at a time is enough: a retry resumes after the rows the
+    # failed attempt already committed (see import_catalogs).
+    return enqueue(IMPORT_CATALOG, {'path': path, 'format': fmt, 'progress': {}})
+
+
+@handler(IMPORT_CATALOG)
+def import_catalogs(jobs):
+    from .catalog_io import ImportResult, import_catalog
+
+    errors = []
+    for job in jobs:
+        payload = job.payload
+
+        def report(result, job=job, payload=payload):
+            # Persist progress and renew the lease so a long import is not
+            # reclaimed by another worker while it is still running.
+            payload['progress'] = result.as_dict()
+            Job.objects.filter(pk=job.pk).update(payload=payload, locked_at=timezone.now())
+
+        try:
+            with default_storage.open(payload['path'], 'rb') as fh:
+                stream = io.TextIOWrapper(fh, encoding='utf-8-sig', newline='')
+                result = import_catalog(stream, payload['format'], progress=report,
+                                        resume=ImportResult.from_dict(payload['progress']))
+        except Exception as exc:
+            errors.append(exc)
+            continue
+        report(result)
+        default_storage.delete(payload['path'])
+        errors.append(None)
+    return errors
+
+
+RELEASE_STOCK = 'release_stock'
+
+
+def enqueue_stock_release(hold, delay):
+    return enqueue(RELEASE_STOCK, {'hold': str(hold)}, delay=delay)
+
+
+@handler(RELEASE_STOCK)
+def release_stock(jobs):
+    from .inventory import release
+
+    errors = []
+    for job in jobs:
+        try:
+            # A no-op if the checkout was paid for in the meantime.
+            release(job.payload['hold'])
+        except Exception as exc:
+            errors.append(exc)
+        else:
+            errors.append(None)
+    return errors
@@ -0,0 +1,41 @@
+from django import template
+
+from store.caching import get_or_compute, make_key
+
+register = template.Library()
+
+
+class CachedFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        parts = [self.name.resolve(context)] + [var.resolve(context) for var in self.vary_on]
+        key = make_key('fragment', *parts)
+        return get_or_compute(key, lambda: self.nodelist.render(context))
+
+
+@register.tag('cachefragment')
+def do_cachefragment(parser, token):
+    """
+    Cache the enclosed template fragment, with stampede protection::
+
+        {% cachefragment 'reviews' product.id product_cache_version %}
+            ...
+        {% endcachefragment %}
+
+    Include a cache version from ``store.caching`` among the vary-on
+    arguments so the fragment is invalidated when its data changes.
+    """
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires at least a fragment name.")
+    return CachedFragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
@@ -0,0 +1,42 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from store.images import RENDITIONS
+
+register = template.Library()
+
+
+def _srcset(urls):
+    return ', '.join(f'{url} {width}w' for width, url in sorted(urls.items(), key=lambda item: int(item[0])))
+
+
+@register.simple_tag
+def product_picture(product, rendition, css_class='', style='', alt=None):
+    """
+    Render ``product.image`` as a ``<picture>`` with WebP and fallback
+    ``srcset``s for ``rendition`` ('card', 'grid' or 'detail'). Until the
+    derivatives exist, falls back to a plain ``<img>`` of the original.
+    """
+    alt = product.name if alt is None else alt
+    if not product.image:
+        return format_html(
+            '<img src="https://via.placeholder.com/400x300?text={}" class="{}" style="{}" alt="{}">',
+            product.name, css_class, style, alt,
+        )
+    derivatives = product.image_derivatives or {}
+    sources = derivatives.get(rendition) if derivatives.get('source') == product.image.name else None
+    if not sources:
+        return format_html(
+            '<img src="{}" class="{}" style="{}" alt="{}" loading="lazy">',
+            product.image.url, css_class, style, alt,
+        )
+
+    fallback = derivatives['fallback']
+    sizes = f'{RENDITIONS[rendition]}px'
+    fallback_urls = sources[fallback]
+    smallest = fallback_urls[min(fallback_urls, key=int)]
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" class="{}" style="{}" alt="{}" loading="lazy"></picture>',
+        format_html_join('', '<source type="image/webp" srcset="{}" sizes="{}">', [(_srcset(sources['webp']), sizes)]),
+        smallest, _srcset(fallback_urls), sizes, css_class, style, alt,
+    )
@@ -1,3 +1,1678 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import get_connection
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    benchmarks, caching, catalog_io, facets, inventory, jobs, metrics, payments, ratelimit, recommendations, sales,
+    typeahead,
+)
+from . import urls as store_urls
+from .cart import DatabaseCartStore, get_cart_store, reset_cart_store
+from .images import generate_derivatives
+from .models import (
+    CartItem, CoPurchase, DailyCategorySales, DailyProductSales, DailySales, Job, Order, OrderItem, Product, Review,
+    StockReservation, Wishlist,
+)
+from .orders import CheckoutTokenTaken, place_order
+from .routers import PIN_COOKIE, PrimaryReplicaRouter, ReplicaPinMiddleware, replica_reads
+from .search import search_products
+
+
+def fill_cart(user, quantities):
+    store = get_cart_store()
+    for product, quantity in quantities.items():
+        store.set(user, product.id, quantity)
+
+
+def make_product(name='Widget', price='10.00', category='electronics', **kwargs):
+    return Product.objects.create(
+        name=name,
+        description=kwargs.pop('description', f'{name} description'),
+        price=Decimal(price),
+        image='product_images/test.jpg',
+        category=category,
+        **kwargs,
+    )
+
+
+class CartTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.client.force_login(self.user)
+
+    def count_cart_queries(self, size):
+        products = [make_product(f'P{size}-{i}') for i in range(size)]
+        fill_cart(self.user, {p: 2 for p in products})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_view_cart_query_count_is_flat(self):
+        small = self.count_cart_queries(1)
+        large = self.count_cart_queries(40)
+        self.assertEqual(small, large)
+
+    def test_view_cart_totals(self):
+        a = make_product('A', '10.00')
+        b = make_product('B', '2.50')
+        fill_cart(self.user, {a: 2, b: 3})
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.context['total'], Decimal('27.50'))
+        self.assertEqual(len(response.context['cart_items']), 2)
+
+    def test_deleted_product_is_dropped_from_cart(self):
+        a = make_product('A')
+        b = make_product('B')
+        fill_cart(self.user, {a: 1, b: 4})
+        b.delete()
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_cart_store().lines(self.user), {a.id: 1})
+
+    def test_legacy_session_cart_is_moved_into_the_store(self):
+        a = make_product('A')
+        session = self.client.session
+        session['cart'] = {str(a.id): 3}
+        session.save()
+        self.client.get(reverse('view_cart'))
+        self.assertNotIn('cart', self.client.session)
+        self.assertEqual(get_cart_store().lines(self.user), {a.id: 3})
+
+    def test_database_store_adds_to_a_line_created_concurrently(self):
+        a = make_product('A')
+        store = DatabaseCartStore()
+        raced = []
+
+        def another_request_wins(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if sql.startswith(f'UPDATE "{CartItem._meta.db_table}"') and not raced:
+                # Another request inserts the line between our UPDATE and INSERT.
+                raced.append(CartItem.objects.create(user=self.user, product=a, quantity=1))
+            return result
+
+        with connection.execute_wrapper(another_request_wins):
+            store.incr(self.user, a.id, 2)
+        self.assertTrue(raced)
+        self.assertEqual(store.lines(self.user), {a.id: 3})
+
+    def test_add_update_remove(self):
+        a = make_product('A')
+        self.client.get(reverse('add_to_cart', args=[a.id]))
+        self.client.get(reverse('add_to_cart', args=[a.id]))
+        self.assertEqual(get_cart_store().lines(self.user), {a.id: 2})
+        self.client.post(reverse('update_quantity', args=[a.id]), {'quantity': 5})
+        self.assertEqual(get_cart_store().lines(self.user), {a.id: 5})
+        self.client.get(reverse('remove_from_cart', args=[a.id]))
+        self.assertEqual(get_cart_store().lines(self.user), {})
+
+
+class SearchTests(TestCase):
+    def search(self, q):
+        response = self.client.get(reverse('product_list'), {'q': q})
+        return [p.name for p in response.context['products']]
+
+    def test_name_matches_rank_above_description_matches(self):
+        make_product('Plain Mug', description='Goes well with a teapot')
+        make_product('Teapot', description='Ceramic')
+        self.assertEqual(self.search('teapot'), ['Teapot', 'Plain Mug'])
+
+    def test_index_follows_saves_and_deletes(self):
+        product = make_product('Lamp', description='Adjustable')
+        self.assertEqual(self.search('lamp'), ['Lamp'])
+        product.name = 'Desk light'
+        product.save()
+        self.assertEqual(self.search('lamp'), [])
+        self.assertEqual(self.search('desk'), ['Desk light'])
+        product.delete()
+        self.assertEqual(self.search('desk'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        make_product('Kettle')
+        self.assertEqual(self.search('kett"le OR *'), [])
+        self.assertEqual(self.search('kett'), ['Kettle'])
+
+
+class CatalogPaginationTests(TestCase):
+    def setUp(self):
+        self.products = [make_product(f'Item {i}', category='books' if i % 2 else 'grocery') for i in range(15)]
+
+    def names(self, response):
+        return [p.name for p in response.context['products']]
+
+    def test_walks_forward_and_back_without_counting(self):
+        with CaptureQueriesContext(connection) as ctx:
+            first = self.client.get(reverse('product_list'))
+        # The grouped facet counts are the only COUNT; paging itself doesn't count.
+        counts = [q['sql'] for q in ctx.captured_queries if 'COUNT(' in q['sql'].upper()]
+        self.assertEqual(len(counts), 1)
+        self.assertIn('GROUP BY', counts[0].upper())
+        self.assertEqual(self.names(first), [f'Item {i}' for i in range(14, 8, -1)])
+
+        page = first.context['page_obj']
+        second = self.client.get(reverse('product_list'), {'cursor': page.next_cursor})
+        self.assertEqual(self.names(second), [f'Item {i}' for i in range(8, 2, -1)])
+
+        third = self.client.get(reverse('product_list'), {'cursor': second.context['page_obj'].next_cursor})
+        self.assertEqual(self.names(third), ['Item 2', 'Item 1', 'Item 0'])
+        self.assertFalse(third.context['page_obj'].has_next())
+
+        back = self.client.get(reverse('product_list'), {'cursor': third.context['page_obj'].previous_cursor})
+        self.assertEqual(self.names(back), self.names(second))
+        back = self.client.get(reverse('product_list'), {'cursor': back.context['page_obj'].previous_cursor})
+        self.assertEqual(self.names(back), self.names(first))
+        self.assertFalse(back.context['page_obj'].has_previous())
+
+    def test_category_filter_is_kept_across_pages(self):
+        first = self.client.get(reverse('product_list'), {'category': 'books'})
+        self.assertIn('category=books', first.context['filter_query'])
+        second = self.client.get(reverse('product_list'), {
+            'category': 'books', 'cursor': first.context['page_obj'].next_cursor,
+        })
+        self.assertEqual(self.names(second), ['Item 1'])
+
+    def test_legacy_page_numbers_redirect_to_cursor(self):
+        response = self.client.get(reverse('product_list'), {'page': 2, 'category': 'grocery'})
+        self.assertEqual(response.status_code, 302)
+        followed = self.client.get(response['Location'])
+        self.assertEqual(self.names(followed), ['Item 2', 'Item 0'])
+
+    def test_garbage_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('product_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(self.names(response)[0], 'Item 14')
+
+    def test_search_results_page_by_relevance(self):
+        first = self.client.get(reverse('product_list'), {'q': 'item'})
+        second = self.client.get(reverse('product_list'), {
+            'q': 'item', 'cursor': first.context['page_obj'].next_cursor,
+        })
+        third = self.client.get(reverse('product_list'), {
+            'q': 'item', 'cursor': second.context['page_obj'].next_cursor,
+        })
+        seen = self.names(first) + self.names(second) + self.names(third)
+        self.assertEqual(sorted(seen), sorted(p.name for p in self.products))
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.product = make_product('Rated')
+        self.users = [User.objects.create_user(f'u{i}', password='pass12345') for i in range(3)]
+
+    def assertAggregates(self, count, total, avg):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, count)
+        self.assertEqual(self.product.rating_sum, total)
+        self.assertAlmostEqual(self.product.rating_avg, avg)
+
+    def test_add_review_updates_aggregates(self):
+        for user, rating in zip(self.users, (5, 4)):
+            self.client.force_login(user)
+            self.client.post(reverse('add_review', args=[self.product.id]), {'rating': rating, 'comment': 'ok'})
+        self.assertAggregates(2, 9, 4.5)
+
+    def test_edit_and_delete_keep_aggregates_in_step(self):
+        review = Review.objects.create(product=self.product, user=self.users[0], rating=2, comment='meh')
+        Review.objects.create(product=self.product, user=self.users[1], rating=4, comment='good')
+        review.rating = 5
+        review.save()
+        self.assertAggregates(2, 9, 4.5)
+        review.delete()
+        self.assertAggregates(1, 4, 4.0)
+        Review.objects.all().delete()
+        self.assertAggregates(0, 0, 0.0)
+
+    def test_rebuild_command_repairs_drift(self):
+        Review.objects.create(product=self.product, user=self.users[0], rating=3, comment='x')
+        other = make_product('Unrated')
+        stale = timezone.now() - timedelta(days=1)
+        Product.objects.update(review_count=7, rating_sum=1, rating_avg=9, updated_at=stale)
+        version = caching.catalog_version()
+        call_command('rebuild_ratings', stdout=StringIO())
+        self.assertAggregates(1, 3, 3.0)
+        other.refresh_from_db()
+        self.assertEqual((other.review_count, other.rating_sum, other.rating_avg), (0, 0, 0.0))
+        self.assertGreater(other.updated_at, stale)
+        self.assertNotEqual(caching.catalog_version(), version)
+
+
+@override_settings(PAYMENT_BACKEND='store.payments.StubBackend', PAYMENT_STUB_LATENCY=0)
+class PaymentSuccessTests(TestCase):
+    def setUp(self):
+        cache.clear()  # Fresh rate-limit buckets
+        payments.reset_backend()
+        self.addCleanup(payments.reset_backend)
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.a = make_product('A', '10.00')
+        self.b = make_product('B', '2.50')
+        fill_cart(self.user, {self.a: 2, self.b: 1})
+        self.token = self.start_checkout(self.user)
+
+    def start_checkout(self, user):
+        self.client.force_login(user)
+        token = self.client.post(reverse('create_checkout_session')).json()['id']
+        self.client.force_login(self.user)
+        return token
+
+    def test_creates_one_order_with_snapshotted_items(self):
+        response = self.client.get(reverse('payment_success'), {'session_id': self.token})
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get()
+        self.assertEqual(order.checkout_token, self.token)
+        self.assertEqual(order.total, Decimal('22.50'))
+        self.assertEqual(
+            sorted(order.items.values_list('product_name', 'unit_price', 'quantity')),
+            [('A', Decimal('10.00'), 2), ('B', Decimal('2.50'), 1)],
+        )
+        self.assertEqual(get_cart_store().lines(self.user), {})
+
+    def test_order_is_what_was_paid_for_not_the_current_cart(self):
+        c = make_product('C', '1.00')
+        fill_cart(self.user, {self.a: 5, c: 1})
+        Product.objects.filter(pk=self.b.pk).update(price=Decimal('3.00'))
+        self.client.get(reverse('payment_success'), {'session_id': self.token})
+        order = Order.objects.get()
+        self.assertEqual(order.total, Decimal('22.50'))
+        self.assertEqual(
+            sorted(order.items.values_list('product_name', 'unit_price', 'quantity')),
+            [('A', Decimal('10.00'), 2), ('B', Decimal('2.50'), 1)],
+        )
+        # Only what was ordered leaves the cart.
+        self.assertEqual(get_cart_store().lines(self.user), {c.id: 1})
+
+    def test_refreshing_success_page_does_not_duplicate(self):
+        self.client.get(reverse('payment_success'), {'session_id': self.token})
+        self.client.get(reverse('payment_success'), {'session_id': self.token})
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 2)
+
+    def test_order_detail_uses_snapshot_prices(self):
+        self.client.get(reverse('payment_success'), {'session_id': self.token})
+        order = Order.objects.get()
+        Product.objects.update(price=Decimal('99.00'))
+        response = self.client.get(reverse('order_detail', args=[order.id]))
+        self.assertEqual(response.context['total'], Decimal('22.50'))
+        self.assertContains(response, '₹10.00')
+
+    def test_confirmation_email_is_queued_not_sent(self):
+        self.client.get(reverse('payment_success'), {'session_id': self.token})
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Job.objects.filter(kind='send_email', status='queued').count(), 1)
+        call_command('runworker', '--burst', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['buyer@example.com'])
+        self.assertIn('A x 2', mail.outbox[0].body)
+
+    def test_my_orders_lists_items(self):
+        self.client.get(reverse('payment_success'), {'session_id': self.token})
+        response = self.client.get(reverse('my_orders'))
+        self.assertContains(response, 'A &times; 2')
+
+    def test_unknown_session_is_not_turned_into_an_order(self):
+        response = self.client.get(reverse('payment_success'), {'session_id': 'cs_made_up'})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(len(get_cart_store().lines(self.user)), 2)
+
+    def test_unpaid_session_is_not_turned_into_an_order(self):
+        payments.get_backend().paid.discard(self.token)
+        response = self.client.get(reverse('payment_success'), {'session_id': self.token})
+        self.assertRedirects(response, reverse('view_cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+    def test_someone_elses_session_is_refused(self):
+        other = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        fill_cart(other, {self.b: 1})
+        response = self.client.get(reverse('payment_success'), {'session_id': self.start_checkout(other)})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Order.objects.exists())
+
+    def test_someone_elses_order_does_not_leak(self):
+        self.client.get(reverse('payment_success'), {'session_id': self.token})
+        other = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        fill_cart(other, {self.b: 1})
+        self.client.force_login(other)
+        response = self.client.get(reverse('payment_success'), {'session_id': self.token})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Order.objects.get().user, self.user)
+        self.assertEqual(len(get_cart_store().lines(other)), 1)
+
+    def test_place_order_refuses_a_token_owned_by_someone_else(self):
+        self.client.get(reverse('payment_success'), {'session_id': self.token})
+        other = User.objects.create_user('other', 'other@example.com', 'pass12345')
+        with self.assertRaises(CheckoutTokenTaken):
+            place_order(other, self.token)
+
+    def test_expired_checkout_is_not_turned_into_an_order(self):
+        Job.objects.update(run_after=timezone.now())
+        call_command('runworker', '--burst', stdout=StringIO())
+        with self.assertLogs('store.views', 'ERROR'):
+            response = self.client.get(reverse('payment_success'), {'session_id': self.token})
+        self.assertRedirects(response, reverse('view_cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+
+        @jobs.handler('test_flaky')
+        def flaky(batch):
+            self.calls.append([job.id for job in batch])
+            return [ValueError('boom') if job.payload.get('fail') else None for job in batch]
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        ok = jobs.enqueue('test_flaky', {})
+        bad = jobs.enqueue('test_flaky', {'fail': True}, max_attempts=2)
+        self.assertEqual(jobs.work('w1'), 2)
+        self.assertEqual(self.calls, [[ok.id, bad.id]])
+
+        ok.refresh_from_db()
+        bad.refresh_from_db()
+        self.assertEqual(ok.status, 'done')
+        self.assertEqual((bad.status, bad.attempts), ('queued', 1))
+        self.assertGreater(bad.run_after, timezone.now())
+        self.assertEqual(jobs.work('w1'), 0)
+
+        Job.objects.filter(pk=bad.pk).update(run_after=timezone.now())
+        jobs.work('w1')
+        bad.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), ('failed', 2))
+        self.assertIn('boom', bad.last_error)
+
+    def test_claimed_jobs_are_not_claimed_again(self):
+        for _ in range(3):
+            jobs.enqueue('test_flaky', {})
+        first = jobs.claim('w1', 2)
+        second = jobs.claim('w2', 10)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({j.id for j in first} & {j.id for j in second})
+
+    def test_expired_lease_is_reclaimed(self):
+        job = jobs.enqueue('test_flaky', {})
+        jobs.claim('crashed', 10)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - jobs.LEASE * 2)
+        self.assertEqual([j.id for j in jobs.claim('w2', 10)], [job.id])
+
+    def test_emails_share_one_connection(self):
+        from .tasks import enqueue_email
+        for i in range(3):
+            enqueue_email(f'Hi {i}', 'body', [f'u{i}@example.com'])
+        with mock.patch('store.tasks.get_connection', wraps=get_connection) as opened:
+            jobs.work('w1')
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+
+class JobLeaseTests(TransactionTestCase):
+    """The heartbeat runs on its own connection, so nothing can be left uncommitted."""
+
+    @mock.patch.object(jobs, 'HEARTBEAT', timedelta(milliseconds=50))
+    @mock.patch.object(jobs, 'LEASE', timedelta(milliseconds=200))
+    def test_lease_is_renewed_while_a_long_batch_runs(self):
+        reclaimed = []
+
+        @jobs.handler('test_slow')
+        def slow(batch):
+            time.sleep(0.6)
+            reclaimed.extend(jobs.claim('w2', 10))
+            return [None] * len(batch)
+
+        job = jobs.enqueue('test_slow', {})
+        self.assertEqual(jobs.work('w1'), 1)
+        self.assertEqual(reclaimed, [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product('Cached')
+
+    def test_anonymous_listing_is_served_from_cache(self):
+        self.client.get(reverse('product_list'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('product_list'))
+        self.assertContains(response, 'Cached')
+
+    def test_product_save_invalidates_listing(self):
+        self.client.get(reverse('product_list'))
+        self.product.name = 'Renamed'
+        self.product.save()
+        self.assertContains(self.client.get(reverse('product_list')), 'Renamed')
+
+    def test_new_review_invalidates_review_fragment(self):
+        user = User.objects.create_user('critic', password='pass12345')
+        self.client.get(reverse('product_detail', args=[self.product.id]))
+        Review.objects.create(product=self.product, user=user, rating=4, comment='Solid build')
+        response = self.client.get(reverse('product_detail', args=[self.product.id]))
+        self.assertContains(response, 'Solid build')
+
+    def test_concurrent_misses_share_one_computation(self):
+        calls = []
+        barrier = threading.Barrier(5)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        def worker(results):
+            barrier.wait()
+            results.append(caching.get_or_compute('stampede-test', compute))
+
+        results = []
+        threads = [threading.Thread(target=worker, args=(results,)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+
+
+TEST_MEDIA_ROOT = tempfile.mkdtemp(prefix='store-test-media-')
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ImageDerivativeTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, size=(1200, 900), mode='RGB', color='red'):
+        buffer = BytesIO()
+        Image.new(mode, size, color).save(buffer, 'PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+    def make_product_with_image(self, **kwargs):
+        return Product.objects.create(
+            name='Photo', description='x', price=Decimal('1.00'), image=self.upload(**kwargs),
+        )
+
+    def test_saving_an_image_queues_derivatives_off_the_request_path(self):
+        product = self.make_product_with_image()
+        self.assertEqual(product.image_derivatives, {})
+        job = Job.objects.get(kind='generate_image_derivatives')
+        self.assertEqual(job.payload['product_id'], product.id)
+
+        jobs.work('w1')
+        product.refresh_from_db()
+        derivatives = product.image_derivatives
+        self.assertEqual(derivatives['source'], product.image.name)
+        self.assertEqual(derivatives['fallback'], 'jpeg')
+        self.assertEqual(sorted(derivatives['card']['webp'], key=int), ['240', '480'])
+        self.assertEqual(sorted(derivatives['detail']['jpeg'], key=int), ['800', '1200'])
+
+    def test_derivatives_invalidate_the_product_pages(self):
+        product = self.make_product_with_image()
+        version = caching.product_version(product.id)
+        jobs.work('w1')
+        self.assertNotEqual(caching.product_version(product.id), version)
+
+    def test_images_sharing_a_basename_keep_their_own_derivatives(self):
+        urls = {}
+        for color in ('red', 'blue'):
+            name = default_storage.save(f'product_images/{color}/photo.png', self.upload((300, 200), color=color))
+            urls[color] = generate_derivatives(name)['card']['webp']['240']
+        self.assertNotEqual(urls['red'], urls['blue'])
+        for color, url in urls.items():
+            with default_storage.open(url.removeprefix(settings.MEDIA_URL)) as fh, Image.open(fh) as image:
+                self.assertEqual(image.convert('RGB').getpixel((0, 0))[2] > 128, color == 'blue')
+
+    def test_transparent_images_fall_back_to_png(self):
+        product = self.make_product_with_image(size=(100, 100), mode='RGBA')
+        jobs.work('w1')
+        product.refresh_from_db()
+        self.assertEqual(product.image_derivatives['fallback'], 'png')
+        self.assertEqual(list(product.image_derivatives['grid']['png']), ['100'])
+
+    def test_listing_renders_srcset(self):
+        self.make_product_with_image()
+        jobs.work('w1')
+        response = self.client.get(reverse('product_list'))
+        self.assertContains(response, '<source type="image/webp" srcset="')
+        self.assertContains(response, '400w')
+
+
+class ManageOrdersTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        self.alice = User.objects.create_user('alice', password='pass12345')
+        self.bob = User.objects.create_user('bob', password='pass12345')
+        self.client.force_login(self.staff)
+
+    def make_orders(self, user, count, status='processing'):
+        orders = Order.objects.bulk_create([Order(user=user, status=status, total=Decimal('5.00')) for _ in range(count)])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_name='Thing', unit_price=Decimal('5.00'), quantity=1) for order in orders
+        ])
+        return orders
+
+    def count_queries(self, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('manage_orders'), params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_does_not_grow_with_orders(self):
+        self.make_orders(self.alice, 3)
+        small, _ = self.count_queries()
+        self.make_orders(self.bob, 120)
+        large, response = self.count_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.context['orders']), 50)
+        self.assertTrue(response.context['page_obj'].has_next())
+
+    def test_filters_by_status_and_user(self):
+        self.make_orders(self.alice, 2, status='shipped')
+        self.make_orders(self.alice, 1)
+        self.make_orders(self.bob, 4, status='shipped')
+        _, response = self.count_queries({'status': 'shipped', 'user': 'alice'})
+        self.assertEqual(len(response.context['orders']), 2)
+
+    def test_bulk_status_change_is_a_single_update(self):
+        orders = self.make_orders(self.alice, 5)
+        ids = [str(order.id) for order in orders[:3]]
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse('manage_orders'), {'order_ids': ids, 'status': 'shipped'})
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "store_order"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Order.objects.filter(status='shipped').count(), 3)
+
+
+@override_settings(PAYMENT_BACKEND='store.payments.StubBackend', PAYMENT_STUB_LATENCY=0)
+class CheckoutGatewayTests(TestCase):
+    def setUp(self):
+        cache.clear()  # Fresh rate-limit buckets
+        payments.reset_backend()
+        self.addCleanup(payments.reset_backend)
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.client.force_login(self.user)
+        self.product = make_product('A', '10.00')
+        fill_cart(self.user, {self.product: 2})
+
+    @override_settings(PAYMENT_BACKEND=None)
+    def test_missing_backend_is_an_error_not_the_stub(self):
+        payments.reset_backend()
+        with self.assertRaises(ImproperlyConfigured):
+            payments.get_backend()
+
+    def test_checkout_references_cached_price_ids(self):
+        backend = payments.get_backend()
+        with mock.patch.object(backend, 'acreate_price', wraps=backend.acreate_price) as create_price:
+            first = self.client.post(reverse('create_checkout_session')).json()
+            second = self.client.post(reverse('create_checkout_session')).json()
+        self.assertEqual(create_price.call_count, 1)
+        self.assertEqual(backend.sessions[second['id']], [{'price': f'price_stub_{self.product.id}_1000', 'quantity': 2}])
+        self.assertEqual(self.client.session['checkout_session_id'], second['id'])
+        self.assertNotEqual(first['id'], second['id'])
+
+    def test_price_change_creates_a_new_price(self):
+        self.client.post(reverse('create_checkout_session'))
+        Product.objects.filter(pk=self.product.pk).update(price=Decimal('12.00'))
+        response = self.client.post(reverse('create_checkout_session')).json()
+        self.assertEqual(payments.get_backend().sessions[response['id']][0]['price'], f'price_stub_{self.product.id}_1200')
+
+    def test_empty_cart_is_refused_before_reserving(self):
+        get_cart_store().clear(self.user)
+        response = self.client.post(reverse('create_checkout_session'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertFalse(Job.objects.filter(kind='release_stock').exists())
+
+    def test_provider_failure_is_a_502_and_releases_the_hold(self):
+        backend = payments.get_backend()
+        with mock.patch.object(backend, 'acreate_checkout_session', side_effect=RuntimeError('provider down')), \
+                self.assertLogs('store.views', 'ERROR'):
+            response = self.client.post(reverse('create_checkout_session'))
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(response.json(), {'error': 'provider down'})
+        self.assertFalse(StockReservation.objects.exists())
+
+    def post_event(self, session_id, payment_status='paid'):
+        session = {'id': session_id, 'payment_status': payment_status, 'client_reference_id': str(self.user.pk)}
+        event = {'type': 'checkout.session.completed', 'data': {'object': session}}
+        return self.client.post(reverse('payment_webhook'), json.dumps(event), content_type='application/json')
+
+    def test_webhook_places_the_order_and_marks_it_paid(self):
+        session_id = self.client.post(reverse('create_checkout_session')).json()['id']
+        self.assertEqual(self.post_event(session_id).status_code, 200)
+        order = Order.objects.get(checkout_token=session_id)
+        self.assertEqual((order.user, order.total), (self.user, Decimal('20.00')))
+        self.assertIsNotNone(order.paid_at)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(get_cart_store().lines(self.user), {})
+        # The buyer's success page, and redeliveries, find the same order.
+        response = self.client.get(reverse('payment_success'), {'session_id': session_id})
+        self.assertEqual(response.context['order'], order)
+        self.assertEqual(self.post_event(session_id).status_code, 200)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Job.objects.filter(kind='send_email').count(), 1)
+
+    def test_webhook_ignores_unpaid_sessions(self):
+        session_id = self.client.post(reverse('create_checkout_session')).json()['id']
+        self.assertEqual(self.post_event(session_id, payment_status='unpaid').status_code, 200)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(StockReservation.objects.exists())
+
+    @override_settings(PAYMENT_STUB_LATENCY=0.2)
+    async def test_concurrent_checkouts_overlap_provider_calls(self):
+        payments.reset_backend()
+        await self.async_client.aforce_login(self.user)
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(
+            self.async_client.post(reverse('create_checkout_session')) for _ in range(5)
+        ))
+        # Run back to back, five checkouts would wait on the provider for 2 s.
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertTrue(all('id' in response.json() for response in responses))
+
+    def test_webhook_rejects_garbage(self):
+        response = self.client.post(reverse('payment_webhook'), 'nope', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CartStoreConcurrencyTests(TransactionTestCase):
+    """Parallel add_to_cart requests from one user must not lose increments."""
+
+    THREADS = 8
+    ADDS_PER_THREAD = 5
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer', password='pass12345')
+        self.product = make_product('Hot item')
+
+    def hammer(self):
+        errors = []
+        barrier = threading.Barrier(self.THREADS, timeout=30)
+        # Log in up front: creating sessions is not what is under test.
+        clients = []
+        for _ in range(self.THREADS):
+            client = Client()
+            client.force_login(self.user)
+            clients.append(client)
+
+        def worker(client):
+            try:
+                barrier.wait()
+                for _ in range(self.ADDS_PER_THREAD):
+                    self.assertEqual(client.get(reverse('add_to_cart', args=[self.product.id])).status_code, 302)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return get_cart_store().lines(self.user)
+
+    def run_with_store(self, path):
+        with override_settings(CART_STORE=path):
+            reset_cart_store()
+            self.addCleanup(reset_cart_store)
+            lines = self.hammer()
+        self.assertEqual(lines, {self.product.id: self.THREADS * self.ADDS_PER_THREAD})
+
+    def test_database_store_loses_no_increments(self):
+        self.run_with_store('store.cart.DatabaseCartStore')
+
+    def test_cache_store_loses_no_increments(self):
+        self.run_with_store('store.cart.CacheCartStore')
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pass12345')
+        self.a, self.b, self.c, self.d = (make_product(name) for name in 'ABCD')
+        self.past = timezone.now() - timedelta(hours=1)
+
+    def order(self, *products, status='processing'):
+        order = Order.objects.create(user=self.user, status=status)
+        Order.objects.filter(pk=order.pk).update(ordered_at=self.past)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=p, product_name=p.name, unit_price=p.price, quantity=1)
+            for p in products
+        ])
+        return order
+
+    def recommended(self, product):
+        product.refresh_from_db()
+        return product.recommended_ids
+
+    def test_neighbours_are_ranked_by_co_purchase_count(self):
+        self.order(self.a, self.b)
+        self.order(self.a, self.b, self.c)
+        self.order(self.a, self.c, self.d, status='cancelled')
+        run = recommendations.build()
+        self.assertEqual(run.orders_processed, 2)
+        self.assertEqual(self.recommended(self.a), [self.b.id, self.c.id])
+        self.assertEqual(self.recommended(self.c), [self.a.id, self.b.id])
+        self.assertEqual(self.recommended(self.d), [])
+
+    def test_incremental_runs_only_read_new_orders(self):
+        self.order(self.a, self.b)
+        recommendations.build()
+        self.assertIsNone(recommendations.build())
+
+        self.order(self.a, self.c)
+        self.order(self.a, self.c)
+        run = recommendations.build()
+        self.assertEqual(run.orders_processed, 2)
+        self.assertEqual(self.recommended(self.a), [self.c.id, self.b.id])
+        self.assertEqual(CoPurchase.objects.get(product=self.a, other=self.b).count, 1)
+
+        recommendations.build(full=True)
+        self.assertEqual(CoPurchase.objects.get(product=self.a, other=self.c).count, 2)
+
+    def test_full_rebuild_without_orders_invalidates_pages(self):
+        order = self.order(self.a, self.b)
+        recommendations.build()
+        order.delete()
+        version = caching.catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIsNone(recommendations.build(full=True))
+        self.assertEqual(self.recommended(self.a), [])
+        self.assertNotEqual(caching.catalog_version(), version)
+
+    def test_recent_orders_wait_for_the_next_run(self):
+        order = self.order(self.a, self.b)
+        Order.objects.filter(pk=order.pk).update(ordered_at=timezone.now())
+        self.assertIsNone(recommendations.build())
+
+    def test_related_products_fall_back_to_category_peers(self):
+        self.order(self.a, self.b)
+        recommendations.build()
+        self.a.refresh_from_db()
+        with self.assertNumQueries(2):
+            related = recommendations.related_products(self.a)
+        self.assertEqual(related[0], self.b)
+        self.assertEqual(len(related), 3)
+        self.assertNotIn(self.a, related)
+
+    def test_product_detail_shows_co_purchased_products(self):
+        other = make_product('Bought together', category='books')
+        self.order(self.a, other)
+        call_command('build_recommendations', stdout=StringIO())
+        response = self.client.get(reverse('product_detail', args=[self.a.id]))
+        self.assertContains(response, 'Bought together')
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN='')
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.clear()
+        self.addCleanup(metrics.clear)
+
+    def test_records_latency_and_queries_per_view(self):
+        make_product('Lamp')
+        self.client.get(reverse('product_list'))
+        self.client.get(reverse('product_list'))
+        self.assertEqual(metrics.REQUEST_LATENCY.count(view='product_list', method='GET'), 2)
+        self.assertEqual(metrics.REQUESTS.value(view='product_list', method='GET', status=200), 2)
+        self.assertEqual(metrics.QUERY_COUNT.count(view='product_list'), 2)
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE store_request_duration_seconds histogram', body)
+        self.assertIn('store_request_duration_seconds_count{view="product_list",method="GET"} 2', body)
+        self.assertIn('store_request_duration_seconds_bucket{view="product_list",method="GET",le="+Inf"} 2', body)
+
+    def test_flags_repeated_queries(self):
+        products = [make_product(f'P{i}') for i in range(metrics.REPEATED_QUERY_THRESHOLD)]
+
+        def n_plus_one(request):
+            for product in products:
+                Product.objects.get(pk=product.pk)
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        with self.assertLogs('store.metrics', 'WARNING') as logs:
+            metrics.MetricsMiddleware(n_plus_one)(request)
+        self.assertEqual(metrics.REPEATED_QUERIES.value(view='<unresolved>'), 1)
+        self.assertIn('possible N+1', logs.output[0])
+
+    async def test_counts_queries_that_async_views_run_in_threads(self):
+        product = await Product.objects.acreate(name='Lamp', description='Desk lamp', price=Decimal('9.00'),
+                                                image='product_images/test.jpg')
+        response = await self.async_client.get(reverse('product_detail', args=[product.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(metrics.QUERY_COUNT.count(view='product_detail'), 1)
+        self.assertGreater(metrics.QUERY_SECONDS.value(view='product_detail'), 0)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_endpoint_requires_token_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.client.get(reverse('product_list'))
+        self.assertEqual(metrics.REQUEST_LATENCY.count(view='product_list', method='GET'), 0)
+
+
+class BenchmarkTests(TestCase):
+    def test_compare_flags_slower_and_chattier_routes(self):
+        def run(**routes):
+            return {'meta': {}, 'routes': {
+                name: {'p95_ms': p95, 'queries': queries} for name, (p95, queries) in routes.items()
+            }}
+
+        old = run(steady=(10.0, 3), slower=(10.0, 3), chattier=(10.0, 3), jittery=(0.3, 1), gone=(1.0, 1))
+        new = run(steady=(11.0, 3), slower=(15.0, 3), chattier=(9.0, 4), jittery=(0.9, 1), added=(1.0, 1))
+        flagged = {row[0] for row in benchmarks.compare(old, new, threshold=0.2) if row[-1]}
+        self.assertEqual(flagged, {'slower', 'chattier'})
+
+    def test_percentiles_use_nearest_rank(self):
+        values = [i / 1000 for i in range(1, 101)]
+        summary = benchmarks.summarize(values, [2, 3], [200, 200, 302])
+        self.assertEqual((summary['p50_ms'], summary['p95_ms'], summary['p99_ms']), (50.0, 95.0, 99.0))
+        self.assertEqual(summary['queries'], 3)
+        self.assertEqual(summary['status'], 200)
+
+    def test_seeded_store_benchmarks_every_route(self):
+        call_command('seed_data', products=12, users=4, orders=30, reviews=20, stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 12)
+        self.assertEqual(Order.objects.count(), 30)
+        self.assertEqual(Review.objects.count(), 20)
+        self.assertTrue(Product.objects.filter(review_count__gt=0).exists())
+
+        output = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        output.close()
+        self.addCleanup(os.unlink, output.name)
+        stderr = StringIO()
+        call_command('bench_routes', requests=2, warmup=0, output=output.name, stdout=StringIO(), stderr=stderr)
+        self.assertEqual(stderr.getvalue(), '')
+
+        with open(output.name) as fh:
+            run = json.load(fh)
+        measured = {label.split(':')[0] for label in run['routes']}
+        self.assertEqual(measured, {pattern.name for pattern in store_urls.urlpatterns})
+        self.assertEqual(run['routes']['product_detail']['status'], 200)
+        self.assertFalse(User.objects.filter(username__startswith='bench-routes-').exists())
+
+
+def explain(sql, params):
+    """Return the plan steps (SQLite) or node types (PostgreSQL) for one statement."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes, stack = [], [plan[0]['Plan']]
+        while stack:
+            node = stack.pop()
+            nodes.append(f"{node['Node Type']} {node.get('Relation Name', '')}".strip())
+            stack.extend(node.get('Plans', ()))
+        return nodes
+
+
+def plan_problems(steps):
+    """Full table scans and explicit sorts in an ``explain()`` result."""
+    problems = []
+    for step in steps:
+        if connection.vendor == 'sqlite':
+            # "SCAN t USING INDEX i" walks an index in order; a bare
+            # "SCAN t" (or "SCAN TABLE t" before SQLite 3.36) reads the table.
+            if re.fullmatch(r'SCAN (TABLE )?\S+( AS \S+)?', step) or 'TEMP B-TREE' in step:
+                problems.append(step)
+        elif step.startswith(('Seq Scan', 'Sort', 'Incremental Sort')):
+            problems.append(step)
+    return problems
+
+
+class QueryPlanTests(TestCase):
+    """
+    Every SELECT a hot view runs must be answered from an index, without a
+    full scan or a separate sort. On PostgreSQL sequential scans and sorts
+    are disabled for the check, since the planner would otherwise prefer
+    them on tables this small.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='pass12345')
+        cls.staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        cls.products = [
+            make_product(f'Item {i}', category=('books', 'grocery')[i % 2]) for i in range(20)
+        ]
+        for product in cls.products[:3]:
+            Review.objects.create(product=product, user=cls.user, rating=4, comment='Fine')
+        for i in range(3):
+            order = Order.objects.create(user=cls.user, total=Decimal('10.00'), status='shipped')
+            OrderItem.objects.create(order=order, product=cls.products[i], product_name='Item',
+                                     unit_price=Decimal('10.00'), quantity=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_indexed(self, url, data=None, as_user=None, allow_sort=False):
+        if as_user:
+            self.client.force_login(as_user)
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = self.client.get(url, data or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(statements)
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+        for sql, params in statements:
+            problems = plan_problems(explain(sql, params))
+            if allow_sort:
+                problems = [step for step in problems
+                            if 'ORDER BY' not in step and not step.startswith(('Sort', 'Incremental Sort'))]
+            self.assertEqual(problems, [], f"{url} {data or ''} runs an unindexed query:\n{sql}")
+
+    def test_product_list(self):
+        self.assert_indexed(reverse('product_list'))
+        self.assert_indexed(reverse('product_list'), {'sort': 'rating'})
+
+    def test_product_list_by_category(self):
+        self.assert_indexed(reverse('product_list'), {'category': 'books'})
+        self.assert_indexed(reverse('product_list'), {'category': 'books', 'sort': 'rating'})
+
+    def test_product_list_by_price(self):
+        self.assert_indexed(reverse('product_list'), {'price': 'under-100'})
+        # One category's products in a price band are a range of the
+        # (category, price) index, sorted afterwards; walking the category
+        # by date instead would read past everything outside the band.
+        self.assert_indexed(reverse('product_list'), {'category': 'books', 'price': 'under-100'}, allow_sort=True)
+
+    def test_product_detail(self):
+        self.assert_indexed(reverse('product_detail', args=[self.products[0].id]))
+
+    def test_my_orders(self):
+        self.assert_indexed(reverse('my_orders'), as_user=self.user)
+
+    def test_manage_orders(self):
+        self.assert_indexed(reverse('manage_orders'), as_user=self.staff)
+        self.assert_indexed(reverse('manage_orders'), {'status': 'shipped'}, as_user=self.staff)
+
+    def test_wishlist_and_cart(self):
+        self.assert_indexed(reverse('wishlist'), as_user=self.user)
+        self.assert_indexed(reverse('view_cart'), as_user=self.user)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class CatalogImportExportTests(TestCase):
+    CSV = (
+        "sku,name,description,price,category,image,image_url\n"
+        "MUG-1,Mug,Ceramic,4.50,grocery,product_images/mug.jpg,\n"
+        "LAMP-1,Lamp,Desk lamp,19.99,electronics,,https://images.example.com/lamp.png\n"
+        ",No sku,Always created,1.00,books,product_images/book.jpg,\n"
+        "BAD-1,,Missing name,1.00,books,product_images/x.jpg,\n"
+        "BAD-2,Bad price,x,abc,books,product_images/x.jpg,\n"
+        "NEW-1,No image,x,1.00,books,,\n"
+    )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        self.downloaded = []
+        patcher = mock.patch.object(catalog_io, '_download', side_effect=self.fake_download)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_download(self, session, url):
+        self.downloaded.append(url)
+        return 'product_images/downloaded.png'
+
+    def run_import(self, text, fmt='csv', **kwargs):
+        return catalog_io.import_catalog(StringIO(text), fmt, **kwargs)
+
+    def test_csv_import_creates_and_reports_bad_rows(self):
+        result = self.run_import(self.CSV)
+        self.assertEqual((result.rows, result.created, result.updated, result.failed), (6, 3, 0, 3))
+        self.assertEqual([line for line, _ in result.errors], [5, 6, 7])
+        self.assertEqual(self.downloaded, ['https://images.example.com/lamp.png'])
+        self.assertEqual(Product.objects.get(sku='LAMP-1').image.name, 'product_images/downloaded.png')
+        self.assertTrue(search_products(Product.objects.all(), 'lamp').exists())
+        self.assertEqual(Job.objects.filter(kind='generate_image_derivatives').count(), 3)
+
+    def test_values_past_the_column_limits_fail_only_their_row(self):
+        long_sku = 'S' * 65
+        result = self.run_import(
+            f'{{"sku": "{long_sku}", "name": "Long sku", "price": "1.00", "image": "product_images/p.jpg"}}\n'
+            '{"sku": "BIG-1", "name": "Too dear", "price": "100000000", "image": "product_images/p.jpg"}\n'
+            '{"sku": "NAN-1", "name": "Not a number", "price": "NaN", "image": "product_images/p.jpg"}\n'
+            '{"sku": "INF-1", "name": "Infinite", "price": "Infinity", "image": "product_images/p.jpg"}\n'
+            '{"sku": "OK-1", "name": "Dearest", "price": "99999999.99", "image": "product_images/p.jpg"}\n',
+            fmt='jsonl',
+        )
+        self.assertEqual((result.created, result.failed), (1, 4))
+        self.assertEqual([line for line, _ in result.errors], [1, 2, 3, 4])
+        self.assertIn('64 characters', result.errors[0][1])
+        self.assertEqual(Product.objects.get().sku, 'OK-1')
+
+    def test_rows_with_a_known_sku_update_in_place(self):
+        self.run_import(self.CSV)
+        mug = Product.objects.get(sku='MUG-1')
+        result = self.run_import(
+            '{"sku": "MUG-1", "name": "Big mug", "price": "5.00", "category": "grocery"}\n'
+            '{"sku": "MUG-1", "name": "Bigger mug", "price": "6.00", "category": "grocery"}\n',
+            fmt='jsonl',
+        )
+        self.assertEqual((result.created, result.updated, result.failed), (0, 1, 0))
+        mug.refresh_from_db()
+        self.assertEqual((mug.name, mug.price, mug.image.name), ('Bigger mug', Decimal('6.00'), 'product_images/mug.jpg'))
+
+    def test_chunks_report_progress_and_resume(self):
+        reports = []
+        rows = ''.join(f'{{"sku": "S{i}", "name": "P{i}", "price": "1", "image": "product_images/p.jpg"}}\n'
+                       for i in range(5))
+        self.run_import(rows, fmt='jsonl', chunk_size=2, progress=lambda r: reports.append(r.rows))
+        self.assertEqual(reports, [2, 4, 5])
+
+        resumed = catalog_io.ImportResult.from_dict({'rows': 4, 'created': 4})
+        result = self.run_import(rows.replace('"P', '"Q'), fmt='jsonl', resume=resumed)
+        self.assertEqual((result.rows, result.created, result.updated), (5, 4, 1))
+        self.assertEqual(list(Product.objects.filter(name__startswith='Q').values_list('sku', flat=True)), ['S4'])
+
+    def test_staff_upload_is_imported_by_the_worker(self):
+        self.client.force_login(self.staff)
+        upload = SimpleUploadedFile('feed.csv', self.CSV.encode(), content_type='text/csv')
+        response = self.client.post(reverse('catalog_import'), {'file': upload})
+        self.assertRedirects(response, reverse('catalog_import'))
+        job = Job.objects.get(kind='import_catalog')
+        self.assertFalse(Product.objects.exists())
+
+        jobs.work('w1')
+        status = self.client.get(reverse('catalog_import_status', args=[job.id])).json()
+        self.assertEqual((status['status'], status['created'], status['failed']), ('done', 3, 3))
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_export_streams_the_catalog(self):
+        self.run_import(self.CSV)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('catalog_export'), {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(sorted(row['sku'] for row in rows), ['', 'LAMP-1', 'MUG-1'])
+
+        response = self.client.get(reverse('catalog_export'), {'format': 'jsonl'})
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertIn({'sku': 'MUG-1', 'name': 'Mug', 'description': 'Ceramic', 'price': '4.50',
+                       'category': 'grocery', 'image': 'product_images/mug.jpg'}, records)
+
+    def test_endpoints_are_staff_only(self):
+        self.client.force_login(User.objects.create_user('buyer', password='pass12345'))
+        self.assertEqual(self.client.get(reverse('catalog_export')).status_code, 302)
+        self.assertEqual(self.client.get(reverse('catalog_import')).status_code, 302)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class ImageDownloadTests(TestCase):
+    ADDRESSES = {'images.example.com': '93.184.216.34', 'intranet.example.com': '10.0.0.5'}
+
+    def setUp(self):
+        patcher = mock.patch('socket.getaddrinfo', side_effect=self.resolve)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = mock.Mock()
+
+    def resolve(self, host, port, **kwargs):
+        address = self.ADDRESSES.get(host, host)
+        return [(None, None, None, '', (address, port or 80))]
+
+    def response(self, location=None):
+        response = mock.MagicMock(is_redirect=location is not None, headers={'location': location})
+        buffer = BytesIO()
+        Image.new('RGB', (2, 2)).save(buffer, 'PNG')
+        response.iter_content.return_value = [buffer.getvalue()]
+        return response
+
+    def test_internal_addresses_are_refused(self):
+        for url in ('http://127.0.0.1/x.png', 'http://169.254.169.254/latest/meta-data/',
+                    'https://intranet.example.com/x.png', 'http://[::1]/x.png', 'file:///etc/passwd'):
+            with self.subTest(url=url), self.assertRaises(catalog_io.RowError):
+                catalog_io._download(self.session, url)
+        self.session.get.assert_not_called()
+
+    def test_every_redirect_hop_is_checked(self):
+        self.session.get.return_value = self.response('http://169.254.169.254/latest/meta-data/')
+        with self.assertRaises(catalog_io.RowError):
+            catalog_io._download(self.session, 'https://images.example.com/lamp.png')
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_public_images_are_fetched(self):
+        self.session.get.side_effect = [self.response('/cdn/lamp.png'), self.response()]
+        name = catalog_io._download(self.session, 'https://images.example.com/lamp.png')
+        self.assertTrue(name.startswith('product_images/lamp'))
+        self.assertEqual(self.session.get.call_args.args[0], 'https://images.example.com/cdn/lamp.png')
+
+
+class CatalogApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = [make_product(f'Api {i}', price=f'{i}.50') for i in range(5)]
+
+    def test_listing_walks_cursor_pages_with_sparse_fields(self):
+        url, seen = reverse('api_product_list') + '?fields=id,price&limit=2', []
+        while url:
+            body = self.client.get(url).json()
+            self.assertTrue(all(set(row) == {'id', 'price'} for row in body['results']))
+            seen += body['results']
+            url = body['next']
+        self.assertEqual([row['id'] for row in seen], [p.id for p in reversed(self.products)])
+        self.assertEqual(seen[-1]['price'], '0.50')
+
+    def test_bad_parameters_are_rejected(self):
+        response = self.client.get(reverse('api_product_list'), {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['error'])
+        self.assertEqual(self.client.get(reverse('api_product_list'), {'limit': 1000}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_product_detail', args=[999999])).status_code, 404)
+
+    def test_listing_revalidates_without_queries(self):
+        response = self.client.get(reverse('api_product_list'))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api_product_list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertTrue(response['ETag'])
+
+        self.products[0].name = 'Renamed'
+        self.products[0].save()
+        response = self.client.get(reverse('api_product_list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Renamed', [row['name'] for row in response.json()['results']])
+
+    def test_detail_honours_etag_and_last_modified(self):
+        url = reverse('api_product_detail', args=[self.products[0].id])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['name'], 'Api 0')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        # Another field selection is another representation.
+        self.assertEqual(
+            self.client.get(url, {'fields': 'name'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200,
+        )
+
+        self.products[0].price = Decimal('99.00')
+        self.products[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((response.status_code, response.json()['price']), (200, '99.00'))
+
+    def test_reviews_revalidate_on_the_product_timestamp(self):
+        product = self.products[0]
+        url = reverse('api_product_reviews', args=[product.id])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['results'], [])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        user = User.objects.create_user('critic', password='pass12345')
+        Review.objects.create(product=product, user=user, rating=4, comment='Sturdy')
+        response = self.client.get(url, {'fields': 'user,rating'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.json()['results'], [{'user': 'critic', 'rating': 4}])
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = make_product('Routed')
+        self.router = PrimaryReplicaRouter()
+
+    def route(self, view, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaPinMiddleware(view)(request)
+
+    def test_catalog_reads_go_to_a_replica_and_writes_to_the_primary(self):
+        @replica_reads
+        def view(request):
+            return HttpResponse(','.join([
+                self.router.db_for_read(Product), self.router.db_for_read(Order) or 'default',
+                self.router.db_for_write(Order),
+            ]))
+
+        response = self.route(view)
+        self.assertEqual(response.content, b'replica_0,default,default')
+        # Reads after the write, and for the pin's lifetime, stay on the primary.
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+        def reads(request):
+            return HttpResponse(self.router.db_for_read(Review) or 'default')
+
+        self.assertEqual(self.route(replica_reads(reads), {PIN_COOKIE: '1'}).content, b'default')
+        # Only decorated views read from replicas.
+        self.assertEqual(self.route(reads).content, b'default')
+        self.assertFalse(self.router.allow_migrate('replica_0', 'store'))
+
+    def test_cached_values_are_computed_from_the_primary(self):
+        @replica_reads
+        def view(request):
+            cached = caching.get_or_compute('replica-test', lambda: self.router.db_for_read(Product) or 'default')
+            return HttpResponse(f'{self.router.db_for_read(Product)},{cached}')
+
+        self.assertEqual(self.route(view).content, b'replica_0,default')
+
+    def test_writing_a_review_pins_the_visitor_to_the_primary(self):
+        user = User.objects.create_user('critic', password='pass12345')
+        self.client.force_login(user)
+        response = self.client.post(
+            reverse('add_review', args=[self.product.id]), {'rating': 5, 'comment': 'Great'},
+        )
+        self.assertIn(PIN_COOKIE, response.cookies)
+        # Pinned, the page reads the new review from the primary (the
+        # replica alias isn't even configured here).
+        response = self.client.get(reverse('product_detail', args=[self.product.id]))
+        self.assertContains(response, 'Great')
+
+        self.client.cookies.pop(PIN_COOKIE)
+        self.client.get(reverse('wishlist'))  # Session and auth writes don't pin.
+        self.assertNotIn(PIN_COOKIE, self.client.cookies)
+
+
+@override_settings(PAYMENT_BACKEND='store.payments.StubBackend', PAYMENT_STUB_LATENCY=0)
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()  # Fresh rate-limit buckets
+        payments.reset_backend()
+        self.addCleanup(payments.reset_backend)
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pass12345')
+        self.staff = User.objects.create_user('staff', password='pass12345', is_staff=True)
+        self.a = make_product('A', '10.00')
+        self.b = make_product('B', '2.50', category='books')
+
+    def buy(self, quantities):
+        self.client.force_login(self.user)
+        fill_cart(self.user, quantities)
+        token = self.client.post(reverse('create_checkout_session')).json()['id']
+        self.client.get(reverse('payment_success'), {'session_id': token})
+        return Order.objects.get(checkout_token=token)
+
+    def snapshot(self):
+        return {
+            model.__name__: sorted(model.objects.values_list(*fields, 'units', 'revenue', 'orders'))
+            for model, fields in sales.TABLES
+        }
+
+    def test_orders_and_status_changes_update_the_rollups(self):
+        first = self.buy({self.a: 2, self.b: 1})
+        self.buy({self.a: 1})
+        today = timezone.localdate()
+        self.assertEqual(
+            DailySales.objects.values_list('day', 'units', 'revenue', 'orders').get(),
+            (today, 4, Decimal('32.50'), 2),
+        )
+        self.assertEqual(
+            DailyCategorySales.objects.get(category='electronics').revenue, Decimal('30.00'),
+        )
+        self.assertEqual(DailyProductSales.objects.get(product_id=self.b.id).product_name, 'B')
+
+        # Cancelling in bulk, and un-cancelling with a plain save, both count.
+        self.client.force_login(self.staff)
+        self.client.post(reverse('manage_orders'), {'order_ids': [first.id], 'status': 'cancelled'})
+        self.assertEqual(DailySales.objects.get().revenue, Decimal('10.00'))
+        self.assertEqual(DailyProductSales.objects.get(product_id=self.b.id).orders, 0)
+        self.client.post(reverse('manage_orders'), {'order_ids': [first.id], 'status': 'cancelled'})
+        self.assertEqual(DailySales.objects.get().orders, 1)
+        first.status = 'shipped'
+        first.save()
+        incremental = self.snapshot()
+        sales.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_dashboard_reads_only_rollups(self):
+        self.buy({self.a: 2, self.b: 1})
+        self.client.force_login(self.staff)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('sales_dashboard'), {'days': 7})
+        self.assertEqual(response.context['summary'], {'units': 3, 'revenue': Decimal('22.50'), 'orders': 1})
+        self.assertEqual([row['label'] for row in response.context['categories']], ['Electronics', 'Books'])
+        self.assertFalse([q for q in ctx.captured_queries if 'store_order' in q['sql']])
+
+        response = self.client.get(reverse('sales_dashboard'), {'category': 'books'})
+        self.assertEqual([row['product_name'] for row in response.context['top_products']], ['B'])
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('sales_dashboard')).status_code, 302)
+
+
+class WishlistMembershipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('fan', password='pass12345')
+        self.products = [make_product(f'Wish {i}') for i in range(6)]
+        for product in self.products[:3]:
+            Wishlist.objects.create(user=self.user, product=product)
+        self.client.force_login(self.user)
+
+    def wishlist_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('product_list'))
+        return response, [q for q in ctx.captured_queries if 'store_wishlist' in q['sql']]
+
+    def test_listing_loads_the_set_once_then_from_cache(self):
+        response, queries = self.wishlist_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(set(response.context['wishlist_ids']), {p.id for p in self.products[:3]})
+        self.assertContains(response, 'wishlist-toggle active', count=3)
+        response, queries = self.wishlist_queries()
+        self.assertEqual(queries, [])
+
+    def test_membership_is_rendered_per_visitor_in_the_shared_grid(self):
+        self.client.get(reverse('product_list'))
+        self.client.force_login(User.objects.create_user('stranger', password='pass12345'))
+        response = self.client.get(reverse('product_list'))
+        self.assertNotContains(response, 'wishlist-toggle active')
+        Wishlist.objects.create(user=response.wsgi_request.user, product=self.products[5])
+        self.assertContains(self.client.get(reverse('product_list')), 'wishlist-toggle active', count=1)
+
+    def test_toggle_flips_membership_and_invalidates(self):
+        url = reverse('toggle_wishlist', args=[self.products[0].id])
+        self.assertEqual(self.client.post(url).json(), {'product_id': self.products[0].id, 'in_wishlist': False})
+        self.assertEqual(self.client.post(url).json()['in_wishlist'], True)
+        self.client.post(reverse('toggle_wishlist', args=[self.products[5].id]))
+        response, queries = self.wishlist_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertIn(self.products[5].id, response.context['wishlist_ids'])
+
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(reverse('toggle_wishlist', args=[999999])).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.post(url).status_code, 401)
+
+
+@override_settings(PAYMENT_BACKEND='store.payments.StubBackend', PAYMENT_STUB_LATENCY=0)
+class StockReservationTests(TestCase):
+    def setUp(self):
+        cache.clear()  # Fresh rate-limit buckets
+        payments.reset_backend()
+        self.addCleanup(payments.reset_backend)
+        self.product = make_product('Last few', stock=3)
+        self.buyers = [User.objects.create_user(f'buyer{i}', f'buyer{i}@example.com', 'pass12345') for i in range(2)]
+        for buyer in self.buyers:
+            fill_cart(buyer, {self.product: 2})
+
+    def checkout(self, buyer):
+        self.client.force_login(buyer)
+        return self.client.post(reverse('create_checkout_session'))
+
+    def stock(self):
+        return Product.objects.values_list('stock', flat=True).get(pk=self.product.pk)
+
+    def test_checkout_reserves_and_payment_commits(self):
+        session_id = self.checkout(self.buyers[0]).json()['id']
+        self.assertEqual(self.stock(), 1)
+        self.assertEqual(StockReservation.objects.get().checkout_token, session_id)
+
+        response = self.checkout(self.buyers[1])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['error'], "Only 1 of Last few left in stock.")
+        self.assertEqual(self.stock(), 1)
+
+        self.client.force_login(self.buyers[0])
+        self.client.get(reverse('payment_success'), {'session_id': session_id})
+        self.assertTrue(Order.objects.filter(checkout_token=session_id).exists())
+        self.assertFalse(StockReservation.objects.exists())
+        # The expiry job finds nothing left to release.
+        Job.objects.update(run_after=timezone.now())
+        call_command('runworker', '--burst', stdout=StringIO())
+        self.assertEqual(self.stock(), 1)
+
+    def test_expired_hold_is_released_once(self):
+        session_id = self.checkout(self.buyers[0]).json()['id']
+        job = Job.objects.get(kind='release_stock')
+        self.assertGreater(job.run_after, timezone.now() + timedelta(minutes=30))
+        self.assertEqual(payments.get_backend().sessions[session_id][0]['quantity'], 2)
+
+        Job.objects.update(run_after=timezone.now())
+        call_command('runworker', '--burst', stdout=StringIO())
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(inventory.commit(session_id), [])
+        self.assertEqual(inventory.release(job.payload['hold']), 0)
+        self.assertEqual(self.stock(), 3)
+
+    def test_untracked_products_are_recorded_without_taking_stock(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=None)
+        self.assertIn('id', self.checkout(self.buyers[0]).json())
+        reservation = StockReservation.objects.get()
+        self.assertEqual((reservation.tracked, reservation.quantity, reservation.unit_price), (False, 2, Decimal('10.00')))
+        Job.objects.update(run_after=timezone.now())
+        call_command('runworker', '--burst', stdout=StringIO())
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertIsNone(self.stock())
+
+
+@override_settings(
+    RATE_LIMIT_ENABLED=True,
+    RATE_LIMITS={'login': {'ip': '3/m'}, 'create_checkout_session': {'ip': '100/m', 'user': '1/m'}},
+)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = 1_000_000_000
+        patcher = mock.patch.object(ratelimit, '_now_ms', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self, **extra):
+        return self.client.post(reverse('login'), {'username': 'nobody', 'password': 'wrong'}, **extra)
+
+    def test_burst_then_refill(self):
+        self.assertEqual([self.login().status_code for _ in range(3)], [200] * 3)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+        # Showing the form is free, and being turned away doesn't use a token.
+        self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+        self.now += 19_000
+        self.assertEqual(self.login().status_code, 429)
+        self.now += 1_000
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login().status_code, 429)
+        self.now += 60_000
+        self.assertEqual([self.login().status_code for _ in range(4)], [200, 200, 200, 429])
+
+    @override_settings(RATE_LIMIT_PROXY_COUNT=1)
+    def test_buckets_are_per_client_ip(self):
+        for _ in range(3):
+            self.login(HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='203.0.113.7').status_code, 429)
+        # A forged leading address doesn't buy a fresh bucket.
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='10.0.0.1, 203.0.113.7').status_code, 429)
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='203.0.113.8').status_code, 200)
+
+    @override_settings(RATE_LIMIT_PROXY_COUNT=2)
+    def test_client_ip_behind_two_proxies(self):
+        def ip(forwarded):
+            return ratelimit.client_ip(RequestFactory().get('/', HTTP_X_FORWARDED_FOR=forwarded))
+        self.assertEqual(ip('10.0.0.1, 203.0.113.7, 192.0.2.1'), '203.0.113.7')
+        # Straight to the inner proxy: only it added an address.
+        self.assertEqual(ip('203.0.113.7'), '203.0.113.7')
+        self.assertEqual(ratelimit.client_ip(RequestFactory().get('/')), '127.0.0.1')
+
+    @override_settings(PAYMENT_BACKEND='store.payments.StubBackend', PAYMENT_STUB_LATENCY=0)
+    def test_buckets_are_per_user(self):
+        payments.reset_backend()
+        self.addCleanup(payments.reset_backend)
+        product = make_product()
+        users = [User.objects.create_user(f'shopper{i}', password='pass12345') for i in range(2)]
+        for user in users:
+            fill_cart(user, {product: 1})
+            self.client.force_login(user)
+            self.assertEqual(self.client.post(reverse('create_checkout_session')).status_code, 200)
+        response = self.client.post(reverse('create_checkout_session'), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertIn('Too many requests', response.json()['error'])
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name, price, category in [
+            ('Cheap novel', '50.00', 'books'), ('Hardback', '300.00', 'books'), ('Atlas', '1200.00', 'books'),
+            ('Cheap socks', '80.00', 'clothing'), ('Coat', '700.00', 'clothing'),
+            ('Cheap cable', '99.99', 'electronics'),
+        ]:
+            make_product(name, price, category)
+
+    def counts(self, facet):
+        return {value: count for value, _, count, _ in facet}
+
+    def test_counts_ignore_their_own_selection(self):
+        with self.assertNumQueries(1):
+            result = facets.facets('', 'books', 'under-100')
+        self.assertEqual(self.counts(result['categories']),
+                         {'electronics': 1, 'clothing': 1, 'books': 1, 'grocery': 0})
+        self.assertEqual(self.counts(result['prices']),
+                         {'under-100': 1, '100-250': 0, '250-500': 1, '500-1000': 0, '1000-up': 1})
+        # Other combinations for the same search come from the cache.
+        with self.assertNumQueries(0):
+            result = facets.facets('', None, 'bogus')
+        self.assertEqual(self.counts(result['categories'])['books'], 3)
+        self.assertEqual(self.counts(result['prices'])['under-100'], 3)
+
+    def test_counts_follow_search_and_edits(self):
+        self.assertEqual(self.counts(facets.facets('cheap', None, None)['categories'])['electronics'], 1)
+        Product.objects.get(name='Cheap cable').delete()
+        self.assertEqual(self.counts(facets.facets('cheap', None, None)['categories'])['electronics'], 0)
+
+    def test_listing_filters_by_price_band(self):
+        response = self.client.get(reverse('product_list'), {'price': 'under-100'})
+        self.assertEqual({p.name for p in response.context['products']}, {'Cheap novel', 'Cheap socks', 'Cheap cable'})
+        self.assertContains(response, 'Books (1)')
+        response = self.client.get(reverse('product_list'), {'price': '100-250', 'category': 'books'})
+        self.assertContains(response, 'No products found.')
+        names = {p['name'] for p in self.client.get(reverse('api_product_list'), {'price': '1000-up'}).json()['results']}
+        self.assertEqual(names, {'Atlas'})
+
+
+class TypeaheadIndexTests(TestCase):
+    def brute_force(self, rows, query, limit):
+        *whole, prefix = typeahead.words(query)
+        matches = [
+            (popularity, pk, name) for pk, (name, popularity) in rows.items()
+            if set(whole) <= set(typeahead.words(name))
+            and any(word.startswith(prefix) for word in typeahead.words(name))
+        ]
+        return [(pk, name) for _, pk, name in sorted(matches, reverse=True)[:limit]]
+
+    def test_ranks_by_popularity_and_narrows_by_earlier_words(self):
+        index = typeahead.TypeaheadIndex([
+            (1, 'Wireless Headphones', 5), (2, 'Wired Headphones', 9), (3, 'Wireless Mouse', 1), (4, 'Wool Hat', 0),
+        ])
+        self.assertEqual(index.suggest('wi'),
+                         [(2, 'Wired Headphones'), (1, 'Wireless Headphones'), (3, 'Wireless Mouse')])
+        self.assertEqual(index.suggest('W', limit=1), [(2, 'Wired Headphones')])
+        self.assertEqual(index.suggest('wireless h'), [(1, 'Wireless Headphones')])
+        self.assertEqual(index.suggest('headphones w'), [(2, 'Wired Headphones'), (1, 'Wireless Headphones')])
+        self.assertEqual(index.suggest('nothing h'), [])
+        self.assertEqual(index.suggest('  '), [])
+
+    def test_rankings_match_brute_force(self):
+        rng = random.Random(7)
+        vocabulary = ['alpha', 'alps', 'amber', 'apex', 'beta', 'bet', 'bolt', 'brisk']
+        rows = {pk: (' '.join(rng.sample(vocabulary, 2)), rng.randrange(5)) for pk in range(1, 300)}
+        index = typeahead.TypeaheadIndex((pk, name, popularity) for pk, (name, popularity) in rows.items())
+        for query in ['a', 'al', 'alp', 'b', 'be', 'bet', 'alpha b', 'bolt a', 'brisk', 'beta alps a', 'al']:
+            self.assertEqual(index.suggest(query, typeahead.MAX_RESULTS),
+                             self.brute_force(rows, query, typeahead.MAX_RESULTS), query)
+
+
+@override_settings(TYPEAHEAD_REFRESH_SECONDS=0)
+class TypeaheadEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        typeahead.reset()
+        self.addCleanup(typeahead.reset)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lamp = make_product('Desk Lamp')
+            self.light = make_product('Desk Light')
+
+    def suggest(self, q):
+        response = self.client.get(reverse('product_suggestions'), {'q': q})
+        self.assertIn('typeahead;dur=', response['Server-Timing'])
+        return [result['name'] for result in response.json()['results']]
+
+    def test_follows_new_renamed_and_deleted_products(self):
+        self.assertEqual(self.suggest('desk l'), ['Desk Light', 'Desk Lamp'])
+        with self.captureOnCommitCallbacks(execute=True):
+            make_product('Desk Lantern')
+        self.assertEqual(self.suggest('desk lan'), ['Desk Lantern'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.light.name = 'Floor Light'
+            self.light.save()
+        self.assertEqual(self.suggest('desk'), ['Desk Lantern', 'Desk Lamp'])
+        self.assertEqual(self.suggest('lig'), ['Floor Light'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lamp.delete()
+        self.assertEqual(self.suggest('desk'), ['Desk Lantern'])
+
+    def test_reviews_and_other_edits_leave_the_shared_version_alone(self):
+        self.assertEqual(self.suggest('desk l'), ['Desk Light', 'Desk Lamp'])
+        version = caching.typeahead_version()
+        user = User.objects.create_user('critic', password='pass12345')
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.lamp, user=user, rating=5, comment='Bright')
+            self.light.price = Decimal('2.00')
+            self.light.save()
+        self.assertEqual(caching.typeahead_version(), version)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('desk l'), ['Desk Light', 'Desk Lamp'])
+        # Review counts are picked up once the index is old enough.
+        with self.settings(TYPEAHEAD_MAX_AGE_SECONDS=0):
+            self.assertEqual(self.suggest('desk l'), ['Desk Lamp', 'Desk Light'])
+
+    def test_rebuilds_after_changes_elsewhere(self):
+        self.assertEqual(self.suggest('desk'), ['Desk Light', 'Desk Lamp'])
+        # A bulk write, or another worker, that this process didn't apply.
+        Product.objects.filter(pk=self.lamp.pk).update(name='Table Lamp')
+        caching.invalidate_typeahead()
+        self.assertEqual(self.suggest('desk'), ['Desk Light'])
+        self.assertEqual(self.suggest('table'), ['Table Lamp'])
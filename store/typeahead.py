@@ -0,0 +1,216 @@
+"""
+Product name typeahead.
+
+Each worker keeps an in-memory index of the words in product names: a
+sorted list of the distinct words and, per word, the products using it. The
+words starting with a prefix are one contiguous slice of that list, found
+with two bisections. The best matches for a prefix, ranked by popularity
+(review count, newest first on ties), are memoized, so typing "s" doesn't
+rank thousands of products again on every keystroke. Words typed in full
+before the last one narrow the matches by set intersection. Lookups take
+microseconds to a few hundred, however large the catalog;
+``manage.py bench_typeahead`` measures them.
+
+The index is built on first use, or at startup by ``warm()``, and never
+changed afterwards; it is rebuilt instead. Adding, renaming or deleting a
+product bumps a version shared through the cache once the transaction
+commits (see ``store.signals``), as do bulk writes that bypass signals,
+such as catalog imports. Each worker looks at that version at most every
+``TYPEAHEAD_REFRESH_SECONDS`` and rebuilds when it moved. Reviews only
+change the ranking, so they don't bump it: an index older than
+``TYPEAHEAD_MAX_AGE_SECONDS`` is rebuilt on its next lookup, which picks
+up new review counts.
+"""
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from .caching import invalidate_typeahead, typeahead_version
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESULTS = 8
+MAX_RESULTS = 20
+MEMO_SIZE = 50_000  # memoized prefixes kept before starting over
+WALK_LIMIT = 200  # products tried in rank order before intersecting sets instead
+WARM_PREFIX_LENGTH = 2  # prefixes this short are ranked when the index is built
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_LAST = chr(0x10FFFF)
+
+
+def words(text):
+    return _WORD_RE.findall(text.lower())
+
+
+class TypeaheadIndex:
+    """Read-only prefix index over ``(id, name, popularity)`` rows. Safe to share between threads."""
+
+    def __init__(self, rows=()):
+        self._products = {}  # id -> (name, popularity, words)
+        self._postings = {}  # word -> ids
+        self._memo = {}  # prefix -> ids of its best matches, best first
+        self._ranked = {}  # word -> all its ids, best first; built for words typed in full
+        self._lock = threading.Lock()
+        for pk, name, popularity in rows:
+            product_words = tuple(set(words(name)))
+            self._products[pk] = (name, popularity, product_words)
+            for word in product_words:
+                self._postings.setdefault(word, set()).add(pk)
+        self._words = sorted(self._postings)
+        # The first keystrokes match the most products; rank those up front.
+        for length in range(1, WARM_PREFIX_LENGTH + 1):
+            for prefix in {word[:length] for word in self._words}:
+                self._best(prefix)
+
+    def __len__(self):
+        return len(self._products)
+
+    def _rank(self, pk):
+        return self._products[pk][1], pk
+
+    def _remember(self, memo, key, value):
+        if len(memo) >= MEMO_SIZE:
+            memo.clear()
+        memo[key] = value
+        return value
+
+    def _matching_words(self, prefix):
+        start = bisect.bisect_left(self._words, prefix)
+        return self._words[start:bisect.bisect_left(self._words, prefix + _LAST, start)]
+
+    def _best(self, prefix):
+        best = self._memo.get(prefix)
+        if best is None:
+            matches = set().union(*(self._postings[word] for word in self._matching_words(prefix)))
+            best = self._remember(self._memo, prefix, heapq.nlargest(MAX_RESULTS, matches, key=self._rank))
+        return best
+
+    def _all_ranked(self, word):
+        ranked = self._ranked.get(word)
+        if ranked is None:
+            ranked = self._remember(self._ranked, word, sorted(self._postings[word], key=self._rank, reverse=True))
+        return ranked
+
+    def _best_with(self, whole, prefix, limit):
+        if any(word not in self._postings for word in whole):
+            return []
+        rarest, *others = sorted(whole, key=lambda word: len(self._postings[word]))
+        others = [self._postings[word] for word in others]
+        candidates = self._postings[rarest]
+        matching = self._matching_words(prefix)
+        if sum(len(self._postings[word]) for word in matching) > len(candidates):
+            # Many products match the prefix, so the rarest word's best
+            # products probably do too: try those first.
+            best = []
+            for pk in self._all_ranked(rarest)[:WALK_LIMIT]:
+                if all(pk in ids for ids in others) and any(
+                    word.startswith(prefix) for word in self._products[pk][2]
+                ):
+                    best.append(pk)
+                    if len(best) == limit:
+                        return best
+            if len(candidates) <= WALK_LIMIT:
+                return best
+        # Intersect word by word, each set op only as long as the shorter side.
+        matches = set().union(*(self._postings[word] & candidates for word in matching)).intersection(*others)
+        if len(matches) <= WALK_LIMIT:
+            return heapq.nlargest(limit, matches, key=self._rank)
+        # Plenty of matches: membership tests down the ranked list beat ranking them all.
+        best = []
+        for pk in self._all_ranked(rarest):
+            if pk in matches:
+                best.append(pk)
+                if len(best) == limit:
+                    break
+        return best
+
+    def suggest(self, query, limit=DEFAULT_RESULTS):
+        """
+        The ``limit`` most popular products whose names contain every word
+        of ``query``, the last one as a prefix: ``[(id, name), ...]``.
+        """
+        *whole, prefix = words(query) or ['']
+        if not prefix:
+            return []
+        with self._lock:
+            ranked = self._best_with(whole, prefix, limit) if whole else self._best(prefix)[:limit]
+            return [(pk, self._products[pk][0]) for pk in ranked]
+
+
+def build():
+    return TypeaheadIndex(Product.objects.values_list('id', 'name', 'review_count').iterator(chunk_size=5000))
+
+
+_index = None
+_version = None  # shared version the index reflects
+_built = float('-inf')
+_checked = float('-inf')
+_state_lock = threading.Lock()
+
+
+def refresh_seconds():
+    return getattr(settings, 'TYPEAHEAD_REFRESH_SECONDS', 5)
+
+
+def max_age_seconds():
+    return getattr(settings, 'TYPEAHEAD_MAX_AGE_SECONDS', 300)
+
+
+def get_index():
+    global _index, _version, _built, _checked
+    if _index is not None and time.monotonic() - _checked < refresh_seconds():
+        return _index
+    with _state_lock:
+        now = time.monotonic()
+        if _index is None or now - _checked >= refresh_seconds():
+            # Read before building, so a change made meanwhile triggers another rebuild.
+            current = typeahead_version()
+            if _index is None or current != _version or now - _built >= max_age_seconds():
+                _index, _version, _built = build(), current, now
+            _checked = time.monotonic()
+    return _index
+
+
+def suggest(query, limit=DEFAULT_RESULTS):
+    return get_index().suggest(query, limit)
+
+
+def warm():
+    """Start building the index in the background, e.g. when a worker starts."""
+    def run():
+        try:
+            get_index()
+        except DatabaseError:
+            logger.warning("Couldn't build the typeahead index; it will be built on first use", exc_info=True)
+        finally:
+            connection.close()
+
+    threading.Thread(target=run, name='typeahead-warm', daemon=True).start()
+
+
+def reset():
+    """Forget the index; the next lookup rebuilds it."""
+    global _index, _version, _built, _checked
+    with _state_lock:
+        _index, _version, _built, _checked = None, None, float('-inf'), float('-inf')
+
+
+def _names_changed():
+    global _checked
+    invalidate_typeahead()
+    with _state_lock:
+        # Look at the new version on the next lookup, not a refresh later.
+        _checked = float('-inf')
+
+
+def names_changed():
+    """A product was added, renamed or deleted; every worker rebuilds once this commits."""
+    transaction.on_commit(_names_changed)
@@ -12,6 +12,7 @@ urlpatterns = [
      path('logout/', views.user_logout, name='user_logout'),
     path('create-checkout-session/', views.create_checkout_session, name='create_checkout_session'),
     path('success/', views.payment_success, name='payment_success'),
+    path('payments/webhook/', views.payment_webhook, name='payment_webhook'),
     path('my-orders/', views.my_orders, name='my_orders'),  # 👈 add this
     path('update_quantity/<int:product_id>/', views.update_quantity, name='update_quantity'),
     path('add-product/', add_product, name='add_product'),
@@ -19,9 +20,20 @@ urlpatterns = [
     path('product/<int:product_id>/add-review/', add_review, name='add_review'),
     path('product/<int:product_id>/add-to-wishlist/', add_to_wishlist, name='add_to_wishlist'),
     path('wishlist/', wishlist, name='wishlist'),
+    path('wishlist/toggle/<int:product_id>/', views.toggle_wishlist, name='toggle_wishlist'),
     path('wishlist/remove/<int:product_id>/', remove_from_wishlist, name='remove_from_wishlist'),
     path('profile/', profile, name='profile'),
     path('order/<int:order_id>/', order_detail, name='order_detail'),
     path('manage-orders/', views.manage_orders, name='manage_orders'),
+    path('sales/', views.sales_dashboard, name='sales_dashboard'),
+    path('catalog/import/', views.catalog_import, name='catalog_import'),
+    path('catalog/import/<int:job_id>/', views.catalog_import_status, name='catalog_import_status'),
+    path('catalog/export/', views.catalog_export, name='catalog_export'),
+    path('api/products/', views.api_product_list, name='api_product_list'),
+    path('api/products/<int:product_id>/', views.api_product_detail, name='api_product_detail'),
+    path('api/products/<int:product_id>/reviews/', views.api_product_reviews, name='api_product_reviews'),
+    path('search/suggest/', views.product_suggestions, name='product_suggestions'),
+    # No trailing slash: Prometheus scrapes /metrics by default.
+    path('metrics', views.metrics_endpoint, name='metrics'),
 ]
 
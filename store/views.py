@@ -4,118 +4,193 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
-import stripe
 from django.conf import settings
-from django.http import JsonResponse
-from .models import Product, Order, Review, Wishlist
-from .forms import ProductForm, ReviewForm, UserProfileForm, OrderStatusForm
-from django.views.decorators.http import require_POST
-from django.core.paginator import Paginator
-from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+import logging
+from asgiref.sync import sync_to_async
+from datetime import datetime, time, timedelta
+from functools import partial
+from time import perf_counter
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from .models import DailyCategorySales, DailyProductSales, DailySales, Job, Product, Order, Review, Wishlist
+from .forms import (
+    ProductForm, ReviewForm, UserProfileForm, OrderFilterForm, BulkOrderStatusForm, CatalogImportForm, SalesDashboardForm,
+)
+from . import api, catalog_io, facets, inventory, metrics, payments, recommendations, typeahead, wishlists
+from .cart import Cart, get_cart_store
+from .search import search_products
+from .pagination import KeysetPaginator
+from .routers import replica_reads
+from .orders import CheckoutExpired, CheckoutTokenTaken, place_order, set_status
+from .tasks import IMPORT_CATALOG, enqueue_catalog_import
+from .caching import cache_anonymous_page, catalog_version, get_or_compute, make_key, product_version
+from django.views.decorators.http import require_POST, require_safe
 from django.contrib.admin.views.decorators import staff_member_required
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+logger = logging.getLogger(__name__)
+
+CHECKOUT_SESSION_KEY = 'checkout_session_id'
+
+
+# Only the checkout views, which wait on the payment provider, are async:
+# served over ASGI they don't hold a worker during that wait. Everything
+# else stays sync, so the default WSGI deployment runs it without an
+# async_to_sync hop (see RENDER_DEPLOY.md). Code that is synchronous by
+# nature (transactions, and template rendering, which may touch
+# request.user or the session) runs in a single sync_to_async hop.
+async def arender(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
 @login_required
-def create_checkout_session(request):
+async def create_checkout_session(request):
     if request.method == 'POST':
-        YOUR_DOMAIN = "http://127.0.0.1:8000"
-        cart = request.session.get('cart', {})
-        line_items = []
-
-        total = 0
-
-        for product_id, quantity in cart.items():
-            product = get_object_or_404(Product, pk=product_id)
-            subtotal = int(product.price * quantity * 100)  # Convert ₹ to paise
-            line_items.append({
-                'price_data': {
-                    'currency': 'inr',
-                    'product_data': {
-                        'name': product.name,
-                    },
-                    'unit_amount': int(product.price * 100),  # price in paise
-                },
-                'quantity': quantity,
-            })
-            total += subtotal
+        cart = await Cart.aload(request)
+        if not cart:
+            return JsonResponse({'error': 'Your cart is empty.'}, status=400)
+        success_url = request.build_absolute_uri(reverse('payment_success')) + '?session_id={CHECKOUT_SESSION_ID}'
+        cancel_url = request.build_absolute_uri(reverse('view_cart'))
 
         try:
-            checkout_session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=line_items,
-                mode='payment',
-                success_url=YOUR_DOMAIN + '/success/',
-                cancel_url=YOUR_DOMAIN + '/cart/',
+            hold, expires_at = await sync_to_async(inventory.reserve)(list(cart))
+        except inventory.OutOfStock as e:
+            return JsonResponse({'error': str(e)}, status=409)
+
+        try:
+            # The session expires with the hold, so nobody pays for released stock.
+            checkout_session = await payments.astart_checkout(
+                cart, success_url, cancel_url, expires_at, reference=str(cart.user.pk),
             )
+            await sync_to_async(inventory.attach)(hold, checkout_session.id)
+            await request.session.aset(CHECKOUT_SESSION_KEY, checkout_session.id)
             return JsonResponse({'id': checkout_session.id})
         except Exception as e:
-            return JsonResponse({'error': str(e)})
+            await sync_to_async(inventory.release)(hold)
+            logger.exception("Could not start checkout for user %s", cart.user.pk)
+            return JsonResponse({'error': str(e)}, status=502)
 
 
-def product_list(request):
-    category = request.GET.get('category')
-    query = request.GET.get('q')
-    page_number = request.GET.get('page')
-
-    products = Product.objects.all()
+@csrf_exempt
+@require_POST
+def payment_webhook(request):
+    try:
+        event = payments.parse_webhook(request.body, request.headers.get('Stripe-Signature', ''))
+    except payments.WebhookError:
+        return HttpResponse(status=400)
+
+    if event['type'] in ('checkout.session.completed', 'checkout.session.async_payment_succeeded'):
+        session = event['data']['object']
+        if session.get('payment_status') == 'paid':
+            # The buyer may never come back to the success page, so the
+            # order is placed here as well; whichever comes first creates it.
+            session_id, reference = session['id'], str(session.get('client_reference_id') or '')
+            user = User.objects.filter(pk=int(reference)).first() if reference.isdigit() else None
+            # Redelivering the event can't fix any of these; someone has to look.
+            if user is None:
+                logger.error("Paid checkout %s has no known buyer (%r)", session_id, reference)
+            else:
+                try:
+                    place_order(user, session_id)
+                except (CheckoutTokenTaken, CheckoutExpired):
+                    logger.error("Paid checkout %s could not become an order", session_id, exc_info=True)
+            Order.objects.filter(checkout_token=session_id, paid_at__isnull=True).update(paid_at=timezone.now())
+    return HttpResponse(status=200)
+
+
+PRODUCTS_PER_PAGE = 6
+
+
+def _catalog(products, category, query, sort, price=None):
+    """The storefront's filters and orderings, shared with the JSON API."""
+    if sort == 'rating':
+        products = products.order_by('-rating_avg', '-id')
+    else:
+        products = products.order_by('-created_at', '-id')
 
     if category:
         products = products.filter(category=category)
+    products = facets.filter_price(products, price)
 
     if query:
-        products = products.filter(name__icontains=query) | products.filter(description__icontains=query)
+        products = search_products(products, query)
+        if sort == 'rating':
+            products = products.order_by('-rating_avg', '-id')
+    return products
 
-    paginator = Paginator(products, 6)  # Show 6 products per page
-    page_obj = paginator.get_page(page_number)
 
-    categories = Product.CATEGORY_CHOICES
+@cache_anonymous_page(catalog_version)
+@replica_reads
+def product_list(request):
+    category = request.GET.get('category')
+    cursor = request.GET.get('cursor')
+    sort = request.GET.get('sort')
+    price = request.GET.get('price')
+    products = _catalog(Product.objects.all(), category, request.GET.get('q'), sort, price)
+    paginator = KeysetPaginator(products, PRODUCTS_PER_PAGE)
+
+    # Legacy ?page=N links: resolve the page boundary once and redirect.
+    page_number = request.GET.get('page')
+    if page_number is not None:
+        params = request.GET.copy()
+        del params['page']
+        try:
+            offset = (int(page_number) - 1) * PRODUCTS_PER_PAGE
+        except ValueError:
+            offset = 0
+        legacy_cursor = paginator.cursor_for_offset(offset)
+        if legacy_cursor:
+            params['cursor'] = legacy_cursor
+        return redirect(f"{request.path}?{params.urlencode()}" if params else request.path)
+
+    version = catalog_version()
+    page_obj = get_or_compute(
+        make_key('catalog-page', version, request.get_full_path()),
+        lambda: paginator.get_page(cursor),
+    )
+    facet_counts = facets.facets(request.GET.get('q'), category, price)
+    # The grid fragment is shared; keying it by which of its cards are on
+    # the visitor's wishlist lets the buttons be rendered on the server.
+    wishlist_ids = wishlists.product_ids(request)
+    wishlisted = [product.id for product in page_obj.object_list if product.id in wishlist_ids]
+
+    filters = request.GET.copy()
+    filters.pop('cursor', None)
+
     return render(request, 'store/product_list.html', {
         'products': page_obj.object_list,
-        'categories': categories,
+        'facets': facet_counts,
         'selected_category': category,
-        'page_obj': page_obj
+        'selected_sort': sort,
+        'page_obj': page_obj,
+        'filter_query': filters.urlencode(),
+        'catalog_cache_version': version,
+        'wishlisted_on_page': wishlisted,
     })
 
 
 
 @login_required
 def add_to_cart(request, product_id):
-    product = get_object_or_404(Product, pk=product_id)
-    cart = request.session.get('cart', {})
-
-    if str(product_id) in cart:
-        cart[str(product_id)] += 1
-    else:
-        cart[str(product_id)] = 1
-
-    request.session['cart'] = cart
+    product = get_object_or_404(Product.objects.only('id'), pk=product_id)
+    get_cart_store().incr(request.user, product.id)
     return redirect('product_list')
 @login_required
 def view_cart(request):
-    cart = request.session.get('cart', {})
-    cart_items = []
-    total = 0
-
-    for product_id, quantity in cart.items():
-        product = get_object_or_404(Product, pk=product_id)
-        subtotal = product.price * quantity
-        cart_items.append({
-            'product': product,
-            'quantity': quantity,
-            'subtotal': subtotal
-        })
-        total += subtotal
-
-    return render(request, 'store/cart.html', {'cart_items': cart_items, 'total': total,
-                                                'STRIPE_PUBLISHABLE_KEY': settings.STRIPE_PUBLISHABLE_KEY})
+    cart = Cart(request)
+    return render(request, 'store/cart.html', {'cart_items': cart.lines, 'total': cart.total,
+                                               'STRIPE_PUBLISHABLE_KEY': settings.STRIPE_PUBLISHABLE_KEY})
 @login_required
 def remove_from_cart(request, product_id):
-    cart = request.session.get('cart', {})
-    if str(product_id) in cart:
-        del cart[str(product_id)]
-        request.session['cart'] = cart
+    get_cart_store().delete(request.user, product_id)
     return redirect('view_cart')
 
 def register(request):
@@ -136,8 +211,9 @@ def user_login(request):
         if form.is_valid():
             user = form.get_user()
             login(request, user)
+            logger.info("Logged in: %s", user.username)
             return redirect('product_list')
-        print("Logged in:", user.username)
+        logger.info("Failed login for %r", request.POST.get('username', ''))
 
     else:
         form = AuthenticationForm()
@@ -149,40 +225,52 @@ def user_logout(request):
     return redirect('product_list')
 
 @login_required
-@login_required
-def payment_success(request):
-    cart = request.session.get('cart', {})
-    message_lines = []
-
-    for product_id, quantity in cart.items():
-        product = get_object_or_404(Product, pk=product_id)
-        Order.objects.create(user=request.user, product=product, quantity=quantity)
-        message_lines.append(f"{product.name} x {quantity} - ₹{product.price * quantity}")
-
-    request.session['cart'] = {}  # Clear cart
-
-    # ✅ Email logic
-    subject = 'Thank you for your order!'
-    message = f"Hi {request.user.username},\n\nYour order was successful:\n\n"
-    message += '\n'.join(message_lines)
-    message += "\n\nWe'll notify you once it's shipped!\n\nTeam E-Commerce"
-
-    send_mail(subject, message, None, [request.user.email])
+async def payment_success(request):
+    # The Stripe Checkout Session id is the idempotency key: replays of the
+    # success URL find the order it, or the webhook, already created. The
+    # order is built from the lines reserved at checkout, not from the cart,
+    # which may have changed since. Anyone can put an id in the URL, so a
+    # new one only becomes an order once the provider confirms this user
+    # started that session and paid for it.
+    token = request.GET.get('session_id') or await request.session.aget(CHECKOUT_SESSION_KEY)
+    if not token:
+        return redirect('view_cart')
+
+    user = await request.auser()
+    order = await Order.objects.filter(checkout_token=token).afirst()
+    if order is not None and order.user_id != user.pk:
+        raise Http404("No such order.")
+    if order is None:
+        checkout = await payments.aget_checkout(token)
+        if checkout is None or checkout.reference != str(user.pk):
+            raise Http404("No such checkout.")
+        if not checkout.paid:
+            messages.info(request, "Your payment hasn't gone through yet.")
+            return redirect('view_cart')
+        try:
+            order, _ = await sync_to_async(place_order)(user, token)
+        except CheckoutTokenTaken:
+            raise Http404("No such order.")
+        except CheckoutExpired:
+            logger.error("Paid checkout %s could not become an order", token)
+            messages.error(request, "Your checkout expired before it was paid for. Please contact us.")
+            return redirect('view_cart')
+    await request.session.apop(CHECKOUT_SESSION_KEY, None)
 
-    return render(request, 'store/payment_success.html')
+    return await arender(request, 'store/payment_success.html', {'order': order})
 
 @login_required
 def my_orders(request):
-    orders = Order.objects.filter(user=request.user).order_by('-ordered_at')
+    orders = Order.objects.filter(user=request.user).prefetch_related('items__product').order_by('-ordered_at', '-id')
     return render(request, 'store/my_orders.html', {'orders': orders})
 @login_required
 def update_quantity(request, product_id):
     if request.method == 'POST':
         quantity = int(request.POST.get('quantity', 1))
-        cart = request.session.get('cart', {})
-        if str(product_id) in cart:
-            cart[str(product_id)] = quantity
-            request.session['cart'] = cart
+        if quantity > 0:
+            get_cart_store().set(request.user, product_id, quantity)
+        else:
+            get_cart_store().delete(request.user, product_id)
     return redirect('view_cart')
 
 from .forms import ProductForm
@@ -199,16 +287,22 @@ def add_product(request):
         form = ProductForm()
     return render(request, 'store/add_product.html', {'form': form})
 
+REVIEWS_ON_DETAIL = 10
+
+
+@replica_reads
 def product_detail(request, product_id):
     product = get_object_or_404(Product, pk=product_id)
-    reviews = product.reviews.select_related('user').order_by('-created_at')
-    related_products = Product.objects.filter(category=product.category).exclude(id=product.id)[:3]
-    review_form = ReviewForm()
+    # Both stay lazy: the template only runs them when its cached fragments miss.
+    reviews = product.reviews.select_related('user').order_by('-created_at', '-id')[:REVIEWS_ON_DETAIL]
+    related_products = partial(recommendations.related_products, product)
     return render(request, 'store/product_detail.html', {
         'product': product,
         'reviews': reviews,
         'related_products': related_products,
-        'review_form': review_form
+        'review_form': ReviewForm(),
+        'catalog_cache_version': catalog_version(),
+        'product_cache_version': product_version(product.id),
     })
 
 @login_required
@@ -220,7 +314,8 @@ def add_review(request, product_id):
             review = form.save(commit=False)
             review.product = product
             review.user = request.user
-            review.save()
+            with transaction.atomic():
+                review.save()
     return redirect('product_detail', product_id=product.id)
 
 @login_required
@@ -229,6 +324,15 @@ def add_to_wishlist(request, product_id):
     Wishlist.objects.get_or_create(user=request.user, product=product)
     return redirect('product_detail', product_id=product.id)
 
+@require_POST
+def toggle_wishlist(request, product_id):
+    """JSON for the wishlist buttons on product cards: no redirect, no re-render."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "Log in to use the wishlist."}, status=401)
+    if not Product.objects.filter(pk=product_id).exists():
+        return JsonResponse({'error': "Product not found."}, status=404)
+    return JsonResponse({'product_id': product_id, 'in_wishlist': wishlists.toggle(request.user, product_id)})
+
 @login_required
 def wishlist(request):
     items = Wishlist.objects.filter(user=request.user).select_related('product')
@@ -259,21 +363,235 @@ def profile(request):
 @login_required
 def order_detail(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
-    total = order.product.price * order.quantity
-    return render(request, 'store/order_detail.html', {'order': order, 'total': total})
+    items = order.items.all()
+    return render(request, 'store/order_detail.html', {'order': order, 'items': items, 'total': order.total})
+
+ORDERS_PER_PAGE = 50
+
 
 @staff_member_required
 def manage_orders(request):
-    orders = Order.objects.all().order_by('-ordered_at')
     if request.method == 'POST':
-        order_id = request.POST.get('order_id')
-        order = get_object_or_404(Order, id=order_id)
-        form = OrderStatusForm(request.POST, instance=order)
+        bulk_form = BulkOrderStatusForm(request.POST)
+        if bulk_form.is_valid():
+            # One UPDATE for the whole selection.
+            updated = set_status(bulk_form.order_ids, bulk_form.cleaned_data['status'])
+            messages.success(request, f"{updated} order(s) marked {bulk_form.cleaned_data['status']}.")
+        else:
+            for error in bulk_form.non_field_errors():
+                messages.error(request, error)
+        return redirect(request.get_full_path())
+
+    orders = Order.objects.select_related('user').prefetch_related('items').order_by('-ordered_at', '-id')
+    filter_form = OrderFilterForm(request.GET or None)
+    if filter_form.is_valid():
+        data = filter_form.cleaned_data
+        if data['status']:
+            orders = orders.filter(status=data['status'])
+        if data['user']:
+            orders = orders.filter(user__username=data['user'])
+        # Compare against datetimes rather than ordered_at__date so the
+        # (…, ordered_at, id) indexes can serve the range.
+        if data['date_from']:
+            orders = orders.filter(ordered_at__gte=timezone.make_aware(datetime.combine(data['date_from'], time.min)))
+        if data['date_to']:
+            end = datetime.combine(data['date_to'] + timedelta(days=1), time.min)
+            orders = orders.filter(ordered_at__lt=timezone.make_aware(end))
+
+    page_obj = KeysetPaginator(orders, ORDERS_PER_PAGE).get_page(request.GET.get('cursor'))
+    filters = request.GET.copy()
+    filters.pop('cursor', None)
+    return render(request, 'store/manage_orders.html', {
+        'orders': page_obj.object_list,
+        'page_obj': page_obj,
+        'filter_form': filter_form,
+        'filter_query': filters.urlencode(),
+        'status_choices': Order.STATUS_CHOICES,
+    })
+
+
+TOP_PRODUCTS_SHOWN = 20
+
+
+@staff_member_required
+def sales_dashboard(request):
+    # Reads only the rollups (see store.sales): the cost follows the number
+    # of days shown, not the number of orders.
+    form = SalesDashboardForm(request.GET or None)
+    days, category = 30, ''
+    if form.is_valid():
+        days, category = form.cleaned_data['days'], form.cleaned_data['category']
+    since = timezone.localdate() - timedelta(days=days - 1)
+    totals = {'units': Sum('units'), 'revenue': Sum('revenue'), 'orders': Sum('orders')}
+
+    if category:
+        daily = DailyCategorySales.objects.filter(day__gte=since, category=category)
+    else:
+        daily = DailySales.objects.filter(day__gte=since)
+    labels = dict(Product.CATEGORY_CHOICES)
+    categories = [
+        {**row, 'label': labels.get(row['category'], row['category'] or 'Uncategorized')}
+        for row in DailyCategorySales.objects.filter(day__gte=since)
+        .values('category').annotate(**totals).order_by('-revenue')
+    ]
+    products = DailyProductSales.objects.filter(day__gte=since)
+    if category:
+        products = products.filter(category=category)
+    top_products = (
+        products.values('product_id').annotate(product_name=Max('product_name'), **totals)
+        .order_by('-revenue', 'product_id')[:TOP_PRODUCTS_SHOWN]
+    )
+    return render(request, 'store/sales_dashboard.html', {
+        'form': form,
+        'since': since,
+        'summary': daily.aggregate(**totals),
+        'daily': daily.order_by('-day'),
+        'categories': categories,
+        'top_products': top_products,
+    })
+
+
+CATALOG_IMPORTS_SHOWN = 10
+
+
+@staff_member_required
+def catalog_import(request):
+    if request.method == 'POST':
+        form = CatalogImportForm(request.POST, request.FILES)
         if form.is_valid():
-            form.save()
-            messages.success(request, f"Order #{order.id} status updated.")
-            return redirect('manage_orders')
+            upload = form.cleaned_data['file']
+            fmt = form.cleaned_data['format'] or catalog_io.format_for(upload.name)
+            # Large uploads are already spooled to a temp file; the worker
+            # streams the stored copy, so the request returns immediately.
+            path = default_storage.save(f'catalog_imports/{upload.name}', upload)
+            enqueue_catalog_import(path, fmt)
+            messages.success(request, f"Import of {upload.name} queued.")
+            return redirect('catalog_import')
     else:
-        form = OrderStatusForm()
-    return render(request, 'store/manage_orders.html', {'orders': orders, 'form': form})
+        form = CatalogImportForm()
+    imports = Job.objects.filter(kind=IMPORT_CATALOG).order_by('-id')[:CATALOG_IMPORTS_SHOWN]
+    return render(request, 'store/catalog_import.html', {'form': form, 'imports': imports})
+
+
+@staff_member_required
+def catalog_import_status(request, job_id):
+    job = get_object_or_404(Job, pk=job_id, kind=IMPORT_CATALOG)
+    return JsonResponse({
+        'status': job.status,
+        'attempts': job.attempts,
+        'last_error': job.last_error,
+        **job.payload.get('progress', {}),
+    })
+
+
+@staff_member_required
+def catalog_export(request):
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in catalog_io.FORMATS:
+        fmt = 'csv'
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(catalog_io.export_catalog(fmt), content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="catalog.{fmt}"'
+    return response
+
+
+@require_safe
+def api_product_list(request):
+    try:
+        fields = api.requested_fields(request, api.PRODUCT_FIELDS)
+        limit = api.page_size(request)
+    except api.ApiError as exc:
+        return exc.response()
+    version = catalog_version()
+
+    def build():
+        products = _catalog(Product.objects.all(), request.GET.get('category'), request.GET.get('q'),
+                            request.GET.get('sort'), request.GET.get('price'))
+        keys = [field.lstrip('-') for field in products.query.order_by if field.lstrip('-') != 'search_rank']
+        products = products.only(*api.columns(fields, api.PRODUCT_FIELDS), *keys)
+        page = KeysetPaginator(products, limit).get_page(request.GET.get('cursor'))
+        return {
+            'results': [api.serialize(product, fields, api.PRODUCT_FIELDS) for product in page],
+            **api.page_links(request, page),
+        }
+
+    path = request.get_full_path()
+    return api.conditional_response(
+        request, api.make_etag('products', version, path),
+        lambda: get_or_compute(make_key('api-products', version, path), build),
+    )
+
+
+@require_safe
+def api_product_detail(request, product_id):
+    try:
+        fields = api.requested_fields(request, api.PRODUCT_FIELDS)
+    except api.ApiError as exc:
+        return exc.response()
+    product = Product.objects.only(*api.columns(fields, api.PRODUCT_FIELDS), 'updated_at').filter(pk=product_id).first()
+    if product is None:
+        return api.ApiError("Product not found.", status=404).response()
+    return api.conditional_response(
+        request, api.make_etag('product', product.pk, product.updated_at.isoformat(), *fields),
+        lambda: api.serialize(product, fields, api.PRODUCT_FIELDS),
+        last_modified=product.updated_at,
+    )
+
+
+@require_safe
+def api_product_reviews(request, product_id):
+    try:
+        fields = api.requested_fields(request, api.REVIEW_FIELDS)
+        limit = api.page_size(request)
+    except api.ApiError as exc:
+        return exc.response()
+    # Every review change stamps the product (see store.ratings), so its
+    # updated_at validates the reviews before they are read.
+    updated_at = Product.objects.filter(pk=product_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return api.ApiError("Product not found.", status=404).response()
+
+    def build():
+        reviews = (Review.objects.filter(product_id=product_id).select_related('user')
+                   .only(*api.columns(fields, api.REVIEW_FIELDS), 'created_at')
+                   .order_by('-created_at', '-id'))
+        page = KeysetPaginator(reviews, limit).get_page(request.GET.get('cursor'))
+        return {
+            'results': [api.serialize(review, fields, api.REVIEW_FIELDS) for review in page],
+            **api.page_links(request, page),
+        }
+
+    return api.conditional_response(
+        request, api.make_etag('reviews', product_id, updated_at.isoformat(), request.get_full_path()),
+        build, last_modified=updated_at,
+    )
+
+
+@require_safe
+def product_suggestions(request):
+    """Typeahead for the search box: the most popular products matching what's typed so far."""
+    query = request.GET.get('q', '')
+    try:
+        limit = min(max(int(request.GET.get('limit', typeahead.DEFAULT_RESULTS)), 1), typeahead.MAX_RESULTS)
+    except ValueError:
+        limit = typeahead.DEFAULT_RESULTS
+    started = perf_counter()
+    matches = typeahead.suggest(query, limit)
+    elapsed = perf_counter() - started
+    response = JsonResponse({
+        'query': query,
+        'results': [
+            {'id': pk, 'name': name, 'url': reverse('product_detail', args=[pk])} for pk, name in matches
+        ],
+    })
+    response['Server-Timing'] = f'typeahead;dur={elapsed * 1000:.3f}'
+    return response
+
 
+def metrics_endpoint(request):
+    if not metrics.enabled():
+        raise Http404
+    token = settings.METRICS_TOKEN
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,40 @@
+"""
+Per-user wishlist membership.
+
+Product cards need to know which products are on the visitor's wishlist.
+``product_ids`` loads the whole set once per request, from the cache or
+with one query on a miss, and returns a ``frozenset``, so each card's
+``product.id in wishlist_ids`` test is O(1) instead of a ``Wishlist``
+lookup. The cached set is keyed by a per-user version that ``Wishlist``
+saves and deletes bump (see ``store.signals``).
+"""
+from django.db import transaction
+
+from .caching import get_or_compute, make_key, wishlist_version
+from .models import Wishlist
+
+
+def _load(user_id):
+    key = make_key('wishlist', user_id, wishlist_version(user_id))
+    return get_or_compute(
+        key, lambda: frozenset(Wishlist.objects.filter(user_id=user_id).values_list('product_id', flat=True)),
+    )
+
+
+def product_ids(request):
+    """The visitor's wishlisted product ids; empty for anonymous visitors."""
+    if not hasattr(request, '_wishlist_ids'):
+        user = request.user
+        request._wishlist_ids = _load(user.pk) if user.is_authenticated else frozenset()
+    return request._wishlist_ids
+
+
+def toggle(user, product_id):
+    """Add the product to ``user``'s wishlist or take it off. Returns whether it's on it now."""
+    with transaction.atomic():
+        removed, _ = Wishlist.objects.filter(user=user, product_id=product_id).delete()
+        if removed:
+            return False
+        # get_or_create: a concurrent toggle may have added it already.
+        Wishlist.objects.get_or_create(user=user, product_id=product_id)
+    return True
@@ -16,6 +16,8 @@ User=ubuntu
 Group=www-data
 WorkingDirectory=/var/www/ecommerce
 Environment="PATH=/var/www/ecommerce/venv/bin"
+# Requests pass the load balancer's nginx and then this host's.
+Environment="RATE_LIMIT_PROXY_COUNT=2"
 ExecStart=/var/www/ecommerce/venv/bin/gunicorn \
     --workers 3 \
     --bind 127.0.0.1:8000 \
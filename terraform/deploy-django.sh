@@ -45,6 +45,7 @@ Django==5.2.5
 django-allauth==65.11.0
 django-crispy-forms==2.4
 django-environ==0.12.0
+httpx==0.28.1
 idna==3.10
 pillow==11.3.0
 python-dotenv==1.1.1
@@ -54,6 +55,8 @@ stripe==12.4.0
 typing_extensions==4.14.1
 tzdata==2025.2
 urllib3==2.5.0
+uvicorn==0.54.0
+uvicorn-worker==0.4.0
 EOF
 
 pip install -r requirements.txt
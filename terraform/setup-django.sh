@@ -9,6 +9,7 @@ echo "STATIC_ROOT = '/var/www/ecommerce/staticfiles/'" >> ecommerce/settings.py
 
 # Run migrations
 python manage.py migrate
+python manage.py createcachetable
 
 # Collect static files
 python manage.py collectstatic --noinput